@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк поиска запрещённых слов: перебор словаря против автомата Ахо–Корасик.
+
+Запуск: python benchmarks/bench_filters.py
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+# Настройка кодировки для Windows
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bot.matching import AhoCorasick
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+LEXICON_SIZES = (100, 1_000, 10_000)
+MESSAGES_COUNT = 2_000
+
+
+def random_word(rng: random.Random, min_len: int = 4, max_len: int = 10) -> str:
+    """Генерирует случайное слово из кириллицы."""
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_messages(rng: random.Random, lexicon: list, count: int) -> list:
+    """Генерирует сообщения, примерно 5% из которых содержат слово из словаря."""
+    messages = []
+    for _ in range(count):
+        words = [random_word(rng, 2, 8) for _ in range(rng.randint(3, 20))]
+        if rng.random() < 0.05:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(lexicon))
+        messages.append(" ".join(words))
+    return messages
+
+
+def loop_contains(bad_words: set, text: str) -> bool:
+    """Прежняя реализация: перебор всех слов словаря."""
+    for word in bad_words:
+        if word in text:
+            return True
+    return False
+
+
+def measure(check, messages: list) -> float:
+    """Возвращает пропускную способность проверки в сообщениях в секунду."""
+    start = time.perf_counter()
+    for text in messages:
+        check(text)
+    elapsed = time.perf_counter() - start
+    return len(messages) / elapsed if elapsed else float("inf")
+
+
+def main():
+    """Запускает бенчмарк для всех размеров словаря."""
+    rng = random.Random(42)
+    
+    print("=" * 60)
+    print("БЕНЧМАРК: поиск слов словаря (сообщений в секунду)")
+    print("=" * 60)
+    print(f"{'Словарь':>10} | {'Перебор':>12} | {'Автомат':>12} | {'Ускорение':>9}")
+    print("-" * 60)
+    
+    for size in LEXICON_SIZES:
+        lexicon = set()
+        while len(lexicon) < size:
+            lexicon.add(random_word(rng))
+        messages = make_messages(rng, sorted(lexicon), MESSAGES_COUNT)
+        
+        automaton = AhoCorasick(lexicon)
+        
+        # Оба способа обязаны давать одинаковый результат
+        for text in messages:
+            assert automaton.search(text) == loop_contains(lexicon, text)
+            assert automaton.find_all(text) == {w for w in lexicon if w in text}
+        
+        loop_rate = measure(lambda text: loop_contains(lexicon, text), messages)
+        automaton_rate = measure(automaton.search, messages)
+        
+        print(
+            f"{size:>10} | {loop_rate:>12,.0f} | {automaton_rate:>12,.0f} | "
+            f"{automaton_rate / loop_rate:>8.1f}x"
+        )
+    
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
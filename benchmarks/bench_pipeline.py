@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк конвейера модерации: фильтр, handle_message и пакетная запись действий.
+
+Сообщения генерируются benchmarks/messages.py с фиксированным seed, поэтому
+запуски на разных версиях сравнимы. Результаты записываются в JSON.
+
+Запуск:
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --output new.json --compare results.json
+
+По умолчанию вместо MySQL используется БД в памяти, а Telegram API
+заменён фиктивной сессией (--api-latency-ms задаёт задержку ответа).
+С --storage sqlite действия пишутся во временный файл SQLite, с --storage mysql -
+в БД из .env: используйте тестовую базу.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, get_origin
+
+# Настройка кодировки для Windows
+if sys.platform == 'win32':
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.messages import CATEGORY_WEIGHTS, generate
+
+SEED = 42
+CHATS_COUNT = 50
+USERS_COUNT = 5_000
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Процентиль по отсортированным значениям (ближайший ранг)."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(durations: List[float], scale: float) -> Dict[str, float]:
+    """
+    Сводка по длительностям в секундах.
+    
+    Args:
+        durations: Длительности операций
+        scale: Множитель единиц (1e6 - микросекунды, 1e3 - миллисекунды)
+    """
+    values = sorted(durations)
+    total = sum(values)
+    return {
+        "count": len(values),
+        "throughput": round(len(values) / total, 1) if total else 0.0,
+        "p50": round(percentile(values, 0.50) * scale, 2),
+        "p99": round(percentile(values, 0.99) * scale, 2),
+        "max": round(values[-1] * scale, 2) if values else 0.0,
+    }
+
+
+def git_version() -> str:
+    """Версия кода для отчёта: git describe или 'unknown'."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+class MemoryDatabase:
+    """БД в памяти с методами Database, которые вызывает конвейер модерации."""
+    
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: Задержка каждой операции в секундах (имитация сети)
+        """
+        self.latency = latency
+        self.actions = []
+        self.inserts = 0
+    
+    async def _wait(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+    
+    async def save_action(self, action) -> bool:
+        return await self.insert_actions([action])
+    
+    async def insert_actions(self, actions) -> bool:
+        await self._wait()
+        self.actions.extend(actions)
+        self.inserts += 1
+        return True
+    
+    async def get_chat_policy(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        await self._wait()
+        return None
+    
+    async def get_user_strikes(self, chat_id: int, user_id: int):
+        await self._wait()
+        return None
+    
+    async def save_user_strikes(self, rows) -> bool:
+        await self._wait()
+        return True
+
+
+def create_fake_bot(latency: float):
+    """
+    Создаёт Bot с сессией, отвечающей на запросы без обращения к Telegram.
+    
+    Args:
+        latency: Задержка ответа в секундах
+    
+    Returns:
+        (бот, счётчик вызванных методов API)
+    """
+    from aiogram import Bot
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message
+    
+    calls = Counter()
+    
+    class FakeSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            calls[method.__api_method__] += 1
+            if latency:
+                await asyncio.sleep(latency)
+            returning = method.__returning__
+            if returning is bool:
+                return True
+            if returning is Message:
+                chat_id = getattr(method, "chat_id", 0)
+                return Message(message_id=1, date=datetime.now(), chat=Chat(id=chat_id, type="supergroup"))
+            if get_origin(returning) is list:
+                return []
+            return None
+        
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+        
+        async def close(self):
+            pass
+    
+    return Bot(token="123456:benchmark", session=FakeSession()), calls
+
+
+def bench_filter(messages) -> Dict[str, Any]:
+    """Пропускная способность и задержка MessageFilter.contains_bad_words."""
+    from bot.filters import MessageFilter
+    
+    # Без кэша результатов: замеряется сама проверка
+    matcher = MessageFilter(cache_size=0)
+    matcher.contains_bad_words("прогрев")
+    
+    durations = []
+    by_category: Dict[str, List[float]] = {category: [] for category in CATEGORY_WEIGHTS}
+    blocked = Counter()
+    perf_counter = time.perf_counter
+    for category, text in messages:
+        started = perf_counter()
+        result = matcher.contains_bad_words(text)
+        elapsed = perf_counter() - started
+        durations.append(elapsed)
+        by_category[category].append(elapsed)
+        blocked[category] += result
+    
+    report = summarize(durations, 1e6)
+    report["unit"] = "us"
+    report["categories"] = {
+        category: {**summarize(values, 1e6), "blocked": blocked[category]}
+        for category, values in by_category.items()
+    }
+    return report
+
+
+async def bench_handle_message(messages, database, api_latency: float) -> Dict[str, Any]:
+    """Задержка handle_message от сообщения до решения с фиктивным Bot."""
+    import bot.handlers as handlers
+    from aiogram.types import Message
+    from bot.lexicons import lexicon_store
+    from bot.outbound import moderation_queue
+    
+    await lexicon_store.reload()
+    bot, calls = create_fake_bot(api_latency)
+    
+    # Пользователи и чаты распределяются детерминированно по номеру сообщения
+    prepared = []
+    for index, (_, text) in enumerate(messages):
+        chat_id = -1001000000000 - index % CHATS_COUNT
+        user_id = 1 + (index * 7919) % USERS_COUNT
+        prepared.append(Message.model_validate({
+            "message_id": index + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup", "title": "benchmark"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user", "username": f"user{user_id}"},
+            "text": text,
+        }).as_(bot))
+    
+    durations = []
+    perf_counter = time.perf_counter
+    for message in prepared:
+        started = perf_counter()
+        await handlers.handle_message(message)
+        durations.append(perf_counter() - started)
+    
+    # Отложенные удаления и предупреждения выполняются вне замера
+    await moderation_queue.flush()
+    await bot.session.close()
+    
+    report = summarize(durations, 1e3)
+    report["unit"] = "ms"
+    report["api_calls"] = dict(sorted(calls.items()))
+    return report
+
+
+async def bench_batch_insert(database, rows: int, batch_size: int) -> Dict[str, Any]:
+    """Пропускная способность записи действий через ActionWriter."""
+    from bot.storage import ActionWriter
+    from bot.models import ActionType, BotAction
+    
+    writer = ActionWriter(database, batch_size=batch_size, flush_interval=0.05, max_queue=batch_size * 10)
+    writer.start()
+    started = time.perf_counter()
+    for index in range(rows):
+        await writer.put(BotAction(
+            action_type=ActionType.MESSAGE_DELETED,
+            user_id=1 + index % USERS_COUNT,
+            chat_id=-1001000000000 - index % CHATS_COUNT,
+            username="benchmark",
+            message_text="benchmark",
+            reason="benchmark",
+        ))
+    await writer.stop()
+    elapsed = time.perf_counter() - started
+    
+    return {
+        "rows": rows,
+        "batch_size": batch_size,
+        "written": writer.stats.written,
+        "failed": writer.stats.failed,
+        "batches": writer.stats.batches,
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+        "producer_waits": writer.stats.producer_waits,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]):
+    """Печатает изменение ключевых показателей относительно прошлого запуска."""
+    rows = [
+        ("filter", "throughput", True),
+        ("filter", "p99", False),
+        ("handle_message", "throughput", True),
+        ("handle_message", "p99", False),
+        ("batch_insert", "rows_per_second", True),
+    ]
+    print(f"\nСравнение с {previous.get('meta', {}).get('version', '?')}:")
+    for section, key, higher_is_better in rows:
+        old = previous.get(section, {}).get(key)
+        new = current.get(section, {}).get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        worse = change < 0 if higher_is_better else change > 0
+        mark = " РЕГРЕССИЯ" if worse and abs(change) >= 10 else ""
+        print(f"  {section}.{key}: {old} -> {new} ({change:+.1f}%){mark}")
+
+
+async def run(args) -> Dict[str, Any]:
+    """Выполняет все бенчмарки и возвращает отчёт."""
+    messages = generate(args.messages, seed=args.seed)
+    
+    workdir = tempfile.TemporaryDirectory()
+    if args.storage == "memory":
+        database = MemoryDatabase(latency=args.db_latency_ms / 1000)
+    else:
+        if args.storage == "mysql":
+            from bot.database import db as database
+        else:
+            from bot.sqlite_storage import SQLiteDatabase
+            database = SQLiteDatabase(str(Path(workdir.name) / "bench.db"))
+        await database.connect()
+        # Собственная отложенная запись БД не нужна: бенчмарк пишет напрямую
+        await database.flush()
+    
+    # Модули конвейера обращаются к БД через глобальный db
+    import bot.handlers
+    import bot.outbound
+    import bot.policies
+    import bot.strikes
+    for module in (bot.handlers, bot.outbound, bot.policies, bot.strikes):
+        module.db = database
+    
+    report = {
+        "meta": {
+            "version": git_version(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "messages": args.messages,
+            "storage": args.storage,
+            "api_latency_ms": args.api_latency_ms,
+            "db_latency_ms": args.db_latency_ms if args.storage == "memory" else 0,
+        },
+    }
+    
+    print("Фильтр...")
+    report["filter"] = bench_filter(messages)
+    print("handle_message...")
+    report["handle_message"] = await bench_handle_message(messages, database, args.api_latency_ms / 1000)
+    print("Пакетная запись...")
+    report["batch_insert"] = await bench_batch_insert(database, args.rows, args.batch_size)
+    
+    if args.storage != "memory":
+        await database.disconnect()
+    workdir.cleanup()
+    return report
+
+
+def main():
+    """Разбирает аргументы, запускает бенчмарки и сохраняет JSON."""
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера модерации")
+    parser.add_argument("--messages", type=int, default=20_000, help="Количество сообщений")
+    parser.add_argument("--seed", type=int, default=SEED, help="Начальное значение генератора")
+    parser.add_argument("--rows", type=int, default=50_000, help="Строк для пакетной записи")
+    parser.add_argument("--batch-size", type=int, default=100, help="Строк в одном INSERT")
+    parser.add_argument("--api-latency-ms", type=float, default=0, help="Задержка фиктивного Telegram API")
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="Задержка операций БД в памяти")
+    parser.add_argument(
+        "--storage",
+        choices=("memory", "sqlite", "mysql"),
+        default="memory",
+        help="Хранилище: БД в памяти, временный файл SQLite или MySQL из .env",
+    )
+    parser.add_argument("--output", help="Файл для результатов в JSON")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args()
+    
+    if args.storage != "mysql":
+        # Конфигурация обязательна при импорте модулей бота; для запуска без .env
+        for key in ("BOT_TOKEN", "DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+            os.environ.setdefault(key, "benchmark")
+    # Журнал действий модерации не должен влиять на замер и засорять вывод
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ.setdefault("LOG_FILE", "")
+    
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"\nРезультаты сохранены в {args.output}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
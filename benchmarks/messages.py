@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Генератор синтетических сообщений на русском языке для бенчмарков.
+
+Смешивает обычные сообщения, сообщения с оскорблениями (открытыми и
+замаскированными заменой букв, латиницей, разделителями и повторами)
+и длинные сообщения. При одинаковом seed выдаёт одинаковую выборку.
+"""
+
+import random
+from typing import Dict, List, Tuple
+
+# Категории сообщений и их доля в выборке
+CATEGORY_WEIGHTS: Dict[str, float] = {
+    "clean": 0.70,       # Обычное короткое сообщение
+    "profanity": 0.08,   # Оскорбление без маскировки
+    "obfuscated": 0.12,  # Замаскированное оскорбление
+    "long": 0.10,        # Длинное сообщение (каждое третье - с оскорблением в конце)
+}
+
+WORDS = (
+    "привет", "всем", "сегодня", "завтра", "вечером", "встреча", "в", "на", "по", "и", "а", "но",
+    "кто", "что", "где", "когда", "почему", "как", "есть", "будет", "было", "можно", "нужно",
+    "спасибо", "пожалуйста", "хорошо", "отлично", "понятно", "согласен", "вопрос", "ответ",
+    "проект", "задача", "код", "бот", "чат", "группа", "сообщение", "ссылка", "файл", "фото",
+    "погода", "дождь", "солнце", "город", "улица", "дом", "работа", "отпуск", "поезд", "билет",
+    "новости", "цена", "скидка", "магазин", "заказ", "доставка", "курс", "урок", "книга",
+    "кофе", "чай", "обед", "ужин", "пятница", "суббота", "неделя", "месяц", "год", "время",
+    "интересно", "быстро", "медленно", "снова", "уже", "ещё", "очень", "немного", "всё",
+)
+
+INSULTS = ("дурак", "идиот", "дебил", "урод", "кретин", "тупой", "придурок", "подонок")
+
+# Замены для обхода фильтра
+LEET = {"о": "0", "а": "@", "е": "3", "з": "3", "и": "u", "ч": "4", "б": "6"}
+LATIN = {"а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "к": "k"}
+SEPARATORS = (".", "-", "_", " ", "*")
+
+
+def _sentence(rng: random.Random, min_words: int, max_words: int) -> str:
+    """Случайное предложение из словаря обычных слов."""
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    if not words:
+        return ""
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice((".", "!", "?", ""))
+
+
+def obfuscate(rng: random.Random, word: str) -> str:
+    """
+    Маскирует слово одним из способов обхода фильтра.
+    
+    Args:
+        rng: Генератор случайных чисел
+        word: Исходное слово
+    
+    Returns:
+        Слово с заменой букв на цифры или латиницу, разделителями или повторами
+    """
+    method = rng.randrange(4)
+    if method == 0:
+        return "".join(LEET.get(ch, ch) for ch in word)
+    if method == 1:
+        return "".join(LATIN.get(ch, ch) for ch in word)
+    if method == 2:
+        return rng.choice(SEPARATORS).join(word)
+    position = rng.randrange(len(word))
+    return word[:position] + word[position] * rng.randint(2, 4) + word[position + 1:]
+
+
+def make_message(rng: random.Random, category: str) -> str:
+    """
+    Генерирует сообщение указанной категории.
+    
+    Args:
+        rng: Генератор случайных чисел
+        category: Ключ из CATEGORY_WEIGHTS
+    
+    Returns:
+        Текст сообщения
+    """
+    if category == "clean":
+        return _sentence(rng, 3, 20)
+    if category == "profanity":
+        return f"{_sentence(rng, 2, 10)} {rng.choice(INSULTS)} {_sentence(rng, 0, 5)}".strip()
+    if category == "obfuscated":
+        return f"{_sentence(rng, 2, 10)} {obfuscate(rng, rng.choice(INSULTS))} {_sentence(rng, 0, 5)}".strip()
+    
+    text = " ".join(_sentence(rng, 10, 25) for _ in range(rng.randint(4, 15)))
+    if rng.random() < 1 / 3:
+        text += " " + rng.choice(INSULTS)
+    return text
+
+
+def generate(count: int, seed: int = 42) -> List[Tuple[str, str]]:
+    """
+    Генерирует выборку сообщений.
+    
+    Args:
+        count: Количество сообщений
+        seed: Начальное значение генератора
+    
+    Returns:
+        Пары (категория, текст)
+    """
+    rng = random.Random(seed)
+    categories = list(CATEGORY_WEIGHTS)
+    weights = list(CATEGORY_WEIGHTS.values())
+    return [
+        (category, make_message(rng, category))
+        for category in rng.choices(categories, weights=weights, k=count)
+    ]
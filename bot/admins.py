@@ -0,0 +1,146 @@
+"""
+МОДУЛЬ: Кэш администраторов чатов
+Хранит списки администраторов, чтобы команды модерации не запрашивали
+статус пользователя через Bot API при каждом вызове.
+Используется в bot/handlers.py.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.types import ChatMember
+
+from bot.config import config
+from bot.logger import logger
+
+
+# Статусы участников с правами администратора
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+class AdminCache:
+    """
+    Кэш администраторов по чатам с временем жизни и вытеснением LRU.
+    
+    Список администраторов чата загружается целиком одним вызовом
+    get_chat_administrators; одновременные запросы одного чата ждут одну загрузку.
+    Запись сбрасывается при изменении статуса участника (обновления chat_member).
+    """
+    
+    def __init__(self, ttl: float, max_size: int):
+        """
+        Args:
+            ttl: Время жизни записи в секундах
+            max_size: Максимальное количество чатов в кэше
+        """
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        # chat_id -> (время устаревания, администраторы по user_id)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Загрузки в процессе и признак сброса записи во время загрузки
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._invalidated: Dict[int, bool] = {}
+    
+    def _get_cached(self, chat_id: int) -> Optional[Dict[int, ChatMember]]:
+        """Возвращает администраторов из кэша или None, если записи нет или она устарела."""
+        entry = self._entries.get(chat_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(chat_id, None)
+            return None
+        
+        self._entries.move_to_end(chat_id)
+        return entry[1]
+    
+    async def get_admins(self, bot: Bot, chat_id: int) -> Dict[int, ChatMember]:
+        """
+        Возвращает администраторов чата, загружая их при отсутствии в кэше.
+        
+        Args:
+            bot: Экземпляр бота
+            chat_id: ID чата
+        
+        Returns:
+            Словарь user_id -> участник чата
+        """
+        admins = self._get_cached(chat_id)
+        if admins is not None:
+            self.hits += 1
+            return admins
+        
+        self.misses += 1
+        loading = self._loading.get(chat_id)
+        if loading is not None:
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                # Отменён сам вызов, а не загрузка - отмену передаём дальше
+                if not loading.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # Загрузка отменена вместе с запустившей её задачей: загружаем заново
+            return await self.get_admins(bot, chat_id)
+        
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[chat_id] = loading
+        self._invalidated[chat_id] = False
+        try:
+            members = await bot.get_chat_administrators(chat_id)
+        except Exception as e:
+            loading.set_exception(e)
+            # Исключение получат ожидающие; если их нет, не логируем его повторно
+            loading.exception()
+            raise
+        except BaseException:
+            # Загрузка отменена (остановка бота, отмена обработчика): ожидающие не должны зависнуть
+            loading.cancel()
+            raise
+        finally:
+            self._loading.pop(chat_id, None)
+            invalidated = self._invalidated.pop(chat_id, False)
+        
+        admins = {member.user.id: member for member in members}
+        loading.set_result(admins)
+        
+        # Статус изменился во время загрузки: результат мог устареть
+        if not invalidated:
+            self._entries[chat_id] = (time.monotonic() + self.ttl, admins)
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        
+        logger.debug("Загружены администраторы чата %s: %s", chat_id, len(admins))
+        return admins
+    
+    async def is_admin(self, bot: Bot, chat_id: int, user_id: int) -> bool:
+        """
+        Проверяет, является ли пользователь администратором чата.
+        
+        Args:
+            bot: Экземпляр бота
+            chat_id: ID чата
+            user_id: ID пользователя
+        
+        Returns:
+            True если пользователь - администратор или создатель чата
+        """
+        admins = await self.get_admins(bot, chat_id)
+        return user_id in admins
+    
+    def invalidate(self, chat_id: int):
+        """
+        Сбрасывает запись чата.
+        
+        Args:
+            chat_id: ID чата
+        """
+        self._entries.pop(chat_id, None)
+        if chat_id in self._invalidated:
+            self._invalidated[chat_id] = True
+
+
+# Глобальный экземпляр кэша администраторов
+admin_cache = AdminCache(config.ADMIN_CACHE_TTL, config.ADMIN_CACHE_SIZE)
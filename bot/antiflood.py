@@ -0,0 +1,225 @@
+"""
+МОДУЛЬ: Защита от флуда
+Определяет пользователей, отправивших слишком много сообщений за короткое время.
+Используется в bot/handlers.py.
+"""
+
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from bot.config import config
+
+
+class FloodDetector:
+    """
+    Детектор флуда со скользящим окном: не более limit сообщений за window секунд.
+    
+    Для каждой пары (chat_id, user_id) хранятся времена последних limit сообщений
+    в кольцевом буфере. Буферы всех пользователей лежат в одном массиве array('d'),
+    поэтому на пользователя приходится limit * 8 байт плюс запись словаря.
+    Проверка выполняется за O(1): самое старое время в буфере сравнивается с текущим.
+    
+    Детектор также помнит, до какого времени пользователь ограничен в чате:
+    сообщения, дошедшие до бота после ограничения, не считаются флудом повторно.
+    """
+    
+    __slots__ = (
+        "enabled", "limit", "window", "idle_timeout",
+        "_slots", "_free", "_times", "_heads", "_last_seen", "_next_sweep", "_muted",
+    )
+    
+    def __init__(self, limit: int, window: float, idle_timeout: float):
+        """
+        Args:
+            limit: Максимум сообщений в окне (0 - проверка отключена)
+            window: Длина окна в секундах
+            idle_timeout: Через сколько секунд без сообщений пользователь забывается
+        """
+        self.enabled = limit > 0
+        self.limit = max(1, limit)
+        self.window = window
+        self.idle_timeout = max(idle_timeout, window)
+        # (chat_id, user_id) -> номер ячейки в массивах
+        self._slots: Dict[Tuple[int, int], int] = {}
+        # Освобождённые ячейки для повторного использования
+        self._free: List[int] = []
+        # Кольцевые буферы: ячейка i занимает _times[i * limit:(i + 1) * limit]
+        self._times = array("d")
+        # Позиция самого старого времени в буфере ячейки
+        self._heads = array("I")
+        # Время последнего сообщения в ячейке
+        self._last_seen = array("d")
+        # (chat_id, user_id) -> до какого времени пользователь ограничен
+        self._muted: Dict[Tuple[int, int], float] = {}
+        self._next_sweep = time.monotonic() + self.idle_timeout
+    
+    def __len__(self) -> int:
+        """Количество отслеживаемых пользователей."""
+        return len(self._slots)
+    
+    def _allocate(self, key: Tuple[int, int]) -> int:
+        """Выделяет ячейку под нового пользователя."""
+        if self._free:
+            slot = self._free.pop()
+            self._reset(slot)
+        else:
+            slot = len(self._heads)
+            self._times.extend([float("-inf")] * self.limit)
+            self._heads.append(0)
+            self._last_seen.append(0.0)
+        self._slots[key] = slot
+        return slot
+    
+    def _reset(self, slot: int):
+        """Очищает буфер ячейки."""
+        start = slot * self.limit
+        for index in range(start, start + self.limit):
+            self._times[index] = float("-inf")
+        self._heads[slot] = 0
+    
+    def hit(self, chat_id: int, user_id: int, now: Optional[float] = None) -> bool:
+        """
+        Учитывает сообщение пользователя и проверяет превышение лимита.
+        
+        После срабатывания буфер пользователя очищается, поэтому пачка
+        сообщений, отправленных до наказания, даёт одно срабатывание.
+        Сообщения ограниченного пользователя (см. mute) не учитываются.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            now: Время сообщения (по умолчанию time.monotonic())
+        
+        Returns:
+            True если это сообщение - больше limit-го за последние window секунд
+        """
+        if not self.enabled:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_sweep:
+            self.evict_idle(now)
+        
+        key = (chat_id, user_id)
+        if self._muted and self.is_muted(chat_id, user_id, now):
+            return False
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key)
+        
+        # В начале буфера - время сообщения, отправленного limit сообщений назад:
+        # если оно попадает в окно, текущее сообщение - (limit + 1)-е в окне
+        head = self._heads[slot]
+        base = slot * self.limit
+        self._last_seen[slot] = now
+        if now - self._times[base + head] < self.window:
+            self._reset(slot)
+            return True
+        
+        # Записываем время на место самого старого и сдвигаем начало буфера
+        self._times[base + head] = now
+        self._heads[slot] = (head + 1) % self.limit
+        return False
+    
+    def mute(self, chat_id: int, user_id: int, seconds: float, now: Optional[float] = None):
+        """
+        Запоминает, что пользователь ограничен в чате.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            seconds: Длительность ограничения
+            now: Текущее время (по умолчанию time.monotonic())
+        """
+        if now is None:
+            now = time.monotonic()
+        self._muted[(chat_id, user_id)] = now + seconds
+    
+    def unmute(self, chat_id: int, user_id: int):
+        """
+        Забывает ограничение пользователя (например, если ограничить не удалось).
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+        """
+        self._muted.pop((chat_id, user_id), None)
+    
+    def is_muted(self, chat_id: int, user_id: int, now: Optional[float] = None) -> bool:
+        """
+        Проверяет, ограничен ли пользователь в чате.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            now: Текущее время (по умолчанию time.monotonic())
+        
+        Returns:
+            True если ограничение ещё действует
+        """
+        until = self._muted.get((chat_id, user_id))
+        if until is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if now < until:
+            return True
+        del self._muted[(chat_id, user_id)]
+        return False
+    
+    def forget(self, chat_id: int, user_id: int):
+        """
+        Удаляет историю пользователя в чате.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+        """
+        slot = self._slots.pop((chat_id, user_id), None)
+        if slot is not None:
+            self._free.append(slot)
+    
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Забывает пользователей без сообщений дольше idle_timeout и истёкшие ограничения.
+        
+        Вызывается автоматически не чаще раза в idle_timeout секунд.
+        
+        Args:
+            now: Текущее время (по умолчанию time.monotonic())
+        
+        Returns:
+            Количество забытых пользователей
+        """
+        if now is None:
+            now = time.monotonic()
+        self._next_sweep = now + self.idle_timeout
+        
+        threshold = now - self.idle_timeout
+        last_seen = self._last_seen
+        idle = [key for key, slot in self._slots.items() if last_seen[slot] < threshold]
+        for key in idle:
+            self._free.append(self._slots.pop(key))
+        
+        # Истёкшие ограничения
+        expired = [key for key, until in self._muted.items() if until <= now]
+        for key in expired:
+            del self._muted[key]
+        
+        # Все ячейки свободны: возвращаем память массивов
+        if not self._slots and self._free:
+            self._free.clear()
+            self._times = array("d")
+            self._heads = array("I")
+            self._last_seen = array("d")
+        
+        return len(idle)
+
+
+# Глобальный экземпляр детектора флуда
+flood_detector = FloodDetector(
+    limit=config.FLOOD_MAX_MESSAGES,
+    window=config.FLOOD_WINDOW_SECONDS,
+    idle_timeout=config.FLOOD_IDLE_SECONDS,
+)
@@ -19,22 +19,163 @@ class Config:
         # Telegram Bot
         self.BOT_TOKEN: str = self._get_env("BOT_TOKEN", required=True)
         
-        # Database (MySQL)
-        self.DB_HOST: str = self._get_env("DB_HOST", required=True)
+        # Хранилище: mysql или sqlite (файл SQLITE_PATH, без сервера БД)
+        self.DB_BACKEND: str = self._get_env("DB_BACKEND", default="mysql").lower()
+        self.SQLITE_PATH: str = self._get_env("SQLITE_PATH", default="data/bot.db")
+        
+        # Database (MySQL); обязательны только для DB_BACKEND=mysql
+        mysql_required = self.DB_BACKEND == "mysql"
+        self.DB_HOST: str = self._get_env("DB_HOST", required=mysql_required)
         self.DB_PORT: int = int(self._get_env("DB_PORT", default="3306"))
-        self.DB_USER: str = self._get_env("DB_USER", required=True)
-        self.DB_PASSWORD: str = self._get_env("DB_PASSWORD", required=True)
-        self.DB_NAME: str = self._get_env("DB_NAME", required=True)
+        self.DB_USER: str = self._get_env("DB_USER", required=mysql_required)
+        self.DB_PASSWORD: str = self._get_env("DB_PASSWORD", required=mysql_required)
+        self.DB_NAME: str = self._get_env("DB_NAME", required=mysql_required)
+        
+        # Буферизованная запись действий: размер пачки, интервал сброса и размер очереди
+        self.DB_WRITE_BATCH_SIZE: int = int(self._get_env("DB_WRITE_BATCH_SIZE", default="100"))
+        self.DB_WRITE_FLUSH_MS: int = int(self._get_env("DB_WRITE_FLUSH_MS", default="200"))
+        self.DB_WRITE_QUEUE_SIZE: int = int(self._get_env("DB_WRITE_QUEUE_SIZE", default="10000"))
+        
+        # Локальный журнал действий на время сбоев БД: каталог (пусто - отключён),
+        # допустимая длительность записи пачки, время, после которого следующие пачки
+        # идут в журнал (начатая запись не прерывается), пауза перед повторной попыткой записи в БД и размер пачки переноса журнала
+        self.SPOOL_DIR: str = self._get_env("SPOOL_DIR", default="data/spool")
+        self.SPOOL_LATENCY_BUDGET_MS: int = int(self._get_env("SPOOL_LATENCY_BUDGET_MS", default="1000"))
+        self.SPOOL_WRITE_TIMEOUT_MS: int = int(self._get_env("SPOOL_WRITE_TIMEOUT_MS", default="5000"))
+        self.SPOOL_RETRY_SECONDS: float = float(self._get_env("SPOOL_RETRY_SECONDS", default="5"))
+        self.SPOOL_REPLAY_BATCH: int = int(self._get_env("SPOOL_REPLAY_BATCH", default="1000"))
+        
+        # Кэш счётчиков для /stats: время жизни записи в секундах и число чатов
+        self.STATS_CACHE_TTL: int = int(self._get_env("STATS_CACHE_TTL", default="60"))
+        self.STATS_CACHE_SIZE: int = int(self._get_env("STATS_CACHE_SIZE", default="1000"))
+        
+        # Кэш администраторов чатов для /ban и /unban: время жизни в секундах и число чатов
+        self.ADMIN_CACHE_TTL: int = int(self._get_env("ADMIN_CACHE_TTL", default="600"))
+        self.ADMIN_CACHE_SIZE: int = int(self._get_env("ADMIN_CACHE_SIZE", default="1000"))
+        
+        # Словари фильтра: каталог файлов наборов, каталог кэша скомпилированных фильтров
+        # (пусто - без кэша), набор по умолчанию и период проверки изменений (0 - не проверять)
+        self.LEXICON_DIR: str = self._get_env("LEXICON_DIR", default="lexicons")
+        self.LEXICON_CACHE_DIR: str = self._get_env("LEXICON_CACHE_DIR", default="lexicons/.cache")
+        self.LEXICON_DEFAULT: str = self._get_env("LEXICON_DEFAULT", default="ru")
+        self.LEXICON_RELOAD_SECONDS: float = float(self._get_env("LEXICON_RELOAD_SECONDS", default="5"))
+        
+        # Политики чатов (таблица chat_policies): действие по умолчанию (delete, warn, mute, ban, escalate),
+        # длительность мута, время жизни и число политик в кэше, число скомпилированных
+        # сочетаний наборов словарей в памяти
+        self.POLICY_DEFAULT_ACTION: str = self._get_env("POLICY_DEFAULT_ACTION", default="delete")
+        self.POLICY_MUTE_SECONDS: int = int(self._get_env("POLICY_MUTE_SECONDS", default="3600"))
+        self.POLICY_CACHE_TTL: int = int(self._get_env("POLICY_CACHE_TTL", default="300"))
+        self.POLICY_CACHE_SIZE: int = int(self._get_env("POLICY_CACHE_SIZE", default="10000"))
+        self.MATCHER_POOL_SIZE: int = int(self._get_env("MATCHER_POOL_SIZE", default="256"))
+        
+        # Проверка сообщений вне event loop: режим (inline, thread или process), количество
+        # потоков или процессов, длина текста, до которой проверка выполняется сразу,
+        # размер пачки и сколько миллисекунд собирать пачку
+        self.FILTER_EXECUTOR: str = self._get_env("FILTER_EXECUTOR", default="inline").lower()
+        self.FILTER_WORKERS: int = int(self._get_env("FILTER_WORKERS", default="2"))
+        self.FILTER_INLINE_MAX_LENGTH: int = int(self._get_env("FILTER_INLINE_MAX_LENGTH", default="300"))
+        self.FILTER_BATCH_SIZE: int = int(self._get_env("FILTER_BATCH_SIZE", default="32"))
+        self.FILTER_BATCH_MS: float = float(self._get_env("FILTER_BATCH_MS", default="2"))
+        
+        # Задержка event loop: период замера в секундах (0 - не замерять)
+        # и задержка в миллисекундах, начиная с которой пишется предупреждение
+        self.LOOP_LAG_INTERVAL: float = float(self._get_env("LOOP_LAG_INTERVAL", default="1"))
+        self.LOOP_LAG_WARN_MS: float = float(self._get_env("LOOP_LAG_WARN_MS", default="200"))
+        
+        # Эскалация наказаний (действие escalate): наказания за 1-е, 2-е и т.д. нарушение,
+        # считаются ли нарушением повторяющиеся сообщения, через сколько секунд без нарушений
+        # забывается одно, сколько счётчиков держать в памяти и период записи изменённых
+        # счётчиков в user_strikes
+        self.ESCALATION_STEPS: str = self._get_env("ESCALATION_STEPS", default="warn,mute")
+        self.STRIKE_DUPLICATES: bool = self._get_env("STRIKE_DUPLICATES", default="false").lower() in ("1", "true", "yes")
+        self.STRIKE_DECAY_SECONDS: float = float(self._get_env("STRIKE_DECAY_SECONDS", default="86400"))
+        self.STRIKE_CACHE_SIZE: int = int(self._get_env("STRIKE_CACHE_SIZE", default="100000"))
+        self.STRIKE_FLUSH_SECONDS: float = float(self._get_env("STRIKE_FLUSH_SECONDS", default="5"))
+        
+        # Повторяющиеся сообщения: сколько одинаковых или похожих сообщений допускается
+        # в чате и во всех чатах (0 - без ограничения, по умолчанию проверка выключена),
+        # окна в секундах, размеры окон и минимальная длина текста (буквы и цифры) для проверки
+        self.DUPLICATE_CHAT_LIMIT: int = int(self._get_env("DUPLICATE_CHAT_LIMIT", default="0"))
+        self.DUPLICATE_GLOBAL_LIMIT: int = int(self._get_env("DUPLICATE_GLOBAL_LIMIT", default="0"))
+        self.DUPLICATE_WINDOW_SECONDS: float = float(self._get_env("DUPLICATE_WINDOW_SECONDS", default="300"))
+        self.DUPLICATE_GLOBAL_WINDOW_SECONDS: float = float(
+            self._get_env("DUPLICATE_GLOBAL_WINDOW_SECONDS", default="900")
+        )
+        self.DUPLICATE_MAX_ENTRIES: int = int(self._get_env("DUPLICATE_MAX_ENTRIES", default="2000"))
+        self.DUPLICATE_GLOBAL_MAX_ENTRIES: int = int(
+            self._get_env("DUPLICATE_GLOBAL_MAX_ENTRIES", default="100000")
+        )
+        self.DUPLICATE_MIN_LENGTH: int = int(self._get_env("DUPLICATE_MIN_LENGTH", default="20"))
+        
+        # Исходящие запросы к Telegram API: запросов в секунду для бота и для одного чата,
+        # запас запросов чата и число повторов после ответа 429
+        self.API_GLOBAL_RATE: float = float(self._get_env("API_GLOBAL_RATE", default="30"))
+        self.API_CHAT_RATE: float = float(self._get_env("API_CHAT_RATE", default="1"))
+        self.API_CHAT_BURST: float = float(self._get_env("API_CHAT_BURST", default="5"))
+        self.API_MAX_RETRIES: int = int(self._get_env("API_MAX_RETRIES", default="3"))
+        
+        # Удаление нарушений: сколько миллисекунд собирать сообщения чата для deleteMessages
+        # и окно, за которое в чат отправляется одно предупреждение
+        self.DELETE_BATCH_MS: int = int(self._get_env("DELETE_BATCH_MS", default="300"))
+        self.WARNING_WINDOW_SECONDS: float = float(self._get_env("WARNING_WINDOW_SECONDS", default="10"))
+        
+        # Защита от флуда: не более FLOOD_MAX_MESSAGES сообщений за FLOOD_WINDOW_SECONDS
+        # (0 - отключено), длительность мута и время, через которое забывается молчащий пользователь
+        self.FLOOD_MAX_MESSAGES: int = int(self._get_env("FLOOD_MAX_MESSAGES", default="5"))
+        self.FLOOD_WINDOW_SECONDS: float = float(self._get_env("FLOOD_WINDOW_SECONDS", default="10"))
+        self.FLOOD_MUTE_SECONDS: int = int(self._get_env("FLOOD_MUTE_SECONDS", default="300"))
+        self.FLOOD_IDLE_SECONDS: float = float(self._get_env("FLOOD_IDLE_SECONDS", default="600"))
+        
+        # Хранение истории: сколько месяцев держать секции bot_actions (0 - бессрочно),
+        # куда выгружать удаляемые секции (пусто - удалять без архива) и период проверки
+        self.RETENTION_MONTHS: int = int(self._get_env("RETENTION_MONTHS", default="0"))
+        self.ARCHIVE_DIR: str = self._get_env("ARCHIVE_DIR", default="archive")
+        self.RETENTION_INTERVAL_HOURS: float = float(self._get_env("RETENTION_INTERVAL_HOURS", default="24"))
+        
+        # Обработка обновлений: количество воркеров, обрабатывающих очереди чатов
+        # (0 - без планировщика), и максимум обновлений, принятых в обработку одновременно
+        self.UPDATE_WORKERS: int = int(self._get_env("UPDATE_WORKERS", default="16"))
+        self.MAX_IN_FLIGHT_UPDATES: int = int(self._get_env("MAX_IN_FLIGHT_UPDATES", default="1000"))
         
         # Database URL (опционально, может быть сформирован автоматически)
         self.DATABASE_URL: Optional[str] = self._get_env("DATABASE_URL", required=False)
         
+        # Режим получения обновлений: polling или webhook
+        self.BOT_MODE: str = self._get_env("BOT_MODE", default="polling").lower()
+        
+        # Webhook: публичный адрес (за reverse proxy), путь, секретный токен,
+        # адрес и порт локального сервера, количество процессов-обработчиков
+        self.WEBHOOK_BASE_URL: Optional[str] = self._get_env(
+            "WEBHOOK_BASE_URL", required=self.BOT_MODE == "webhook"
+        )
+        self.WEBHOOK_PATH: str = self._get_env("WEBHOOK_PATH", default="/webhook")
+        self.WEBHOOK_SECRET: Optional[str] = self._get_env("WEBHOOK_SECRET")
+        self.WEBHOOK_HOST: str = self._get_env("WEBHOOK_HOST", default="0.0.0.0")
+        self.WEBHOOK_PORT: int = int(self._get_env("WEBHOOK_PORT", default="8080"))
+        self.WEBHOOK_WORKERS: int = int(self._get_env("WEBHOOK_WORKERS", default="1"))
+        
+        # Метрики Prometheus: адрес и порт HTTP-сервера /metrics (0 - отключено);
+        # в режиме webhook процесс N слушает порт METRICS_PORT + N
+        self.METRICS_HOST: str = self._get_env("METRICS_HOST", default="127.0.0.1")
+        self.METRICS_PORT: int = int(self._get_env("METRICS_PORT", default="0"))
+        
         # Logging
         self.LOG_LEVEL: str = self._get_env("LOG_LEVEL", default="INFO")
         self.LOG_FILE: str = self._get_env("LOG_FILE", default="logs/bot.log")
         
+        # Формат логов (text или json), ротация файла по размеру в байтах (0 - без ротации)
+        # или по времени (LOG_ROTATE_WHEN, например midnight), число старых файлов,
+        # размер очереди записей и доля записей DEBUG, попадающих в лог
+        self.LOG_FORMAT: str = self._get_env("LOG_FORMAT", default="text").lower()
+        self.LOG_MAX_BYTES: int = int(self._get_env("LOG_MAX_BYTES", default="10485760"))
+        self.LOG_ROTATE_WHEN: str = self._get_env("LOG_ROTATE_WHEN", default="")
+        self.LOG_BACKUP_COUNT: int = int(self._get_env("LOG_BACKUP_COUNT", default="5"))
+        self.LOG_QUEUE_SIZE: int = int(self._get_env("LOG_QUEUE_SIZE", default="10000"))
+        self.LOG_DEBUG_SAMPLE_RATE: float = float(self._get_env("LOG_DEBUG_SAMPLE_RATE", default="1"))
+        
         # Формируем DATABASE_URL если не указан
-        if not self.DATABASE_URL:
+        if not self.DATABASE_URL and mysql_required:
             self.DATABASE_URL = (
                 f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}"
                 f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
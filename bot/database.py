@@ -1,23 +1,68 @@
 """
 МОДУЛЬ: Работа с базой данных
-Обеспечивает подключение к MySQL и операции с БД.
+Обеспечивает подключение к MySQL и операции с БД, создаёт глобальное
+хранилище db выбранной в DB_BACKEND реализации (MySQL или SQLite).
 Использует bot/config.py для получения параметров подключения.
 """
 
+import time
 import aiomysql
-from typing import Optional, List, Dict, Any
+from collections import Counter
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
 from contextlib import asynccontextmanager
 
 from bot.config import config
-from bot.models import BotAction
+from bot.models import BotAction, utc_now
 from bot.logger import logger
+from bot.metrics import db_pool_wait_seconds
+from bot.sqlite_storage import SQLiteDatabase
+# Общая часть хранилища
+from bot.storage import (
+    HISTORY_COLUMNS,
+    POLICY_COLUMNS,
+    Storage,
+    action_row,
+)
 
 
-class Database:
+# Время действия всегда задаётся явно (UTC), день в счётчиках берётся из него же
+INSERT_ACTION_SQL = """
+    INSERT INTO bot_actions 
+    (action_type, user_id, username, chat_id, message_text, reason, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+# Счётчики увеличиваются в той же транзакции, что и вставка действий
+UPSERT_COUNTER_SQL = """
+    INSERT INTO chat_action_counters (chat_id, action_type, action_count)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE action_count = action_count + VALUES(action_count)
+"""
+
+UPSERT_DAILY_SQL = """
+    INSERT INTO chat_action_daily (chat_id, action_type, day, action_count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE action_count = action_count + VALUES(action_count)
+"""
+
+
+UPSERT_STRIKES_SQL = """
+    INSERT INTO user_strikes (chat_id, user_id, strikes, last_strike_at)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE strikes = VALUES(strikes), last_strike_at = VALUES(last_strike_at)
+"""
+
+
+class Database(Storage):
     """Класс для работы с базой данных MySQL."""
     
+    backend = "mysql"
+    
     def __init__(self):
         """Инициализация подключения к БД."""
+        super().__init__()
         self.pool: Optional[aiomysql.Pool] = None
     
     async def connect(self):
@@ -35,61 +80,154 @@ class Database:
                 autocommit=True,
                 charset="utf8mb4",
                 use_unicode=True,
+                # Время в БД - UTC: DATE(created_at) при пересчёте счётчиков и границы
+                # секций совпадают с днями, которые бот считает при вставке
+                init_command="SET time_zone = '+00:00'",
             )
             logger.info(f"Подключение к БД установлено: {db_config['host']}:{db_config['port']}/{db_config['db']}")
+            
+            self.counters_enabled = (
+                await self._table_exists("chat_action_counters")
+                and await self._table_exists("chat_action_daily")
+            )
+            if not self.counters_enabled:
+                logger.warning(
+                    "Таблицы счётчиков не найдены, статистика считается по bot_actions. "
+                    "Выполните python -m bot.maintenance migrate и backfill-counters"
+                )
+            
+            self.policies_enabled = await self._table_exists("chat_policies")
+            self.strikes_enabled = await self._table_exists("user_strikes")
+            if not (self.policies_enabled and self.strikes_enabled):
+                logger.warning(
+                    "Таблицы chat_policies и user_strikes не найдены: политики чатов не загружаются, "
+                    "счётчики нарушений хранятся только в памяти. Выполните python -m bot.maintenance migrate"
+                )
+            
+            # Запускаем отложенную запись действий пачками
+            self._start_writer()
         except Exception as e:
             logger.error(f"Ошибка подключения к БД: {e}")
             raise
     
-    async def disconnect(self):
+    async def _close(self):
         """Закрывает пул соединений."""
         if self.pool:
             self.pool.close()
             await self.pool.wait_closed()
+            self.pool = None
             logger.info("Подключение к БД закрыто")
     
+    @property
+    def connected(self) -> bool:
+        """Создан ли пул соединений."""
+        return self.pool is not None
+    
     @asynccontextmanager
     async def get_connection(self):
         """Контекстный менеджер для получения соединения из пула."""
         if not self.pool:
             raise RuntimeError("Пул соединений не инициализирован. Вызовите connect() сначала.")
         
+        started = time.perf_counter()
         async with self.pool.acquire() as conn:
+            db_pool_wait_seconds.observe(time.perf_counter() - started)
             yield conn
     
-    async def save_action(self, action: BotAction) -> bool:
+    def pool_usage(self) -> Optional[Dict[str, int]]:
+        """Возвращает заполненность пула соединений aiomysql."""
+        if not self.pool:
+            return None
+        return {
+            "used": self.pool.size - self.pool.freesize,
+            "free": self.pool.freesize,
+            "size": self.pool.size,
+            "max": self.pool.maxsize,
+        }
+    
+    async def _table_exists(self, table: str) -> bool:
+        """Проверяет, существует ли таблица в текущей базе данных."""
+        async with self.get_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SHOW TABLES LIKE %s", (table,))
+                return await cur.fetchone() is not None
+    
+    async def _insert_actions(self, actions: List[BotAction]):
+        """Записывает действия одним многострочным INSERT вместе со счётчиками."""
+        now = utc_now()
+        times = [action.created_at or now for action in actions]
+        async with self.get_connection() as conn:
+            if self.counters_enabled:
+                await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        INSERT_ACTION_SQL,
+                        [(*action_row(action), at) for action, at in zip(actions, times)]
+                    )
+                    if self.counters_enabled:
+                        await self._upsert_counters(cur, actions, times)
+                if self.counters_enabled:
+                    await conn.commit()
+            except Exception:
+                if self.counters_enabled:
+                    await conn.rollback()
+                raise
+    
+    async def _upsert_counters(self, cur, actions: List[BotAction], times: List[datetime]):
+        """Увеличивает счётчики по чатам и по дням (по записанному времени действий) для пачки."""
+        totals = Counter((action.chat_id, action.action_type) for action in actions)
+        daily = Counter(
+            (action.chat_id, action.action_type, at.date())
+            for action, at in zip(actions, times)
+        )
+        await cur.executemany(
+            UPSERT_COUNTER_SQL,
+            [(chat_id, action_type, count) for (chat_id, action_type), count in totals.items()]
+        )
+        await cur.executemany(
+            UPSERT_DAILY_SQL,
+            [(chat_id, action_type, day, count) for (chat_id, action_type, day), count in daily.items()]
+        )
+    
+    async def rebuild_counters(self) -> int:
         """
-        Сохраняет действие бота в базу данных.
+        Пересчитывает таблицы счётчиков по всем строкам bot_actions.
+        
+        Используется для первоначального заполнения после создания таблиц
+        и для исправления расхождений.
         
-        Args:
-            action: Объект BotAction для сохранения
-            
         Returns:
-            True если успешно, False в случае ошибки
+            Количество строк в chat_action_counters после пересчёта
         """
-        try:
-            async with self.get_connection() as conn:
+        async with self.get_connection() as conn:
+            await conn.begin()
+            try:
                 async with conn.cursor() as cur:
+                    await cur.execute("DELETE FROM chat_action_counters")
                     await cur.execute(
                         """
-                        INSERT INTO bot_actions 
-                        (action_type, user_id, username, chat_id, message_text, reason)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        """,
-                        (
-                            action.action_type,
-                            action.user_id,
-                            action.username,
-                            action.chat_id,
-                            action.message_text,
-                            action.reason,
-                        )
+                        INSERT INTO chat_action_counters (chat_id, action_type, action_count)
+                        SELECT chat_id, action_type, COUNT(*) FROM bot_actions 
+                        GROUP BY chat_id, action_type
+                        """
                     )
-                    logger.debug(f"Действие сохранено в БД: {action.action_type} для user_id={action.user_id}")
-                    return True
-        except Exception as e:
-            logger.error(f"Ошибка при сохранении действия в БД: {e}")
-            return False
+                    rows = cur.rowcount
+                    await cur.execute("DELETE FROM chat_action_daily")
+                    await cur.execute(
+                        """
+                        INSERT INTO chat_action_daily (chat_id, action_type, day, action_count)
+                        SELECT chat_id, action_type, DATE(created_at), COUNT(*) FROM bot_actions 
+                        GROUP BY chat_id, action_type, DATE(created_at)
+                        """
+                    )
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+        
+        self.counters_enabled = True
+        return rows
     
     async def get_stats(self, chat_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
         """
@@ -107,8 +245,8 @@ class Database:
                 async with conn.cursor(aiomysql.DictCursor) as cur:
                     if chat_id:
                         await cur.execute(
-                            """
-                            SELECT * FROM bot_actions 
+                            f"""
+                            SELECT {HISTORY_COLUMNS}, message_text FROM bot_actions 
                             WHERE chat_id = %s 
                             ORDER BY created_at DESC 
                             LIMIT %s
@@ -117,8 +255,8 @@ class Database:
                         )
                     else:
                         await cur.execute(
-                            """
-                            SELECT * FROM bot_actions 
+                            f"""
+                            SELECT {HISTORY_COLUMNS}, message_text FROM bot_actions 
                             ORDER BY created_at DESC 
                             LIMIT %s
                             """,
@@ -129,37 +267,228 @@ class Database:
             logger.error(f"Ошибка при получении статистики: {e}")
             return []
     
-    async def get_action_count(self, action_type: str, chat_id: Optional[int] = None) -> int:
+    async def get_stats_page(
+        self,
+        chat_id: int,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        include_text: bool = False,
+    ) -> List[Dict[str, Any]]:
         """
-        Получает количество действий определённого типа.
+        Получает страницу истории действий чата от новых к старым.
+        
+        Пагинация по курсору (id последней записи предыдущей страницы), а не
+        по OFFSET, поэтому стоимость запроса не растёт с номером страницы.
         
         Args:
-            action_type: Тип действия
-            chat_id: ID чата (если None, считает для всех чатов)
+            chat_id: ID чата
+            before_id: Вернуть записи с id меньше указанного (None - с самой новой)
+            limit: Максимальное количество записей
+            include_text: Добавить в результат текст сообщения
             
         Returns:
-            Количество действий
+            Список словарей с данными действий; before_id следующей страницы -
+            id последнего элемента
         """
+        columns = f"{HISTORY_COLUMNS}, message_text" if include_text else HISTORY_COLUMNS
+        # idx_chat_id хранит (chat_id, id), поэтому строки читаются по индексу без сортировки
+        
         try:
             async with self.get_connection() as conn:
-                async with conn.cursor() as cur:
-                    if chat_id:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    if before_id is not None:
                         await cur.execute(
-                            "SELECT COUNT(*) FROM bot_actions WHERE action_type = %s AND chat_id = %s",
-                            (action_type, chat_id)
+                            f"""
+                            SELECT {columns} FROM bot_actions 
+                            WHERE chat_id = %s AND id < %s 
+                            ORDER BY id DESC 
+                            LIMIT %s
+                            """,
+                            (chat_id, before_id, limit)
                         )
                     else:
                         await cur.execute(
-                            "SELECT COUNT(*) FROM bot_actions WHERE action_type = %s",
-                            (action_type,)
+                            f"""
+                            SELECT {columns} FROM bot_actions 
+                            WHERE chat_id = %s 
+                            ORDER BY id DESC 
+                            LIMIT %s
+                            """,
+                            (chat_id, limit)
                         )
-                    result = await cur.fetchone()
-                    return result[0] if result else 0
+                    return await cur.fetchall()
         except Exception as e:
-            logger.error(f"Ошибка при подсчёте действий: {e}")
-            return 0
+            logger.error(f"Ошибка при получении истории действий: {e}")
+            return []
+    
+    async def _count_actions(self, action_type: str, chat_id: Optional[int]) -> int:
+        """Считает действия по таблицам счётчиков или, без них, по bot_actions."""
+        if self.counters_enabled:
+            # Готовые счётчики: O(1) независимо от объёма истории
+            chat_sql = "SELECT action_count FROM chat_action_counters WHERE action_type = %s AND chat_id = %s"
+            total_sql = "SELECT SUM(action_count) FROM chat_action_counters WHERE action_type = %s"
+        else:
+            chat_sql = "SELECT COUNT(*) FROM bot_actions WHERE action_type = %s AND chat_id = %s"
+            total_sql = "SELECT COUNT(*) FROM bot_actions WHERE action_type = %s"
+        
+        async with self.get_connection() as conn:
+            async with conn.cursor() as cur:
+                if chat_id:
+                    await cur.execute(chat_sql, (action_type, chat_id))
+                else:
+                    await cur.execute(total_sql, (action_type,))
+                result = await cur.fetchone()
+                return int(result[0]) if result and result[0] is not None else 0
+    
+    async def _load_action_counts(self, chat_id: int) -> Dict[str, int]:
+        """Считает действия чата по типам одним запросом."""
+        async with self.get_connection() as conn:
+            async with conn.cursor() as cur:
+                if self.counters_enabled:
+                    await cur.execute(
+                        "SELECT action_type, action_count FROM chat_action_counters WHERE chat_id = %s",
+                        (chat_id,)
+                    )
+                else:
+                    await cur.execute(
+                        """
+                        SELECT action_type, COUNT(*) FROM bot_actions 
+                        WHERE chat_id = %s 
+                        GROUP BY action_type
+                        """,
+                        (chat_id,)
+                    )
+                return {action_type: int(count) for action_type, count in await cur.fetchall()}
+    
+    async def get_chat_policy(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Получает политику модерации чата.
+        
+        Args:
+            chat_id: ID чата
+            
+        Returns:
+            Словарь с колонками POLICY_COLUMNS или None, если политика не задана
+        
+        Raises:
+            Exception: Ошибка запроса (кэш политик не должен запоминать её как отсутствие политики)
+        """
+        if not self.policies_enabled:
+            return None
+        
+        async with self.get_connection() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cur:
+                await cur.execute(
+                    f"SELECT {', '.join(POLICY_COLUMNS)} FROM chat_policies WHERE chat_id = %s",
+                    (chat_id,)
+                )
+                return await cur.fetchone()
+    
+    async def save_chat_policy(self, chat_id: int, values: Dict[str, Any]) -> bool:
+        """
+        Создаёт или изменяет политику модерации чата.
+        
+        Args:
+            chat_id: ID чата
+            values: Изменяемые колонки из POLICY_COLUMNS (None - значение по умолчанию)
+            
+        Returns:
+            True если успешно, False в случае ошибки
+        """
+        columns = [column for column in POLICY_COLUMNS if column in values]
+        if not columns:
+            return True
+        if not self.policies_enabled:
+            logger.error("Таблица chat_policies не найдена. Выполните python -m bot.maintenance migrate")
+            return False
+        
+        updates = ", ".join(f"{column} = VALUES({column})" for column in columns)
+        try:
+            async with self.get_connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(
+                        f"""
+                        INSERT INTO chat_policies (chat_id, {', '.join(columns)})
+                        VALUES (%s{', %s' * len(columns)})
+                        ON DUPLICATE KEY UPDATE {updates}
+                        """,
+                        (chat_id, *(values[column] for column in columns))
+                    )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении политики чата {chat_id}: {e}")
+            return False
+    
+    async def get_user_strikes(self, chat_id: int, user_id: int) -> Optional[Tuple[int, datetime]]:
+        """
+        Получает счётчик нарушений пользователя в чате.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            
+        Returns:
+            Количество нарушений и время последнего или None, если записи нет
+        
+        Raises:
+            Exception: Ошибка запроса
+        """
+        if not self.strikes_enabled:
+            return None
+        
+        async with self.get_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT strikes, last_strike_at FROM user_strikes WHERE chat_id = %s AND user_id = %s",
+                    (chat_id, user_id)
+                )
+                row = await cur.fetchone()
+                return (int(row[0]), row[1]) if row else None
+    
+    async def save_user_strikes(self, rows: List[Tuple[int, int, int, datetime]]) -> bool:
+        """
+        Записывает счётчики нарушений пачкой.
+        
+        Args:
+            rows: Кортежи (chat_id, user_id, нарушений, время последнего нарушения)
+            
+        Returns:
+            True если успешно (или таблицы нет), False в случае ошибки
+        """
+        if not rows or not self.strikes_enabled:
+            return True
+        
+        try:
+            async with self.get_connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.executemany(UPSERT_STRIKES_SQL, rows)
+            logger.debug("Сохранено счётчиков нарушений: %s", len(rows))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении счётчиков нарушений ({len(rows)} шт.): {e}")
+            return False
+
+
+def create_database(backend: str) -> Storage:
+    """
+    Создаёт хранилище выбранной реализации.
+    
+    Args:
+        backend: mysql или sqlite
+    
+    Returns:
+        Хранилище (подключение выполняется в connect())
+    
+    Raises:
+        ValueError: Если реализация неизвестна
+    """
+    if backend == SQLiteDatabase.backend:
+        return SQLiteDatabase(config.SQLITE_PATH)
+    if backend == Database.backend:
+        return Database()
+    raise ValueError(f"Неизвестное значение DB_BACKEND: {backend} (ожидается mysql или sqlite)")
 
 
 # Глобальный экземпляр базы данных
-db = Database()
+db = create_database(config.DB_BACKEND)
 
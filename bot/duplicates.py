@@ -0,0 +1,265 @@
+"""
+МОДУЛЬ: Обнаружение повторяющихся сообщений
+Находит одинаковые и почти одинаковые сообщения (волны спама с разных
+аккаунтов) в скользящих окнах по чату и по всем чатам.
+Использует bot/filters.py для нормализации текста.
+"""
+
+import re
+import time
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from bot.config import config
+from bot.filters import normalize_text
+
+
+# Всё, кроме букв и цифр: пробелы, пунктуация и эмодзи не влияют на сравнение
+_NON_WORD = re.compile(r"[\W_]+")
+
+# Длина символьных шинглов для MinHash
+SHINGLE_SIZE = 4
+
+# LSH: подпись из BANDS * ROWS значений MinHash делится на BANDS полос.
+# Сообщения попадают в одну корзину хотя бы одной полосы с вероятностью
+# 1 - (1 - J^ROWS)^BANDS, порог сходства по Жаккару около (1/BANDS)^(1/ROWS) = 0.67
+BANDS = 5
+ROWS = 4
+
+# Сообщения длиннее учитываются по началу: стоимость проверки ограничена
+MAX_TEXT_LENGTH = 1000
+
+# Число корзин подписи
+SIGNATURE_SIZE = BANDS * ROWS
+
+
+def compact_text(text: str) -> str:
+    """
+    Нормализует текст для сравнения сообщений.
+    
+    Args:
+        text: Исходный текст
+    
+    Returns:
+        Нормализованный текст только из букв и цифр
+    """
+    return _NON_WORD.sub("", normalize_text(text[:MAX_TEXT_LENGTH]))
+
+
+def minhash_bands(text: str) -> Tuple[int, ...]:
+    """
+    Вычисляет LSH-ключи полос MinHash-подписи текста.
+    
+    Используется MinHash с одной перестановкой (one permutation hashing):
+    хеши шинглов распределяются по SIGNATURE_SIZE корзинам по остатку от деления,
+    в каждой корзине берётся минимум. Это один проход по шинглам вместо
+    SIGNATURE_SIZE независимых хеш-функций. Пустые корзины заполняются
+    значением ближайшей следующей непустой (densification). Шинглы хешируются
+    CRC32, а не hash(): хеш строк зависит от PYTHONHASHSEED, и похожесть
+    одних и тех же текстов различалась бы между запусками.
+    
+    Args:
+        text: Нормализованный текст (compact_text)
+    
+    Returns:
+        BANDS хешей полос подписи
+    """
+    size = SIGNATURE_SIZE
+    signature: List[Optional[int]] = [None] * size
+    for i in range(max(1, len(text) - SHINGLE_SIZE + 1)):
+        value = zlib.crc32(text[i:i + SHINGLE_SIZE].encode())
+        index = value % size
+        current = signature[index]
+        if current is None or value < current:
+            signature[index] = value
+    
+    for index in range(size):
+        if signature[index] is None:
+            for offset in range(1, size):
+                donor = signature[(index + offset) % size]
+                if donor is not None:
+                    signature[index] = hash((donor, offset))
+                    break
+    
+    return tuple(
+        hash((band, *signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)
+    )
+
+
+class _Window:
+    """
+    Скользящее окно ключей сообщений за ttl секунд, не более max_size сообщений.
+    
+    Хранит количество сообщений с каждым ключом; устаревшие сообщения
+    вычитаются при каждом добавлении, поэтому стоимость операций не зависит
+    от размера окна.
+    """
+    
+    __slots__ = ("ttl", "max_size", "_entries", "_counts")
+    
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._entries: Deque[Tuple[float, Tuple[int, ...]]] = deque()
+        self._counts: Dict[int, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _drop_oldest(self):
+        """Удаляет самое старое сообщение окна."""
+        _, keys = self._entries.popleft()
+        counts = self._counts
+        for key in keys:
+            count = counts[key] - 1
+            if count:
+                counts[key] = count
+            else:
+                del counts[key]
+    
+    def expire(self, now: float):
+        """Удаляет сообщения старше ttl."""
+        threshold = now - self.ttl
+        entries = self._entries
+        while entries and entries[0][0] <= threshold:
+            self._drop_oldest()
+    
+    def count(self, key: int) -> int:
+        """Количество сообщений окна с ключом."""
+        return self._counts.get(key, 0)
+    
+    def add(self, keys: Tuple[int, ...], now: float):
+        """Добавляет сообщение с набором ключей."""
+        counts = self._counts
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+        self._entries.append((now, keys))
+        if len(self._entries) > self.max_size:
+            self._drop_oldest()
+
+
+@dataclass
+class DuplicateVerdict:
+    """Сколько таких же сообщений уже было в окнах."""
+    
+    exact_in_chat: int = 0
+    exact_global: int = 0
+    similar_in_chat: int = 0
+    similar_global: int = 0
+    
+    @property
+    def in_chat(self) -> int:
+        """Одинаковых или похожих сообщений в чате."""
+        return max(self.exact_in_chat, self.similar_in_chat)
+    
+    @property
+    def global_count(self) -> int:
+        """Одинаковых или похожих сообщений во всех чатах."""
+        return max(self.exact_global, self.similar_global)
+
+
+class DuplicateDetector:
+    """
+    Детектор повторяющихся сообщений.
+    
+    Точные повторы определяются по хешу нормализованного текста, похожие -
+    по совпадению хотя бы одной LSH-полосы MinHash-подписи. Для каждого чата
+    и для всех чатов вместе ведётся своё окно; число окон чатов ограничено,
+    давно не активные чаты вытесняются.
+    """
+    
+    def __init__(
+        self,
+        chat_window: float,
+        global_window: float,
+        chat_max_entries: int,
+        global_max_entries: int,
+        min_length: int,
+        max_chats: int = 1000,
+    ):
+        """
+        Args:
+            chat_window: Окно чата в секундах
+            global_window: Общее окно в секундах
+            chat_max_entries: Максимум сообщений в окне чата
+            global_max_entries: Максимум сообщений в общем окне
+            min_length: Минимальная длина нормализованного текста для проверки
+            max_chats: Сколько окон чатов хранить
+        """
+        self.chat_window = chat_window
+        self.chat_max_entries = chat_max_entries
+        self.min_length = min_length
+        self.max_chats = max(1, max_chats)
+        self._global = _Window(global_window, global_max_entries)
+        self._chats: "OrderedDict[int, _Window]" = OrderedDict()
+    
+    def _get_chat_window(self, chat_id: int) -> _Window:
+        """Возвращает окно чата, вытесняя окна давно не активных чатов."""
+        window = self._chats.get(chat_id)
+        if window is None:
+            window = _Window(self.chat_window, self.chat_max_entries)
+            self._chats[chat_id] = window
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return window
+    
+    def check(self, chat_id: int, text: str, now: Optional[float] = None) -> Optional[DuplicateVerdict]:
+        """
+        Учитывает сообщение и сообщает, сколько таких же уже было.
+        
+        Args:
+            chat_id: ID чата
+            text: Текст сообщения
+            now: Время сообщения (по умолчанию time.monotonic())
+        
+        Returns:
+            Количество предыдущих повторов или None для слишком коротких сообщений
+        """
+        compact = compact_text(text)
+        if len(compact) < self.min_length:
+            return None
+        
+        if now is None:
+            now = time.monotonic()
+        
+        exact_key = hash(compact)
+        bands = minhash_bands(compact)
+        
+        chat_window = self._get_chat_window(chat_id)
+        chat_window.expire(now)
+        self._global.expire(now)
+        
+        verdict = DuplicateVerdict(
+            exact_in_chat=chat_window.count(exact_key),
+            exact_global=self._global.count(exact_key),
+            similar_in_chat=max(chat_window.count(key) for key in bands),
+            similar_global=max(self._global.count(key) for key in bands),
+        )
+        
+        keys = (exact_key,) + bands
+        chat_window.add(keys, now)
+        self._global.add(keys, now)
+        return verdict
+    
+    def forget_chat(self, chat_id: int):
+        """
+        Удаляет окно чата.
+        
+        Args:
+            chat_id: ID чата
+        """
+        self._chats.pop(chat_id, None)
+
+
+# Глобальный экземпляр детектора повторов
+duplicate_detector = DuplicateDetector(
+    chat_window=config.DUPLICATE_WINDOW_SECONDS,
+    global_window=config.DUPLICATE_GLOBAL_WINDOW_SECONDS,
+    chat_max_entries=config.DUPLICATE_MAX_ENTRIES,
+    global_max_entries=config.DUPLICATE_GLOBAL_MAX_ENTRIES,
+    min_length=config.DUPLICATE_MIN_LENGTH,
+)
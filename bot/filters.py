@@ -5,130 +5,256 @@
 """
 
 import re
-from typing import List, Set
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from bot.matching import AhoCorasick, PatternSet
+
+
+# Таблица нормализации: латинские двойники и leetspeak -> кириллица,
+# символы-маски -> "*", символы нулевой ширины удаляются
+NORMALIZE_TABLE = str.maketrans(
+    {
+        # Латинские буквы, похожие на кириллические
+        "a": "а", "b": "в", "c": "с", "e": "е", "h": "н", "k": "к",
+        "m": "м", "n": "п", "o": "о", "p": "р", "t": "т", "x": "х", "y": "у",
+        "ё": "е",
+        # Leetspeak
+        "@": "а", "0": "о", "3": "з", "4": "ч", "6": "б", "$": "с",
+        # Маски, которыми закрывают буквы
+        "#": "*",
+        # Символы нулевой ширины и мягкий перенос
+        "\u00ad": None, "\u180e": None, "\u200b": None, "\u200c": None,
+        "\u200d": None, "\u2060": None, "\ufeff": None,
+    }
+)
+
+# Буква или маска; однобуквенные слова, которые не склеиваются с соседями
+_LETTER = r"(?:[^\W\d_]|\*)"
+_GLUED_LETTER = r"(?:[^\W\d_авиксоуя]|\*)"
+_SEPARATOR = r"[\s.\-_]+"
+
+# Разделители внутри слова, разбитого на буквы ("б л я", "с.у.к.а", "б лядь"):
+# удаляются между двумя одиночными буквами и рядом с одиночной буквой,
+# которая не может быть самостоятельным словом
+_SPACED_LETTERS = re.compile(
+    rf"(?<=(?<![\w*]){_LETTER}){_SEPARATOR}(?={_LETTER}(?![\w*]))"
+    rf"|(?<=(?<![\w*]){_GLUED_LETTER}){_SEPARATOR}"
+    rf"|{_SEPARATOR}(?={_GLUED_LETTER}(?![\w*]))"
+)
+
+# Повторы одной буквы ("дууурак")
+_REPEATED_LETTERS = re.compile(rf"({_LETTER})\1+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к виду, устойчивому к обходу фильтра.
+    
+    Понижает регистр, заменяет двойники и leetspeak за один проход translate,
+    удаляет разделители внутри слов, разбитых на буквы, и схлопывает повторы букв.
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        Нормализованный текст
+    """
+    text = text.lower().translate(NORMALIZE_TABLE)
+    text = _SPACED_LETTERS.sub("", text)
+    return _REPEATED_LETTERS.sub(r"\1", text)
+
+
+def _word_variants(word: str) -> List[str]:
+    """
+    Возвращает формы слова для точного поиска по нормализованному тексту.
+    
+    Помимо нормализованного слова, добавляются варианты с одной внутренней
+    буквой, закрытой маской ("х*й", "б*ядь").
+    
+    Args:
+        word: Запрещённое слово
+        
+    Returns:
+        Список форм слова
+    """
+    normalized = normalize_text(word)
+    variants = [normalized]
+    if len(normalized) >= 3 and " " not in normalized:
+        for i in range(1, len(normalized) - 1):
+            variants.append(normalized[:i] + "*" + normalized[i + 1:])
+    return variants
+
+
+@dataclass
+class ScanVerdict:
+    """Результат проверки одного сообщения в scan_many."""
+    
+    text: str
+    blocked: bool
+    # Сработавшие правила: слова словаря и регулярные выражения в виде /выражение/
+    rules: List[str] = field(default_factory=list)
+
+
+# Правила по умолчанию. Основной список хранится в наборе по умолчанию
+# (lexicons/ru.txt, см. bot/lexicons.py); эти правила используются, если файла нет
+
+# Запрещённые слова и оскорбления
+DEFAULT_WORDS: Tuple[str, ...] = (
+    # Оскорбления по внешности
+    "урод", "уродина", "уродство",
+    "дебил", "дебилка", "дебильный",
+    "идиот", "идиотка", "идиотский",
+    "дурак", "дура", "дурацкий", "дурость",
+    "тупой", "тупая", "тупость",
+    "кретин", "кретинка",
+    "моральный урод",
+    
+    # Оскорбления по интеллекту
+    "тупица", "тупоголовый",
+    "безмозглый", "безмозглая",
+    "тупорылый",
+    "недоразвитый",
+    
+    # Оскорбления по характеру
+    "сволочь", "сволочи",
+    "подонок", "подонки",
+    "мразь", "мрази",
+    "гад", "гадина",
+    "тварь",
+    "скотина",
+    "животное",
+    "отброс",
+    "отморозок",
+    
+    # Грубые оскорбления
+    "козел", "козлина",
+    "осел", "ослица",
+    "свинья",
+    "собака",
+    "крыса",
+    "змея",
+    
+    # Матерные слова (проверяются также через регулярные выражения)
+    "блядь", "бля",
+    "хуй", "хуйня",
+    "пизда", "пиздец",
+    "ебанутый", "ебать",
+    "говно",
+    "заебись",
+    "ублюдок",
+    
+    # Оскорбления в адрес семьи
+    "мать твою",
+    "твою мать",
+    "твою мамашу",
+    
+    # Унизительные выражения
+    "ничтожество",
+    "ничего не стоишь",
+    "никчемный",
+    "бесполезный",
+    "никому не нужен",
+    
+    # Угрозы и агрессия
+    "убью", "убить",
+    "задушу", "задушить",
+    "изобью", "избить",
+    "порву", "порвать",
+    
+    # Оскорбления по национальности/расе (недопустимо)
+    "черножопый",
+    "чурка",
+    "хач",
+    
+    # Оскорбления по полу
+    "шлюха",
+    "проститутка",
+    "сука",
+    "сукин сын",
+)
+
+# Регулярные выражения для фрагментов слов с заменой букв и для "@" в роли маски
+# любой буквы. Двойники, leetspeak, повторы букв, пробелы внутри слова и маска "*"
+# в словах обрабатываются нормализацией
+DEFAULT_PATTERNS: Tuple[str, ...] = (
+    # Мат с заменой букв (б*ядь, х*й, бл@дь и т.д.)
+    r'б[л*@]',
+    r'п[и*@]зд',
+    r'е[б*@]а',
+    r'г[о*@]вн',
+    r'з[а@*]б[и*@]сь',
+    r'у[б*@]люд',
+    
+    # Оскорбления с заменой букв
+    r'д[е*@]б[и*@]л',
+    r'и[д*@]и[о*@]т',
+    r'к[р*@]ет[и*@]н',
+    r'т[у*@]п[о*@]й',
+    
+    # Обход через звёздочки и специальные символы
+    r'[бБ][*@]',
+    r'[хХ][*@]',
+    r'[пП][*@]',
+    r'[сС][у*@]к',
+)
+
+
+# Сколько результатов проверки хранить в кэше по умолчанию
+VERDICT_CACHE_SIZE = 10000
 
 
 class MessageFilter:
     """Класс для фильтрации сообщений."""
     
-    def __init__(self):
-        """Инициализация списка запрещённых слов и оскорблений."""
-        # Базовый список нецензурных слов (можно расширять)
-        # ВАЖНО: Добавьте здесь реальные нецензурные слова
-        # Используем set() для создания множества, а не {} (которое создаёт словарь)
-        self.bad_words: Set[str] = set()
-        # Примеры нецензурных слов (раскомментируйте и добавьте свои):
-        # self.bad_words.add("слово1")
-        # self.bad_words.add("слово2")
-        
-        # Список оскорблений (недопустимые выражения)
-        self.insults: Set[str] = {
-            # Оскорбления по внешности
-            "урод", "уродина", "уродство",
-            "дебил", "дебилка", "дебильный",
-            "идиот", "идиотка", "идиотский",
-            "дурак", "дура", "дурацкий", "дурость",
-            "тупой", "тупая", "тупость",
-            "кретин", "кретинка",
-            "моральный урод",
-            
-            # Оскорбления по интеллекту
-            "тупица", "тупоголовый",
-            "безмозглый", "безмозглая",
-            "тупорылый",
-            "недоразвитый",
-            
-            # Оскорбления по характеру
-            "сволочь", "сволочи",
-            "подонок", "подонки",
-            "мразь", "мрази",
-            "гад", "гадина",
-            "тварь",
-            "скотина",
-            "животное",
-            "отброс",
-            "отморозок",
-            
-            # Грубые оскорбления
-            "козел", "козлина",
-            "осел", "ослица",
-            "свинья",
-            "собака",
-            "крыса",
-            "змея",
-            
-            # Матерные слова (проверяются также через регулярные выражения)
-            "блядь", "бля",
-            "хуй", "хуйня",
-            "пизда", "пиздец",
-            "ебанутый", "ебать",
-            "говно",
-            "заебись",
-            "ублюдок",
-            
-            # Оскорбления в адрес семьи
-            "мать твою",
-            "твою мать",
-            "твою мамашу",
-            
-            # Унизительные выражения
-            "ничтожество",
-            "ничего не стоишь",
-            "никчемный",
-            "бесполезный",
-            "никому не нужен",
-            
-            # Угрозы и агрессия
-            "убью", "убить",
-            "задушу", "задушить",
-            "изобью", "избить",
-            "порву", "порвать",
-            
-            # Оскорбления по национальности/расе (недопустимо)
-            "черножопый",
-            "чурка",
-            "хач",
-            
-            # Оскорбления по полу
-            "шлюха",
-            "проститутка",
-            "сука",
-            "сукин сын",
-        }
-        
-        # Объединяем все запрещённые слова
-        # Используем union для объединения множеств
-        self.bad_words = self.bad_words.union(self.insults)
-        
-        # Регулярные выражения для более сложной фильтрации
-        # Обнаружение слов с заменой букв для обхода фильтра
+    def __init__(
+        self,
+        cache_size: int = VERDICT_CACHE_SIZE,
+        words: Optional[Iterable[str]] = None,
+        patterns: Optional[Iterable[str]] = None,
+    ):
+        """
+        Инициализация списка запрещённых слов и оскорблений.
+        
+        Args:
+            cache_size: Сколько результатов contains_bad_words хранить (0 - без кэша)
+            words: Запрещённые слова и фразы (None - DEFAULT_WORDS)
+            patterns: Регулярные выражения (None - DEFAULT_PATTERNS)
+        """
+        # Запрещённые слова и фразы (в нижнем регистре)
+        self.bad_words: Set[str] = {word.lower() for word in (DEFAULT_WORDS if words is None else words)}
+        
+        # Автомат Ахо–Корасик по нормализованным формам bad_words,
+        # строится лениво при первой проверке
+        self._automaton: Optional[AhoCorasick] = None
+        self._automaton_words = 0
+        
+        # Нормализованный текст последнего сообщения: contains_bad_words
+        # и find_bad_words для одного сообщения нормализуют его один раз
+        self._last_normalized: Tuple[str, str] = ("", "")
+        
+        # Регулярные выражения (без учёта регистра)
         self.patterns: List[re.Pattern] = [
-            # Мат с заменой букв (б*ядь, х*й, бл@дь и т.д.)
-            re.compile(r'б[л*@]', re.IGNORECASE),
-            re.compile(r'б[л*@][я*@]д', re.IGNORECASE),
-            re.compile(r'х[у*@]й', re.IGNORECASE),
-            re.compile(r'п[и*@]зд', re.IGNORECASE),
-            re.compile(r'е[б*@]а', re.IGNORECASE),
-            re.compile(r'г[о*@]вн', re.IGNORECASE),
-            re.compile(r'з[а@*]б[и*@]сь', re.IGNORECASE),
-            re.compile(r'у[б*@]люд', re.IGNORECASE),
-            
-            # Оскорбления с заменой букв
-            re.compile(r'д[е*@]б[и*@]л', re.IGNORECASE),
-            re.compile(r'и[д*@]и[о*@]т', re.IGNORECASE),
-            re.compile(r'к[р*@]ет[и*@]н', re.IGNORECASE),
-            re.compile(r'т[у*@]п[о*@]й', re.IGNORECASE),
-            
-            # Обход через звёздочки и специальные символы
-            re.compile(r'[бБ][*@]', re.IGNORECASE),
-            re.compile(r'[хХ][*@]', re.IGNORECASE),
-            re.compile(r'[пП][*@]', re.IGNORECASE),
-            re.compile(r'[сС][у*@]к', re.IGNORECASE),
-            
-            # Попытки обхода через пробелы внутри слова
-            re.compile(r'б\s*л\s*я\s*д', re.IGNORECASE),
-            re.compile(r'х\s*у\s*й', re.IGNORECASE),
+            re.compile(pattern, re.IGNORECASE)
+            for pattern in (DEFAULT_PATTERNS if patterns is None else patterns)
         ]
+        
+        # Все выражения объединяются в одно, собирается лениво при первой проверке
+        self._pattern_set: Optional[PatternSet] = None
+        
+        # Версия набора правил, увеличивается при add_word и add_pattern
+        self.rules_version = 0
+        
+        # Кэш результатов contains_bad_words: текст -> результат (LRU).
+        # Ключ - сам исходный текст, а не его хеш (совпадение хешей разных текстов
+        # дало бы чужой результат) и не нормализованный текст: регулярные
+        # выражения проверяются по исходному тексту
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._verdicts: "OrderedDict[str, bool]" = OrderedDict()
+        self._verdicts_rules: Tuple[int, int, int] = (0, 0, 0)
     
     def add_word(self, word: str):
         """
@@ -138,6 +264,20 @@ class MessageFilter:
             word: Запрещённое слово
         """
         self.bad_words.add(word.lower())
+        # Автомат будет перестроен при следующей проверке
+        self._automaton = None
+        self.rules_version += 1
+    
+    def remove_word(self, word: str):
+        """
+        Удаляет слово из списка запрещённых.
+        
+        Args:
+            word: Слово
+        """
+        self.bad_words.discard(word.lower())
+        self._automaton = None
+        self.rules_version += 1
     
     def add_pattern(self, pattern: str):
         """
@@ -146,7 +286,83 @@ class MessageFilter:
         Args:
             pattern: Регулярное выражение
         """
+        # Объединённое выражение дополнится новым правилом при следующей проверке
         self.patterns.append(re.compile(pattern, re.IGNORECASE))
+        self.rules_version += 1
+    
+    def _get_automaton(self) -> AhoCorasick:
+        """
+        Возвращает автомат по текущему списку слов, перестраивая его при изменениях.
+        
+        Returns:
+            Актуальный автомат Ахо–Корасик
+        """
+        automaton = self._automaton
+        # Сверяем размер на случай прямого изменения bad_words в обход add_word
+        if automaton is None or self._automaton_words != len(self.bad_words):
+            variants: Dict[str, str] = {}
+            for word in self.bad_words:
+                for variant in _word_variants(word):
+                    variants.setdefault(variant, word)
+            automaton = AhoCorasick(variants)
+            self._automaton = automaton
+            self._automaton_words = len(self.bad_words)
+        return automaton
+    
+    def export_compiled(self) -> AhoCorasick:
+        """
+        Компилирует движки поиска и возвращает автомат для сохранения в кэш.
+        
+        Returns:
+            Автомат по словам
+        """
+        self._get_pattern_set()
+        return self._get_automaton()
+    
+    def import_compiled(self, automaton: AhoCorasick):
+        """
+        Устанавливает автомат, скомпилированный для того же набора слов,
+        и компилирует регулярные выражения.
+        
+        Args:
+            automaton: Автомат по текущему bad_words
+        """
+        self._automaton = automaton
+        self._automaton_words = len(self.bad_words)
+        self._get_pattern_set()
+    
+    def _normalize(self, text: str) -> str:
+        """
+        Нормализует текст, переиспользуя результат для того же сообщения.
+        
+        Args:
+            text: Текст для проверки
+            
+        Returns:
+            Нормализованный текст
+        """
+        last_text, last_normalized = self._last_normalized
+        if text == last_text:
+            return last_normalized
+        normalized = normalize_text(text)
+        self._last_normalized = (text, normalized)
+        return normalized
+    
+    def _get_pattern_set(self) -> PatternSet:
+        """
+        Возвращает объединённый набор регулярных выражений.
+        
+        Returns:
+            Набор правил, соответствующий текущему списку patterns
+        """
+        pattern_set = self._pattern_set
+        if pattern_set is None or pattern_set.size > len(self.patterns):
+            pattern_set = PatternSet()
+            self._pattern_set = pattern_set
+        # Новые выражения дописываются к уже собранному набору без полной пересборки
+        for compiled in self.patterns[pattern_set.size:]:
+            pattern_set.add(compiled)
+        return pattern_set
     
     def contains_bad_words(self, text: str) -> bool:
         """
@@ -161,17 +377,85 @@ class MessageFilter:
         if not text:
             return False
         
-        text_lower = text.lower()
+        verdict = self.cached_verdict(text)
+        if verdict is None:
+            verdict = self._check(text)
+            self.remember_verdict(text, verdict)
+        return verdict
+    
+    def cached_verdict(self, text: str) -> Optional[bool]:
+        """
+        Возвращает результат проверки текста из кэша.
+        
+        Args:
+            text: Непустой текст
+            
+        Returns:
+            Результат проверки или None, если текста нет в кэше
+        """
+        if not self.cache_size:
+            return None
+        
+        # Кэш сбрасывается при изменении правил; размеры списков сверяются
+        # на случай прямого изменения bad_words и patterns в обход add_*
+        rules = (self.rules_version, len(self.bad_words), len(self.patterns))
+        if rules != self._verdicts_rules:
+            self._verdicts.clear()
+            self._verdicts_rules = rules
+        
+        verdict = self._verdicts.get(text)
+        if verdict is not None:
+            self._verdicts.move_to_end(text)
+            self.cache_hits += 1
+            return verdict
+        
+        self.cache_misses += 1
+        return None
+    
+    def remember_verdict(self, text: str, verdict: bool):
+        """
+        Сохраняет результат проверки текста в кэш.
+        
+        Args:
+            text: Непустой текст
+            verdict: Результат проверки
+        """
+        if not self.cache_size:
+            return
+        
+        self._verdicts[text] = verdict
+        if len(self._verdicts) > self.cache_size:
+            self._verdicts.popitem(last=False)
+    
+    def check_many(self, texts: List[str]) -> List[bool]:
+        """
+        Проверяет тексты без кэша (для проверки в других потоках и процессах).
+        
+        Args:
+            texts: Тексты для проверки
+            
+        Returns:
+            Результаты проверки в том же порядке
+        """
+        return [bool(text) and self._check(text) for text in texts]
+    
+    def _check(self, text: str) -> bool:
+        """
+        Проверяет текст по всем правилам без кэша.
         
-        # Проверка по списку слов
-        for word in self.bad_words:
-            if word in text_lower:
-                return True
+        Args:
+            text: Непустой текст для проверки
+            
+        Returns:
+            True если сработало хотя бы одно правило
+        """
+        # Проверка по списку слов за один проход автомата
+        if self._get_automaton().search(self._normalize(text)):
+            return True
         
-        # Проверка по регулярным выражениям
-        for pattern in self.patterns:
-            if pattern.search(text):
-                return True
+        # Проверка по регулярным выражениям одним проходом
+        if self._get_pattern_set().search(text):
+            return True
         
         return False
     
@@ -190,19 +474,64 @@ class MessageFilter:
         if not text:
             return found_words
         
-        text_lower = text.lower()
-        
-        # Поиск по списку слов
-        for word in self.bad_words:
-            if word in text_lower:
-                found_words.append(word)
+        # Поиск по списку слов за один проход автомата
+        found_words.extend(self._get_automaton().find_all(self._normalize(text)))
         
-        # Поиск по регулярным выражениям
-        for pattern in self.patterns:
-            matches = pattern.findall(text)
-            found_words.extend(matches)
+        # Поиск по регулярным выражениям одним проходом
+        found_words.extend(fragment for _, fragment in self.find_pattern_hits(text))
         
         return list(set(found_words))  # Убираем дубликаты
+    
+    def find_rules(self, text: str) -> List[str]:
+        """
+        Находит все сработавшие на тексте правила.
+        
+        Args:
+            text: Текст для проверки
+            
+        Returns:
+            Отсортированный список правил: слова словаря и /регулярные выражения/
+        """
+        if not text:
+            return []
+        
+        rules = set(self._get_automaton().find_all(self._normalize(text)))
+        rules.update(f"/{rule}/" for rule, _ in self._get_pattern_set().finditer(text))
+        return sorted(rules)
+    
+    def scan_many(self, texts: Iterable[str], with_rules: bool = True) -> Iterator[ScanVerdict]:
+        """
+        Проверяет поток сообщений, выдавая результаты по мере обработки.
+        
+        Входные данные не загружаются в память целиком, поэтому функция
+        подходит для выгрузок из миллионов сообщений.
+        
+        Args:
+            texts: Тексты сообщений (любой итерируемый объект, например файл)
+            with_rules: Определять сработавшие правила для заблокированных сообщений
+            
+        Yields:
+            Результат проверки каждого сообщения в исходном порядке
+        """
+        for text in texts:
+            blocked = self.contains_bad_words(text)
+            rules = self.find_rules(text) if blocked and with_rules else []
+            yield ScanVerdict(text=text, blocked=blocked, rules=rules)
+    
+    def find_pattern_hits(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Находит срабатывания регулярных выражений с указанием правила.
+        
+        Args:
+            text: Текст для проверки
+            
+        Returns:
+            Список пар (регулярное выражение, найденный фрагмент)
+        """
+        if not text:
+            return []
+        
+        return list(self._get_pattern_set().finditer(text))
 
 
 # Глобальный экземпляр фильтра
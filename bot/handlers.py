@@ -4,14 +4,27 @@
 Использует другие модули: filters, database, logger, models.
 """
 
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
 from aiogram import Router, F
-from aiogram.types import Message
+from aiogram.types import ChatMemberUpdated, ChatPermissions, Message
 from aiogram.filters import Command
-from aiogram.exceptions import TelegramBadRequest
 
-from bot.filters import message_filter
+from bot.admins import ADMIN_STATUSES, admin_cache
+from bot.antiflood import flood_detector
+from bot.config import config
+from bot.duplicates import duplicate_detector
+from bot.filters import MessageFilter
+from bot.lexicons import lexicon_store
 from bot.database import db
+from bot.metrics import filter_check_seconds, filter_rule_hits
 from bot.models import BotAction, ActionType
+from bot.offload import filter_offloader
+from bot.outbound import moderation_queue
+from bot.policies import POLICY_ACTIONS, ChatPolicy, PolicyAction, parse_lexicon_names, policy_store
+from bot.strikes import strike_ledger
 from bot.logger import logger
 
 
@@ -53,10 +66,11 @@ async def cmd_stats(message: Message):
     try:
         chat_id = message.chat.id
         
-        # Получаем статистику
-        deleted_count = await db.get_action_count(ActionType.MESSAGE_DELETED, chat_id)
-        banned_count = await db.get_action_count(ActionType.USER_BANNED, chat_id)
-        warned_count = await db.get_action_count(ActionType.USER_WARNED, chat_id)
+        # Получаем статистику одним запросом (или из кэша)
+        counts = await db.get_action_counts(chat_id)
+        deleted_count = counts.get(ActionType.MESSAGE_DELETED, 0)
+        banned_count = counts.get(ActionType.USER_BANNED, 0)
+        warned_count = counts.get(ActionType.USER_WARNED, 0)
         
         stats_text = (
             f"📊 Статистика модерации для этого чата:\n\n"
@@ -73,54 +87,266 @@ async def cmd_stats(message: Message):
         await message.answer("❌ Ошибка при получении статистики.")
 
 
-@router.message(F.text)
+async def mute_user(message: Message, seconds: int, reason: str, cause: str) -> bool:
+    """
+    Запрещает автору сообщения писать в чат.
+    
+    Args:
+        message: Сообщение нарушителя
+        seconds: Длительность ограничения
+        reason: Причина для истории действий
+        cause: За что ограничен (для сообщения в чат)
+    
+    Returns:
+        True если пользователь ограничен (False, если он уже ограничен ранее)
+    """
+    user = message.from_user
+    # Сообщения, отправленные до ограничения, ещё могут быть в обработке:
+    # повторно не ограничиваем. Отметка ставится до первого await, чтобы
+    # параллельные обработчики не ограничили пользователя дважды
+    if flood_detector.is_muted(message.chat.id, user.id):
+        return False
+    flood_detector.mute(message.chat.id, user.id, seconds)
+    try:
+        # Администраторов не ограничиваем
+        admins = await admin_cache.get_admins(message.bot, message.chat.id)
+        if user.id in admins:
+            flood_detector.unmute(message.chat.id, user.id)
+            return False
+        
+        await message.bot.restrict_chat_member(
+            message.chat.id,
+            user.id,
+            permissions=ChatPermissions(can_send_messages=False),
+            until_date=datetime.now() + timedelta(seconds=seconds),
+        )
+        
+        # Сохраняем действие в БД
+        action = BotAction(
+            action_type=ActionType.USER_MUTED,
+            user_id=user.id,
+            chat_id=message.chat.id,
+            username=user.username,
+            reason=reason
+        )
+        await db.save_action(action)
+        
+        logger.warning(
+            f"Пользователь {user.id} (@{user.username}) ограничен в чате {message.chat.id}: {reason}",
+            extra={"chat_id": message.chat.id, "user_id": user.id, "action_type": action.action_type},
+        )
+        await message.answer(f"🔇 {user.first_name} не может писать {seconds // 60} мин. {cause}.")
+        return True
+    except Exception as e:
+        flood_detector.unmute(message.chat.id, user.id)
+        logger.error(f"Ошибка при ограничении пользователя: {e}")
+        return False
+
+
+async def ban_user(message: Message, reason: str) -> bool:
+    """
+    Банит автора сообщения.
+    
+    Args:
+        message: Сообщение нарушителя
+        reason: Причина для истории действий
+    
+    Returns:
+        True если пользователь забанен
+    """
+    user = message.from_user
+    try:
+        admins = await admin_cache.get_admins(message.bot, message.chat.id)
+        if user.id in admins:
+            return False
+        
+        await message.bot.ban_chat_member(message.chat.id, user.id)
+        
+        action = BotAction(
+            action_type=ActionType.USER_BANNED,
+            user_id=user.id,
+            chat_id=message.chat.id,
+            username=user.username,
+            reason=reason
+        )
+        await db.save_action(action)
+        
+        logger.warning(
+            f"Пользователь {user.id} (@{user.username}) забанен в чате {message.chat.id}: {reason}",
+            extra={"chat_id": message.chat.id, "user_id": user.id, "action_type": action.action_type},
+        )
+        await message.answer(f"🚫 {user.first_name} забанен за нарушение правил чата.")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка при бане пользователя: {e}")
+        return False
+
+
+async def check_flood(message: Message) -> bool:
+    """
+    Учитывает сообщение в защите от флуда и ограничивает нарушителя.
+    
+    Args:
+        message: Сообщение в группе
+    
+    Returns:
+        True если пользователь превысил лимит и ограничен
+    """
+    if message.chat.type not in ["group", "supergroup"] or not message.from_user:
+        return False
+    
+    if not flood_detector.hit(message.chat.id, message.from_user.id):
+        return False
+    
+    return await mute_user(
+        message,
+        config.FLOOD_MUTE_SECONDS,
+        reason=f"Флуд: больше {flood_detector.limit} сообщений за {flood_detector.window:g} с",
+        cause="за флуд",
+    )
+
+
+async def check_duplicate(message: Message, policy: ChatPolicy) -> Optional[str]:
+    """
+    Проверяет, не повторяет ли сообщение недавние сообщения в чате или в других чатах.
+    
+    Args:
+        message: Текстовое сообщение в группе
+        policy: Политика чата с допустимым числом повторов
+    
+    Returns:
+        Причина удаления или None, если повторов допустимое количество
+        или автор - администратор
+    """
+    if message.chat.type not in ["group", "supergroup"]:
+        return None
+    if not policy.duplicate_chat_limit and not policy.duplicate_global_limit:
+        return None
+    
+    verdict = duplicate_detector.check(message.chat.id, message.text)
+    if verdict is None:
+        return None
+    
+    if policy.duplicate_chat_limit and verdict.in_chat >= policy.duplicate_chat_limit:
+        reason = f"Повторяющееся сообщение: {verdict.in_chat + 1}-й повтор в чате"
+    elif policy.duplicate_global_limit and verdict.global_count >= policy.duplicate_global_limit:
+        reason = f"Повторяющееся сообщение: {verdict.global_count + 1}-й повтор в разных чатах"
+    else:
+        return None
+    
+    # Объявления администраторов (в том числе разосланные по нескольким чатам) не удаляем
+    admins = await admin_cache.get_admins(message.bot, message.chat.id)
+    if message.from_user.id in admins:
+        return None
+    return reason
+
+
+async def apply_policy(message: Message, policy: ChatPolicy, reason: str, strike: bool = True):
+    """
+    Применяет к автору нарушения действие политики чата (сверх удаления сообщения).
+    
+    Args:
+        message: Сообщение нарушителя
+        policy: Политика чата
+        reason: Причина удаления
+        strike: Засчитывать ли нарушение для эскалации (иначе сообщение только удаляется)
+    """
+    if message.chat.type not in ["group", "supergroup"]:
+        return
+    
+    action_type = policy.action
+    if action_type == PolicyAction.ESCALATE:
+        if not strike:
+            return
+        # Наказание зависит от числа недавних нарушений пользователя в чате
+        strikes = await strike_ledger.add(message.chat.id, message.from_user.id)
+        action_type = strike_ledger.action_for(strikes)
+        reason = f"{reason} (нарушение №{strikes})"
+    
+    if action_type == PolicyAction.WARN:
+        action = BotAction(
+            action_type=ActionType.USER_WARNED,
+            user_id=message.from_user.id,
+            chat_id=message.chat.id,
+            username=message.from_user.username,
+            reason=reason
+        )
+        await db.save_action(action)
+    elif action_type == PolicyAction.MUTE:
+        await mute_user(message, policy.mute_seconds, reason, cause="за нарушение правил чата")
+    elif action_type == PolicyAction.BAN:
+        await ban_user(message, reason)
+
+
+async def count_rule_hits(matcher: MessageFilter, text: str):
+    """
+    Учитывает в метриках сработавшие правила.
+    
+    Правила ищутся только для удаляемых сообщений, поэтому проверка
+    чистых сообщений не дорожает; длинные тексты разбираются в пуле
+    проверки сообщений.
+    
+    Args:
+        matcher: Фильтр, заблокировавший сообщение
+        text: Текст сообщения
+    """
+    for rule in await filter_offloader.find_rules(matcher, text):
+        filter_rule_hits.inc(rule)
+
+
+@router.message(F.text, ~F.text.startswith("/"))
 async def handle_message(message: Message):
     """
     Обработчик всех текстовых сообщений.
-    Проверяет сообщения на наличие запрещённых слов.
+    Проверяет сообщения на флуд, запрещённые слова и повторы.
     """
-    # Пропускаем команды
-    if message.text and message.text.startswith("/"):
+    # Сообщение, на котором сработала защита от флуда, всё равно проверяется
+    # и при нарушении удаляется
+    await check_flood(message)
+    
+    # Проверяем сообщение на запрещённые слова, затем на повторы (волны спама)
+    policy = await policy_store.get_policy(message.chat.id)
+    matcher = await policy_store.get_matcher(policy)
+    started = time.perf_counter()
+    blocked = await filter_offloader.contains_bad_words(matcher, message.text)
+    filter_check_seconds.observe(time.perf_counter() - started)
+    if blocked:
+        reason = "Содержит нецензурные выражения"
+        await count_rule_hits(matcher, message.text)
+    else:
+        reason = await check_duplicate(message, policy)
+    if reason is None:
         return
     
-    # Проверяем сообщение на запрещённые слова
-    if message.text and message_filter.contains_bad_words(message.text):
-        try:
-            # Удаляем сообщение
-            await message.delete()
-            
-            # Сохраняем действие в БД
-            action = BotAction(
-                action_type=ActionType.MESSAGE_DELETED,
-                user_id=message.from_user.id,
-                chat_id=message.chat.id,
-                username=message.from_user.username,
-                message_text=message.text[:500],  # Ограничиваем длину
-                reason="Содержит нецензурные выражения"
-            )
-            await db.save_action(action)
-            
-            # Логируем
-            logger.warning(
-                f"Удалено сообщение от пользователя {message.from_user.id} "
-                f"(@{message.from_user.username}) в чате {message.chat.id}"
-            )
-            
-            # Опционально: отправляем предупреждение пользователю
-            try:
-                warning_text = (
-                    f"⚠️ {message.from_user.first_name}, ваше сообщение было удалено "
-                    f"за нарушение правил чата."
-                )
-                await message.answer(warning_text)
-            except Exception as e:
-                logger.debug(f"Не удалось отправить предупреждение: {e}")
-                
-        except TelegramBadRequest as e:
-            # Бот не может удалить сообщение (нет прав или сообщение уже удалено)
-            logger.warning(f"Не удалось удалить сообщение: {e}")
-        except Exception as e:
-            logger.error(f"Ошибка при обработке сообщения: {e}")
+    # Удаление выполняется пачкой для чата, действие сохраняется в БД после удаления,
+    # предупреждение отправляется одно на несколько нарушений
+    action = BotAction(
+        action_type=ActionType.MESSAGE_DELETED,
+        user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        username=message.from_user.username,
+        message_text=message.text[:500],  # Ограничиваем длину
+        reason=reason
+    )
+    moderation_queue.remove(message, action)
+    
+    logger.info(
+        f"Сообщение от пользователя {message.from_user.id} "
+        f"(@{message.from_user.username}) в чате {message.chat.id} поставлено на удаление: {reason}",
+        extra={"chat_id": action.chat_id, "user_id": action.user_id, "action_type": action.action_type},
+    )
+    
+    # Повторы (например, пересланное объявление) засчитываются для эскалации только по настройке
+    await apply_policy(message, policy, reason, strike=blocked or config.STRIKE_DUPLICATES)
+
+
+@router.message(~F.text)
+async def handle_other_message(message: Message):
+    """
+    Обработчик сообщений без текста (стикеры, медиа).
+    Учитывает их в защите от флуда.
+    """
+    await check_flood(message)
 
 
 @router.message(Command("ban"))
@@ -139,17 +365,18 @@ async def cmd_ban(message: Message):
         return
     
     try:
-        member = await message.bot.get_chat_member(message.chat.id, message.from_user.id)
-        if member.status not in ["administrator", "creator"]:
+        admins = await admin_cache.get_admins(message.bot, message.chat.id)
+        if message.from_user.id not in admins:
             await message.answer("❌ Только администраторы могут использовать эту команду.")
             return
     except Exception as e:
         logger.error(f"Ошибка при проверке прав администратора: {e}")
         return
     
-    # Получаем ID пользователя для бана (из ответа на сообщение или из аргумента)
+    # Получаем пользователя для бана (из ответа на сообщение или из аргумента)
     if message.reply_to_message:
         user_to_ban = message.reply_to_message.from_user
+        user_id = user_to_ban.id
     else:
         # Парсим аргумент команды
         args = message.text.split()[1:] if message.text else []
@@ -158,28 +385,35 @@ async def cmd_ban(message: Message):
             return
         try:
             user_id = int(args[0])
-            user_to_ban = await message.bot.get_chat_member(message.chat.id, user_id)
-            user_to_ban = user_to_ban.user
-        except Exception as e:
-            await message.answer(f"❌ Ошибка: {e}")
+        except ValueError:
+            await message.answer("❌ Ошибка: user_id должен быть числом.")
             return
+        # Данные пользователя не запрашиваем: ban_chat_member сам сообщит о неверном ID
+        user_to_ban = None
+    
+    if user_id in admins:
+        await message.answer("❌ Нельзя забанить администратора чата.")
+        return
+    
+    username = user_to_ban.username if user_to_ban else None
+    display_name = f"{user_to_ban.first_name} (@{username})" if user_to_ban else str(user_id)
     
     try:
         # Баним пользователя
-        await message.bot.ban_chat_member(message.chat.id, user_to_ban.id)
+        await message.bot.ban_chat_member(message.chat.id, user_id)
         
         # Сохраняем действие в БД
         action = BotAction(
             action_type=ActionType.USER_BANNED,
-            user_id=user_to_ban.id,
+            user_id=user_id,
             chat_id=message.chat.id,
-            username=user_to_ban.username,
+            username=username,
             reason=f"Забанен администратором {message.from_user.id}"
         )
         await db.save_action(action)
         
-        await message.answer(f"🚫 Пользователь {user_to_ban.first_name} (@{user_to_ban.username}) забанен.")
-        logger.info(f"Пользователь {user_to_ban.id} забанен в чате {message.chat.id}")
+        await message.answer(f"🚫 Пользователь {display_name} забанен.")
+        logger.info(f"Пользователь {user_id} забанен в чате {message.chat.id}")
         
     except Exception as e:
         logger.error(f"Ошибка при бане пользователя: {e}")
@@ -198,8 +432,8 @@ async def cmd_unban(message: Message):
         return
     
     try:
-        member = await message.bot.get_chat_member(message.chat.id, message.from_user.id)
-        if member.status not in ["administrator", "creator"]:
+        admins = await admin_cache.get_admins(message.bot, message.chat.id)
+        if message.from_user.id not in admins:
             await message.answer("❌ Только администраторы могут использовать эту команду.")
             return
     except Exception as e:
@@ -214,6 +448,9 @@ async def cmd_unban(message: Message):
     try:
         user_id = int(args[0])
         await message.bot.unban_chat_member(message.chat.id, user_id)
+        # После разбана эскалация начинается заново
+        await strike_ledger.reset(message.chat.id, user_id)
+        flood_detector.unmute(message.chat.id, user_id)
         
         # Сохраняем действие в БД
         action = BotAction(
@@ -231,3 +468,100 @@ async def cmd_unban(message: Message):
         logger.error(f"Ошибка при разбане пользователя: {e}")
         await message.answer(f"❌ Ошибка при разбане пользователя: {e}")
 
+
+def format_policy(policy: ChatPolicy) -> str:
+    """Описание политики чата для ответа на /policy."""
+    lexicons = ", ".join(policy.lexicons) if policy.lexicons else "по умолчанию"
+    return (
+        f"🛡️ Политика модерации чата:\n\n"
+        f"Словари: {lexicons}\n"
+        f"Действие при нарушении: {policy.action}\n"
+        f"Длительность мута: {policy.mute_seconds // 60} мин.\n"
+        f"Допустимо повторов: в чате {policy.duplicate_chat_limit or 'без ограничения'}, "
+        f"во всех чатах {policy.duplicate_global_limit or 'без ограничения'}"
+    )
+
+
+@router.message(Command("policy"))
+async def cmd_policy(message: Message):
+    """
+    Обработчик команды /policy - просмотр и изменение политики модерации чата.
+    Требует прав администратора.
+    """
+    if message.chat.type not in ["group", "supergroup"]:
+        await message.answer("❌ Эта команда работает только в группах.")
+        return
+    
+    try:
+        admins = await admin_cache.get_admins(message.bot, message.chat.id)
+        if message.from_user.id not in admins:
+            await message.answer("❌ Только администраторы могут использовать эту команду.")
+            return
+    except Exception as e:
+        logger.error(f"Ошибка при проверке прав администратора: {e}")
+        return
+    
+    chat_id = message.chat.id
+    args = message.text.split()[1:] if message.text else []
+    if not args:
+        await message.answer(format_policy(await policy_store.get_policy(chat_id)))
+        return
+    
+    usage = (
+        "❌ Использование:\n"
+        f"/policy action {'|'.join(POLICY_ACTIONS)}\n"
+        "/policy lexicons ru,spam (или default)\n"
+        "/policy mute [секунд]\n"
+        "/policy duplicates [в чате] [во всех чатах]"
+    )
+    setting, values = args[0].lower(), args[1:]
+    try:
+        if setting == "action" and len(values) == 1 and values[0] in POLICY_ACTIONS:
+            changes = {"action": values[0]}
+        elif setting == "lexicons" and len(values) == 1:
+            names = () if values[0] == "default" else parse_lexicon_names(values[0])
+            unknown = [name for name in names if name not in lexicon_store.sets]
+            if unknown:
+                await message.answer(
+                    f"❌ Нет наборов словарей: {', '.join(unknown)}. "
+                    f"Доступны: {', '.join(lexicon_store.sets) or 'нет'}"
+                )
+                return
+            changes = {"lexicons": ",".join(names) or None}
+        elif setting == "mute" and len(values) == 1:
+            changes = {"mute_seconds": max(60, int(values[0]))}
+        elif setting == "duplicates" and len(values) == 2:
+            changes = {
+                "duplicate_chat_limit": max(0, int(values[0])),
+                "duplicate_global_limit": max(0, int(values[1])),
+            }
+        else:
+            await message.answer(usage)
+            return
+    except ValueError:
+        await message.answer(usage)
+        return
+    
+    if not await db.save_chat_policy(chat_id, changes):
+        await message.answer("❌ Ошибка при сохранении политики.")
+        return
+    
+    policy_store.invalidate(chat_id)
+    await message.answer(format_policy(await policy_store.get_policy(chat_id)))
+    logger.info(f"Политика чата {chat_id} изменена администратором {message.from_user.id}: {changes}")
+
+
+@router.chat_member()
+async def on_chat_member_updated(event: ChatMemberUpdated):
+    """
+    Обработчик изменения статуса участника чата.
+    Сбрасывает кэш администраторов, если участник получил или потерял права.
+    """
+    was_admin = event.old_chat_member.status in ADMIN_STATUSES
+    is_admin = event.new_chat_member.status in ADMIN_STATUSES
+    if was_admin or is_admin:
+        admin_cache.invalidate(event.chat.id)
+        logger.info(
+            f"Изменились права пользователя {event.new_chat_member.user.id} "
+            f"в чате {event.chat.id}, кэш администраторов сброшен"
+        )
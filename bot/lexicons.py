@@ -0,0 +1,451 @@
+"""
+МОДУЛЬ: Внешние словари фильтра
+Загружает наборы слов и регулярных выражений из файлов (по набору на язык
+или на чат), кэширует скомпилированный фильтр на диске (JSON) и перезагружает
+наборы при изменении файлов без перезапуска бота.
+Использует bot/filters.py; наблюдение за файлами запускается из bot/main.py.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from bot.config import config
+from bot.filters import MessageFilter, message_filter
+from bot.logger import logger
+from bot.matching import AhoCorasick
+
+
+# Версия формата кэша: увеличивается при изменении MessageFilter и движков поиска,
+# после чего старые файлы кэша пересоздаются
+CACHE_VERSION = 2
+
+# Расширение файлов кэша
+CACHE_SUFFIX = ".json"
+
+# Расширение файлов наборов
+LEXICON_SUFFIX = ".txt"
+
+# Префикс имени набора для отдельного чата: chat_-100123456.txt
+CHAT_SET_PREFIX = "chat_"
+
+
+@dataclass
+class Lexicon:
+    """Содержимое файла набора правил."""
+    
+    words: List[str] = field(default_factory=list)
+    removed_words: List[str] = field(default_factory=list)
+    patterns: List[str] = field(default_factory=list)
+
+
+def parse_lexicon(text: str, source: str = "") -> Lexicon:
+    """
+    Разбирает файл набора правил.
+    
+    Формат - одно правило в строке: слово или фраза добавляется в словарь,
+    "-слово" удаляет слово базовых правил, "re:выражение" добавляет регулярное
+    выражение. Пустые строки и строки, начинающиеся с #, пропускаются.
+    
+    Args:
+        text: Содержимое файла
+        source: Имя файла для сообщений об ошибках
+    
+    Returns:
+        Разобранный набор правил
+    """
+    lexicon = Lexicon()
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("re:"):
+            pattern = line[3:].strip()
+            try:
+                re.compile(pattern, re.IGNORECASE)
+            except re.error as e:
+                logger.error(f"{source}:{line_no}: неверное регулярное выражение {pattern!r}: {e}")
+                continue
+            lexicon.patterns.append(pattern)
+        elif line.startswith("-"):
+            lexicon.removed_words.append(line[1:].strip())
+        else:
+            lexicon.words.append(line)
+    return lexicon
+
+
+def build_filter(lexicon: Lexicon, base: Optional[Lexicon] = None) -> MessageFilter:
+    """
+    Создаёт фильтр: базовые правила, изменённые набором.
+    
+    Args:
+        lexicon: Набор правил
+        base: Базовые правила (None - правила по умолчанию из bot/filters.py)
+    
+    Returns:
+        Фильтр (движки поиска ещё не скомпилированы)
+    """
+    if base is None:
+        lexicon_filter = MessageFilter()
+    else:
+        lexicon_filter = MessageFilter(words=base.words, patterns=base.patterns)
+    for word in lexicon.removed_words:
+        lexicon_filter.remove_word(word)
+    for word in lexicon.words:
+        lexicon_filter.add_word(word)
+    for pattern in lexicon.patterns:
+        lexicon_filter.add_pattern(pattern)
+    return lexicon_filter
+
+
+def rules_digest(lexicon_filter: MessageFilter) -> str:
+    """
+    Вычисляет хеш итогового набора правил фильтра.
+    
+    Учитываются и базовые правила, поэтому кэш устаревает
+    при их изменении.
+    
+    Args:
+        lexicon_filter: Фильтр
+    
+    Returns:
+        Шестнадцатеричный SHA-256
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{CACHE_VERSION}:".encode())
+    for word in sorted(lexicon_filter.bad_words):
+        digest.update(b"w" + word.encode("utf-8") + b"\0")
+    for pattern in lexicon_filter.patterns:
+        digest.update(b"p" + f"{pattern.flags}:{pattern.pattern}".encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir: str, digest: str) -> Path:
+    """Путь к файлу кэша для набора правил с указанным хешем."""
+    return Path(cache_dir) / f"v{CACHE_VERSION}-{digest[:32]}{CACHE_SUFFIX}"
+
+
+def merge_lexicons(lexicons: List[Lexicon]) -> Lexicon:
+    """
+    Объединяет несколько наборов правил в один.
+    
+    Args:
+        lexicons: Наборы правил
+    
+    Returns:
+        Набор со словами, удалениями и выражениями всех наборов
+    """
+    merged = Lexicon()
+    for lexicon in lexicons:
+        merged.words.extend(lexicon.words)
+        merged.removed_words.extend(lexicon.removed_words)
+        merged.patterns.extend(lexicon.patterns)
+    return merged
+
+
+def compile_filter(
+    lexicon: Lexicon,
+    cache_dir: Optional[str],
+    base: Optional[Lexicon] = None,
+) -> Tuple[MessageFilter, bool]:
+    """
+    Создаёт фильтр и компилирует его, используя дисковый кэш.
+    
+    Выполняется в отдельном потоке: построение автомата для большого
+    словаря занимает заметное время.
+    
+    Args:
+        lexicon: Набор правил
+        cache_dir: Каталог кэша (None - без кэша)
+        base: Базовые правила (None - правила по умолчанию из bot/filters.py)
+    
+    Returns:
+        Готовый фильтр и признак того, что он загружен из кэша
+    """
+    lexicon_filter = build_filter(lexicon, base)
+    return lexicon_filter, load_compiled(lexicon_filter, cache_dir)
+
+
+def load_compiled(lexicon_filter: MessageFilter, cache_dir: Optional[str], digest: Optional[str] = None) -> bool:
+    """
+    Компилирует движки поиска фильтра или загружает их из дискового кэша.
+    
+    Кэш хранит автомат по словам в JSON (pickle при загрузке может выполнить
+    произвольный код). Файл с другой версией формата или другим хешем правил,
+    а также повреждённый файл пересоздаются; регулярные выражения
+    компилируются заново.
+    
+    Args:
+        lexicon_filter: Фильтр (build_filter)
+        cache_dir: Каталог кэша (None - без кэша)
+        digest: Уже вычисленный rules_digest фильтра
+    
+    Returns:
+        True если движки загружены из кэша
+    """
+    if not cache_dir:
+        lexicon_filter.export_compiled()
+        return False
+    
+    digest = digest or rules_digest(lexicon_filter)
+    path = cache_path(cache_dir, digest)
+    
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") == CACHE_VERSION and cached.get("digest") == digest:
+            lexicon_filter.import_compiled(AhoCorasick.from_data(cached["automaton"]))
+            return True
+        logger.warning(f"Кэш словаря {path} создан для других правил и будет пересоздан")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Кэш словаря {path} повреждён и будет пересоздан: {e}")
+    
+    automaton = lexicon_filter.export_compiled()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Запись во временный файл и переименование: другие процессы
+        # не прочитают недописанный кэш
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": CACHE_VERSION, "digest": digest, "automaton": automaton.to_data()},
+                f, ensure_ascii=False, separators=(",", ":"),
+            )
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить кэш словаря {path}: {e}")
+    return False
+
+
+class LexiconStore:
+    """
+    Наборы правил из каталога словарей.
+    
+    Каждый файл <имя>.txt - отдельный набор. Набор default_set задаёт базовые
+    правила, остальные наборы дополняют их; если его файла нет, базовые правила -
+    правила по умолчанию из bot/filters.py. Набор chat_<chat_id> применяется
+    в своём чате, остальные чаты используют набор default_set (или встроенный
+    фильтр). Изменённые файлы перекомпилируются в потоке, после чего фильтр набора
+    заменяется одной операцией присваивания: уже начатые проверки завершаются
+    со старым фильтром. При изменении набора default_set пересобираются все наборы.
+    """
+    
+    def __init__(self, directory: str, cache_dir: Optional[str], default_set: str, reload_interval: float):
+        """
+        Args:
+            directory: Каталог файлов наборов
+            cache_dir: Каталог кэша скомпилированных фильтров (None - без кэша)
+            default_set: Имя набора по умолчанию
+            reload_interval: Период проверки изменений в секундах (0 - не отслеживать)
+        """
+        self.directory = Path(directory)
+        self.cache_dir = cache_dir
+        self.default_set = default_set
+        self.reload_interval = reload_interval
+        # Имя набора -> фильтр; словарь заменяется целиком при перезагрузке
+        self._filters: Dict[str, MessageFilter] = {}
+        # Имя набора -> разобранные правила (для объединения наборов в политиках чатов)
+        self._lexicons: Dict[str, Lexicon] = {}
+        # Базовые правила из файла набора default_set (None - файла нет)
+        self.base: Optional[Lexicon] = None
+        # Номер версии наборов, увеличивается при каждом изменении
+        self.generation = 0
+        # Имя набора -> (mtime_ns, размер) загруженного файла
+        self._versions: Dict[str, Tuple[int, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def sets(self) -> List[str]:
+        """Имена загруженных наборов."""
+        return sorted(self._filters)
+    
+    def get_set(self, name: str) -> Optional[MessageFilter]:
+        """
+        Возвращает фильтр набора по имени.
+        
+        Args:
+            name: Имя набора
+        
+        Returns:
+            Фильтр или None, если набор не загружен
+        """
+        return self._filters.get(name)
+    
+    def get_lexicon(self, name: str) -> Optional[Lexicon]:
+        """
+        Возвращает разобранные правила набора (сверх базовых правил).
+        
+        Args:
+            name: Имя набора
+        
+        Returns:
+            Правила или None, если набор не загружен; для набора default_set -
+            пустой набор, его правила - базовые (base)
+        """
+        return self._lexicons.get(name)
+    
+    def get_filter(self, chat_id: int) -> MessageFilter:
+        """
+        Возвращает фильтр для чата.
+        
+        Args:
+            chat_id: ID чата
+        
+        Returns:
+            Фильтр набора чата, набора по умолчанию или встроенный фильтр
+        """
+        filters = self._filters
+        return (
+            filters.get(f"{CHAT_SET_PREFIX}{chat_id}")
+            or filters.get(self.default_set)
+            or message_filter
+        )
+    
+    def _scan_files(self) -> Dict[str, Tuple[Path, Tuple[int, int]]]:
+        """Возвращает файлы наборов с их версиями (mtime, размер)."""
+        files = {}
+        if not self.directory.is_dir():
+            return files
+        for path in self.directory.glob(f"*{LEXICON_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files[path.stem] = (path, (stat.st_mtime_ns, stat.st_size))
+        return files
+    
+    def _load_changed(self) -> Tuple[dict, dict, dict, Optional[Lexicon], List[str]]:
+        """
+        Компилирует изменённые наборы (выполняется в отдельном потоке).
+        
+        Returns:
+            Новые фильтры, правила и версии файлов наборов, базовые правила
+            и описание изменений для лога
+        """
+        files = self._scan_files()
+        filters = dict(self._filters)
+        lexicons = dict(self._lexicons)
+        versions = dict(self._versions)
+        base = self.base
+        changes = []
+        
+        for name in set(filters) - set(files):
+            del filters[name]
+            del lexicons[name]
+            del versions[name]
+            changes.append(f"{name} удалён")
+        
+        # Набор по умолчанию - базовые правила остальных наборов:
+        # после его изменения пересобираются все наборы
+        rebuild = False
+        default = files.pop(self.default_set, None)
+        if default is None:
+            rebuild = base is not None
+            base = None
+        elif versions.get(self.default_set) != default[1]:
+            path, version = default
+            try:
+                loaded = parse_lexicon(path.read_text(encoding="utf-8"), str(path))
+                filters[self.default_set], cached = compile_filter(Lexicon(), self.cache_dir, loaded)
+            except Exception as e:
+                logger.error(f"Не удалось загрузить словарь {path}: {e}")
+            else:
+                base = loaded
+                lexicons[self.default_set] = Lexicon()
+                versions[self.default_set] = version
+                rebuild = True
+                changes.append(self._describe(self.default_set, filters[self.default_set], cached))
+        
+        for name, (path, version) in files.items():
+            unchanged = versions.get(name) == version
+            if unchanged and not rebuild:
+                continue
+            try:
+                lexicon = lexicons[name] if unchanged else parse_lexicon(path.read_text(encoding="utf-8"), str(path))
+                filters[name], cached = compile_filter(lexicon, self.cache_dir, base)
+            except Exception as e:
+                logger.error(f"Не удалось загрузить словарь {path}: {e}")
+                continue
+            lexicons[name] = lexicon
+            versions[name] = version
+            changes.append(self._describe(name, filters[name], cached))
+        
+        if changes and self.cache_dir:
+            self._prune_cache(filters)
+        
+        return filters, lexicons, versions, base, changes
+    
+    @staticmethod
+    def _describe(name: str, lexicon_filter: MessageFilter, cached: bool) -> str:
+        """Описание загруженного набора для лога."""
+        return (
+            f"{name}: {len(lexicon_filter.bad_words)} слов, "
+            f"{len(lexicon_filter.patterns)} выражений{' (из кэша)' if cached else ''}"
+        )
+    
+    def _prune_cache(self, filters: Dict[str, MessageFilter]):
+        """Удаляет файлы кэша, не относящиеся к загруженным наборам, и кэш старого формата."""
+        used = {cache_path(self.cache_dir, rules_digest(f)).name for f in filters.values()}
+        for pattern in (f"*{CACHE_SUFFIX}", "*.pickle"):
+            for path in Path(self.cache_dir).glob(pattern):
+                if path.name not in used:
+                    path.unlink(missing_ok=True)
+    
+    async def reload(self) -> int:
+        """
+        Перезагружает изменённые, новые и удалённые наборы.
+        
+        Returns:
+            Количество изменившихся наборов
+        """
+        filters, lexicons, versions, base, changes = await asyncio.to_thread(self._load_changed)
+        if changes:
+            # Подмена одной ссылкой: параллельные проверки видят либо старые,
+            # либо новые наборы целиком
+            self._filters = filters
+            self._lexicons = lexicons
+            self._versions = versions
+            self.base = base
+            self.generation += 1
+            logger.info(f"Словари фильтра обновлены: {'; '.join(changes)}")
+        return len(changes)
+    
+    def start(self):
+        """Запускает отслеживание изменений файлов в текущем event loop."""
+        if self.reload_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает отслеживание изменений."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        """Цикл: проверка изменений раз в reload_interval секунд."""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Ошибка при перезагрузке словарей: {e}")
+
+
+# Глобальный экземпляр хранилища словарей
+lexicon_store = LexiconStore(
+    directory=config.LEXICON_DIR,
+    cache_dir=config.LEXICON_CACHE_DIR or None,
+    default_set=config.LEXICON_DEFAULT,
+    reload_interval=config.LEXICON_RELOAD_SECONDS,
+)
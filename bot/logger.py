@@ -1,61 +1,216 @@
 """
 МОДУЛЬ: Логирование
 Настройка системы логирования для бота.
+Записи передаются через очередь фоновому потоку (QueueHandler/QueueListener),
+поэтому вызовы logger в обработчиках не ждут записи на диск и в консоль.
+Файл логов ротируется по размеру или по времени, доступен формат JSON.
 Независимый модуль - может использоваться в любом месте проекта.
 """
 
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import random
 import sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from bot.config import config
 
 
+# Поля контекста, которые передаются через extra и попадают в JSON
+CONTEXT_FIELDS = ("chat_id", "user_id", "action_type")
+
+# Фоновые потоки записи по имени логгера: (PID создавшего процесса, поток записи)
+_listeners: Dict[str, Tuple[int, QueueListener]] = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись одной строкой JSON с полями контекста."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает только долю записей DEBUG; остальные уровни проходят всегда."""
+    
+    def __init__(self, rate: float):
+        """
+        Args:
+            rate: Доля записей DEBUG, которые попадут в лог (от 0 до 1)
+        """
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler с ограниченной очередью.
+    
+    При заполненной очереди запись отбрасывается, а не блокирует
+    вызывающий код; количество отброшенных записей - в dropped.
+    """
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются сразу (они могут измениться позже),
+        # исключение форматирует обработчик в фоновом потоке
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _create_file_handler(log_file_path: str) -> logging.Handler:
+    """Создаёт обработчик файла с ротацией по LOG_ROTATE_WHEN или LOG_MAX_BYTES."""
+    if config.LOG_ROTATE_WHEN:
+        return TimedRotatingFileHandler(
+            log_file_path,
+            when=config.LOG_ROTATE_WHEN,
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    return RotatingFileHandler(
+        log_file_path,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+
+
+def worker_log_file(log_file: str, worker_index: int) -> str:
+    """
+    Возвращает файл логов процесса-обработчика webhook.
+    
+    Процессы пишут в отдельные файлы, чтобы ротация одного
+    не мешала остальным.
+    
+    Args:
+        log_file: Файл логов основного процесса
+        worker_index: Номер процесса (0 - основной)
+    
+    Returns:
+        Путь вида logs/bot.1.log
+    """
+    if worker_index == 0 or not log_file:
+        return log_file
+    path = Path(log_file)
+    return str(path.with_name(f"{path.stem}.{worker_index}{path.suffix}"))
+
+
 def setup_logger(name: str = "bot", log_file: Optional[str] = None) -> logging.Logger:
     """
     Настраивает и возвращает логгер.
     
+    Повторный вызов для того же имени останавливает прежний поток записи
+    и заменяет обработчики; сам объект логгера не меняется.
+    
     Args:
         name: Имя логгера
-        log_file: Путь к файлу логов (если None, используется из config)
-        
+        log_file: Путь к файлу логов (если None, используется из config;
+            пустая строка - только консоль)
+    
     Returns:
         Настроенный логгер
     """
     logger = logging.getLogger(name)
     logger.setLevel(getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
     
-    # Очищаем существующие обработчики
+    # Останавливаем прежний поток записи и очищаем существующие обработчики
+    # (после fork поток записи родителя в процессе отсутствует, его не ждём)
+    previous = _listeners.pop(name, None)
+    if previous is not None and previous[0] == os.getpid():
+        _stop_listener(previous[1])
     logger.handlers.clear()
     
     # Формат логов
-    formatter = logging.Formatter(
-        "[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
+    if config.LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
     
     # Обработчик для консоли
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # Обработчик для файла
-    log_file_path = log_file or config.LOG_FILE
+    log_file_path = config.LOG_FILE if log_file is None else log_file
+    if log_file_path:
+        # Создаём директорию для логов если её нет
+        log_path = Path(log_file_path)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        file_handler = _create_file_handler(log_file_path)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
     
-    # Создаём директорию для логов если её нет
-    log_path = Path(log_file_path)
-    log_path.parent.mkdir(parents=True, exist_ok=True)
+    # Логгер только ставит запись в очередь; запись выполняет фоновый поток
+    log_queue = queue.Queue(maxsize=max(0, config.LOG_QUEUE_SIZE))
+    queue_handler = DroppingQueueHandler(log_queue)
+    if config.LOG_DEBUG_SAMPLE_RATE < 1:
+        queue_handler.addFilter(DebugSampler(config.LOG_DEBUG_SAMPLE_RATE))
+    logger.addHandler(queue_handler)
     
-    file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-    file_handler.setLevel(logging.DEBUG)
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[name] = (os.getpid(), listener)
     
     return logger
 
 
+def _stop_listener(listener: QueueListener):
+    """Дописывает записи из очереди, останавливает поток записи и закрывает файлы."""
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+def stop_logging():
+    """Дописывает записи из очередей и останавливает потоки записи текущего процесса."""
+    for name in list(_listeners):
+        pid, listener = _listeners.pop(name)
+        if pid == os.getpid():
+            _stop_listener(listener)
+
+
+atexit.register(stop_logging)
+
+
 # Глобальный логгер
 logger = setup_logger()
-
@@ -5,8 +5,10 @@
 """
 
 import asyncio
+import multiprocessing
 import signal
 import sys
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -14,16 +16,34 @@ from aiogram.enums import ParseMode
 from bot.config import config
 from bot.database import db
 from bot.handlers import router
-from bot.logger import logger
+from bot.filters import message_filter
+from bot.lexicons import lexicon_store
+from bot.logger import logger, setup_logger, worker_log_file
+from bot.metrics import api_metrics, handler_metrics, metrics, metrics_server
+from bot.offload import filter_offloader, loop_lag_monitor
+from bot.outbound import moderation_queue, rate_limiter
+from bot.retention import RetentionJob
+from bot.scheduler import update_scheduler
+from bot.spool import worker_spool_dir
+from bot.strikes import strike_ledger
+from bot.webhook import create_webhook_app
 
 
 # Глобальные переменные для graceful shutdown
 bot: Bot = None
 dp: Dispatcher = None
+retention_job: RetentionJob = None
 
 
-async def on_startup():
-    """Выполняется при запуске бота."""
+async def on_startup(worker_index: int = 0):
+    """
+    Выполняется при запуске бота.
+    
+    Args:
+        worker_index: Номер процесса-обработчика в режиме webhook (0 - основной)
+    """
+    global retention_job
+    
     logger.info("=" * 50)
     logger.info("Запуск Telegram-бота модератора")
     logger.info("=" * 50)
@@ -32,17 +52,170 @@ async def on_startup():
     try:
         await db.connect()
         logger.info("Подключение к БД успешно установлено")
+        
+        # Обслуживание секций bot_actions (создание новых, архивирование старых),
+        # при нескольких процессах - только в основном; секции есть только в MySQL
+        if worker_index == 0 and db.backend == "mysql":
+            retention_job = RetentionJob(
+                db,
+                retention_months=config.RETENTION_MONTHS,
+                archive_dir=config.ARCHIVE_DIR or None,
+                interval=config.RETENTION_INTERVAL_HOURS * 3600,
+            )
+            retention_job.start()
     except Exception as e:
         logger.error(f"Ошибка подключения к БД: {e}")
-        logger.error("Бот будет работать без сохранения в БД")
+        if not config.SPOOL_DIR:
+            logger.error("Бот будет работать без сохранения в БД")
+    
+    # Локальный журнал действий на время сбоев БД; у процессов webhook свои каталоги
+    if config.SPOOL_DIR:
+        try:
+            await db.start_spool(worker_spool_dir(config.SPOOL_DIR, worker_index))
+        except Exception as e:
+            logger.error(f"Не удалось открыть локальный журнал действий: {e}")
+    
+    # Словари фильтра из LEXICON_DIR и отслеживание их изменений
+    try:
+        await lexicon_store.reload()
+    except Exception as e:
+        logger.error(f"Ошибка загрузки словарей фильтра: {e}")
+    lexicon_store.start()
+    
+    # Пул проверки длинных сообщений с заранее созданными фильтрами наборов
+    filter_offloader.start([message_filter] + [lexicon_store.get_set(name) for name in lexicon_store.sets])
+    loop_lag_monitor.start()
+    
+    # Периодическая запись счётчиков нарушений в user_strikes
+    strike_ledger.start()
+    
+    update_scheduler.start()
+    
+    # HTTP-сервер метрик; процессы webhook слушают соседние порты
+    if config.METRICS_PORT > 0:
+        register_runtime_metrics()
+        try:
+            await metrics_server.start(config.METRICS_HOST, config.METRICS_PORT + worker_index)
+        except Exception as e:
+            logger.error(f"Не удалось запустить сервер метрик: {e}")
     
     logger.info("Бот успешно запущен и готов к работе")
 
 
+def register_runtime_metrics():
+    """Регистрирует показатели, которые читаются из состояния модулей при сборе метрик."""
+    metrics.gauge(
+        "db_pool_connections", "Соединения пула БД", db.pool_usage, labels=("state",),
+    )
+    metrics.gauge(
+        "db_write_queue_depth", "Действия в очереди отложенной записи",
+        lambda: db.writer.queue_depth if db.writer else None,
+    )
+    def per_worker(field: str):
+        """Поле статистики каждого воркера планировщика по номеру воркера."""
+        return lambda: {str(index): getattr(stats, field) for index, stats in enumerate(update_scheduler.stats)}
+    
+    metrics.gauge(
+        "updates_processed_total", "Обработано обновлений воркером планировщика",
+        per_worker("processed"), labels=("worker",), kind="counter",
+    )
+    metrics.gauge(
+        "updates_failed_total", "Обновления, обработчик которых завершился исключением",
+        per_worker("failed"), labels=("worker",), kind="counter",
+    )
+    metrics.gauge(
+        "update_wait_seconds_total", "Суммарное ожидание обновлений в очереди чата",
+        per_worker("wait_seconds"), labels=("worker",), kind="counter",
+    )
+    metrics.gauge(
+        "update_handle_seconds_total", "Суммарное время обработки обновлений",
+        per_worker("handle_seconds"), labels=("worker",), kind="counter",
+    )
+    metrics.gauge(
+        "update_handle_max_seconds", "Максимальное время обработки обновления",
+        per_worker("max_handle_seconds"), labels=("worker",),
+    )
+    metrics.gauge(
+        "updates_in_flight", "Обновления, принятые в обработку", lambda: update_scheduler.in_flight,
+    )
+    metrics.gauge(
+        "scheduler_chats", "Чаты с необработанными обновлениями и ожидающие свободного воркера",
+        lambda: {"active": update_scheduler.active_chats, "ready": update_scheduler.ready_chats},
+        labels=("state",),
+    )
+    metrics.gauge(
+        "filter_checks_total", "Проверки фильтром по месту выполнения",
+        lambda: {"inline": filter_offloader.inline_checks, "offloaded": filter_offloader.offloaded_checks},
+        labels=("mode",), kind="counter",
+    )
+    metrics.gauge(
+        "loop_lag_seconds", "Последняя замеренная задержка event loop", lambda: loop_lag_monitor.last,
+    )
+    metrics.gauge(
+        "telegram_throttled_total", "Запросы к Telegram API, задержанные ограничителем",
+        lambda: rate_limiter.throttled, kind="counter",
+    )
+    metrics.gauge(
+        "spool_pending_actions", "Действия в локальном журнале, ожидающие переноса в БД",
+        lambda: db.spool.pending if db.spool else None,
+    )
+    metrics.gauge(
+        "spool_actions_total", "Действия, записанные в локальный журнал и перенесённые из него",
+        lambda: {"spooled": db.spool.stats.spooled, "replayed": db.spool.stats.replayed} if db.spool else None,
+        labels=("event",), kind="counter",
+    )
+    metrics.gauge(
+        "strikes_pending_writes", "Счётчики нарушений, ожидающие записи", lambda: strike_ledger.pending_writes,
+    )
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    """Регистрирует адрес webhook в Telegram (выполняется основным процессом)."""
+    url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+    try:
+        await bot.set_webhook(
+            url=url,
+            secret_token=config.WEBHOOK_SECRET or None,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+        logger.info(f"Webhook установлен: {url}")
+    except Exception as e:
+        logger.error(f"Не удалось установить webhook {url}: {e}")
+
+
 async def on_shutdown():
     """Выполняется при остановке бота."""
     logger.info("Остановка бота...")
     
+    # Дожидаемся обработки уже принятых обновлений
+    await update_scheduler.stop()
+    
+    # Удаляем накопленные нарушения и отправляем отложенные предупреждения
+    try:
+        await moderation_queue.flush()
+    except Exception as e:
+        logger.error(f"Ошибка при обработке очереди удаления: {e}")
+    
+    await metrics_server.stop()
+    await lexicon_store.stop()
+    await filter_offloader.stop()
+    await loop_lag_monitor.stop()
+    
+    if retention_job:
+        await retention_job.stop()
+    
+    # Записываем изменённые счётчики нарушений, пока пул соединений открыт
+    try:
+        await strike_ledger.stop()
+    except Exception as e:
+        logger.error(f"Ошибка при записи счётчиков нарушений: {e}")
+    
+    # Дописываем в БД действия, накопленные в очереди отложенной записи
+    try:
+        await db.flush()
+    except Exception as e:
+        logger.error(f"Ошибка при записи очереди действий в БД: {e}")
+    
     # Закрываем подключение к БД
     try:
         await db.disconnect()
@@ -61,22 +234,35 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-async def main():
-    """Главная функция запуска бота."""
-    global bot, dp
-    
-    # Регистрируем обработчики сигналов
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
-    # Инициализируем бота
+def create_bot() -> Bot:
+    """Создаёт экземпляр бота."""
     bot = Bot(
         token=config.BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    # Ограничение частоты запросов и повтор после flood control
+    bot.session.middleware(rate_limiter)
+    # Регистрируется после ограничителя: замеряется каждая попытка запроса
+    bot.session.middleware(api_metrics)
+    return bot
+
+
+def create_dispatcher(worker_index: int = 0) -> Dispatcher:
+    """
+    Создаёт диспетчер с роутером и функциями startup/shutdown.
+    
+    Args:
+        worker_index: Номер процесса-обработчика, передаётся в on_startup
+    """
+    dp = Dispatcher(worker_index=worker_index)
+    
+    # Параллельная обработка разных чатов с сохранением порядка внутри чата.
+    # Регистрируется после встроенных middleware, заполняющих event_chat.
+    dp.update.outer_middleware(update_scheduler)
     
-    # Инициализируем диспетчер
-    dp = Dispatcher()
+    # Длительность обработчиков для метрик
+    router.message.middleware(handler_metrics)
+    router.chat_member.middleware(handler_metrics)
     
     # Регистрируем роутер с обработчиками
     dp.include_router(router)
@@ -85,10 +271,34 @@ async def main():
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
+    return dp
+
+
+async def main():
+    """Главная функция запуска бота в режиме polling."""
+    global bot, dp
+    
+    # Регистрируем обработчики сигналов
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    # Инициализируем бота и диспетчер
+    bot = create_bot()
+    dp = create_dispatcher()
+    
     try:
+        # Webhook и getUpdates взаимоисключающие: снимаем webhook, если он был установлен
+        await bot.delete_webhook()
+        
         # Запускаем polling
         logger.info("Начинаем polling...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        # С планировщиком обновления передаются ему по порядку, без отдельных задач:
+        # при заполненных очередях polling ждёт
+        await dp.start_polling(
+            bot,
+            allowed_updates=dp.resolve_used_update_types(),
+            handle_as_tasks=not update_scheduler.workers,
+        )
     except Exception as e:
         logger.error(f"Критическая ошибка при работе бота: {e}")
         raise
@@ -97,12 +307,98 @@ async def main():
         await bot.session.close()
 
 
+async def serve_webhook(worker_index: int = 0):
+    """
+    Запускает aiohttp-сервер, принимающий обновления через webhook.
+    
+    Args:
+        worker_index: Номер процесса-обработчика (0 - основной, он же регистрирует webhook)
+    """
+    global bot, dp
+    
+    bot = create_bot()
+    dp = create_dispatcher(worker_index)
+    if worker_index == 0:
+        dp.startup.register(set_webhook)
+    
+    app = create_webhook_app(
+        bot,
+        dp,
+        path=config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET or None,
+    )
+    
+    # Останавливаемся по SIGINT/SIGTERM (на Windows - по KeyboardInterrupt)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        # При нескольких процессах все слушают один порт, ядро распределяет соединения
+        site = web.TCPSite(
+            runner,
+            host=config.WEBHOOK_HOST,
+            port=config.WEBHOOK_PORT,
+            reuse_port=config.WEBHOOK_WORKERS > 1,
+        )
+        await site.start()
+        logger.info(
+            f"Процесс {worker_index} принимает обновления на "
+            f"{config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+        )
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+
+
+def _run_webhook_worker(worker_index: int):
+    """Точка входа дополнительного процесса-обработчика."""
+    # Свой поток записи логов (поток родителя не переживает fork) и свой файл для ротации
+    setup_logger(log_file=worker_log_file(config.LOG_FILE, worker_index))
+    try:
+        asyncio.run(serve_webhook(worker_index))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_webhook():
+    """Запускает режим webhook в WEBHOOK_WORKERS процессах."""
+    workers = max(1, config.WEBHOOK_WORKERS)
+    if workers > 1 and sys.platform == "win32":
+        logger.warning("Несколько процессов webhook не поддерживаются на Windows, запускается один")
+        workers = 1
+    
+    # Не daemon: процессы-обработчики запускают свои пулы процессов (FILTER_EXECUTOR=process),
+    # а daemon-процессу создавать дочерние нельзя; останавливаются явно в finally
+    processes = [
+        multiprocessing.Process(target=_run_webhook_worker, args=(index,), daemon=False)
+        for index in range(1, workers)
+    ]
+    for process in processes:
+        process.start()
+    
+    try:
+        asyncio.run(serve_webhook(0))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if config.BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Получено прерывание от пользователя")
     except Exception as e:
         logger.error(f"Критическая ошибка: {e}")
         sys.exit(1)
-
@@ -0,0 +1,144 @@
+"""
+МОДУЛЬ: Обслуживание базы данных
+Команды для ручного запуска: python -m bot.maintenance <команда>
+Использует bot/database.py для выполнения операций.
+"""
+
+import argparse
+import asyncio
+import sys
+
+from bot.database import db
+from bot.logger import logger
+from bot.config import config
+from bot.migrations import apply_migrations
+from bot.retention import RetentionJob, partition_table
+
+
+async def backfill_counters() -> int:
+    """
+    Заполняет таблицы счётчиков по существующим строкам bot_actions.
+    
+    Returns:
+        Код возврата процесса
+    """
+    try:
+        await db.connect()
+        rows = await db.rebuild_counters()
+        logger.info(f"Счётчики пересчитаны: {rows} пар (чат, тип действия)")
+        return 0
+    except Exception as e:
+        logger.error(f"Ошибка при пересчёте счётчиков: {e}")
+        return 1
+    finally:
+        await db.disconnect()
+
+
+async def migrate() -> int:
+    """
+    Применяет миграции схемы БД.
+    
+    Returns:
+        Код возврата процесса
+    """
+    try:
+        await db.connect()
+        applied = await apply_migrations(db)
+        logger.info(f"Применено миграций: {applied}")
+        return 0
+    except Exception as e:
+        logger.error(f"Ошибка при применении миграций: {e}")
+        return 1
+    finally:
+        await db.disconnect()
+
+
+async def partition() -> int:
+    """
+    Переводит bot_actions на помесячное секционирование.
+    
+    Returns:
+        Код возврата процесса
+    """
+    try:
+        await db.connect()
+        await partition_table(db)
+        return 0
+    except Exception as e:
+        logger.error(f"Ошибка при секционировании bot_actions: {e}")
+        return 1
+    finally:
+        await db.disconnect()
+
+
+async def retention() -> int:
+    """
+    Однократно выполняет обслуживание секций с настройками из .env.
+    
+    Returns:
+        Код возврата процесса
+    """
+    try:
+        await db.connect()
+        job = RetentionJob(
+            db,
+            retention_months=config.RETENTION_MONTHS,
+            archive_dir=config.ARCHIVE_DIR or None,
+            interval=0,
+        )
+        dropped = await job.run_once()
+        logger.info(f"Удалено секций: {dropped}")
+        return 0
+    except Exception as e:
+        logger.error(f"Ошибка обслуживания секций: {e}")
+        return 1
+    finally:
+        await db.disconnect()
+
+
+def main() -> int:
+    """Разбирает аргументы командной строки и выполняет команду."""
+    parser = argparse.ArgumentParser(
+        prog="python -m bot.maintenance",
+        description="Обслуживание базы данных бота-модератора",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    commands.add_parser("migrate", help="Применить миграции схемы БД")
+    commands.add_parser(
+        "partition-table",
+        help="Секционировать bot_actions по месяцам (перестраивает таблицу)",
+    )
+    commands.add_parser(
+        "retention",
+        help="Архивировать и удалить секции старше RETENTION_MONTHS",
+    )
+    commands.add_parser(
+        "backfill-counters",
+        help="Пересчитать chat_action_counters и chat_action_daily по bot_actions",
+    )
+    
+    args = parser.parse_args()
+    
+    # Схему SQLite создаёт connect(); секционирование и архивирование есть только в MySQL
+    if db.backend != "mysql" and args.command != "backfill-counters":
+        if args.command == "migrate":
+            logger.info(f"Миграции не требуются: схема {db.backend} создаётся при подключении")
+            return 0
+        logger.error(f"Команда {args.command} доступна только для DB_BACKEND=mysql")
+        return 1
+    
+    if args.command == "migrate":
+        return asyncio.run(migrate())
+    if args.command == "partition-table":
+        return asyncio.run(partition())
+    if args.command == "retention":
+        return asyncio.run(retention())
+    if args.command == "backfill-counters":
+        return asyncio.run(backfill_counters())
+    
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+МОДУЛЬ: Движки сопоставления текста
+Многошаблонный поиск подстрок для фильтра сообщений.
+Полностью независимый модуль - не зависит от других модулей.
+"""
+
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple, Union
+
+
+class AhoCorasick:
+    """
+    Автомат Ахо–Корасик для поиска множества подстрок за один проход.
+    
+    Стоимость проверки сообщения - O(длина текста + число совпадений)
+    и не зависит от размера словаря.
+    """
+    
+    __slots__ = ("_goto", "_fail", "_output", "size")
+    
+    def __init__(self, words: Union[Iterable[str], Mapping[str, str]]):
+        """
+        Строит автомат по набору слов.
+        
+        Args:
+            words: Искомые подстроки (пустые строки игнорируются,
+                но учитываются в size). Если передан словарь, то ищутся ключи,
+                а в результатах возвращаются соответствующие им значения.
+        """
+        # Бор: переходы, суффиксные ссылки и выходы для каждого состояния
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+        self.size = 0
+        
+        labels = words if isinstance(words, Mapping) else None
+        for word in words:
+            self.size += 1
+            if word:
+                self._insert(word, labels[word] if labels is not None else word)
+        
+        self._build_links()
+    
+    def to_data(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние автомата из простых типов (для кэша в JSON).
+        
+        Returns:
+            Словарь с переходами, суффиксными ссылками и выходами состояний
+        """
+        return {
+            "size": self.size,
+            "goto": self._goto,
+            "fail": self._fail,
+            "output": self._output,
+        }
+    
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> "AhoCorasick":
+        """
+        Восстанавливает автомат из to_data, проверяя структуру данных.
+        
+        Args:
+            data: Результат to_data (например, прочитанный из JSON)
+        
+        Returns:
+            Автомат
+        
+        Raises:
+            ValueError: Данные не описывают корректный автомат
+        """
+        goto = [dict(transitions) for transitions in data["goto"]]
+        fail = list(data["fail"])
+        output = [tuple(labels) for labels in data["output"]]
+        states = len(goto)
+        if not states or len(fail) != states or len(output) != states:
+            raise ValueError("число состояний автомата не совпадает")
+        for transitions in goto:
+            for char, state in transitions.items():
+                if len(char) != 1 or type(state) is not int or not 0 < state < states:
+                    raise ValueError(f"неверный переход {char!r} -> {state!r}")
+        for state in fail:
+            if type(state) is not int or not 0 <= state < states:
+                raise ValueError(f"неверная суффиксная ссылка {state!r}")
+        for labels in output:
+            if not all(isinstance(label, str) for label in labels):
+                raise ValueError("неверный выход состояния")
+        
+        automaton = cls.__new__(cls)
+        automaton._goto = goto
+        automaton._fail = fail
+        automaton._output = output
+        automaton.size = int(data["size"])
+        return automaton
+    
+    def _insert(self, word: str, label: str):
+        """Добавляет слово в бор с меткой, возвращаемой при совпадении."""
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+                self._goto[state][char] = next_state
+            state = next_state
+        if label not in self._output[state]:
+            self._output[state] += (label,)
+    
+    def _build_links(self):
+        """Строит суффиксные ссылки обходом бора в ширину."""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                link = self._goto[fail].get(char, 0)
+                self._fail[next_state] = link
+                # Выход состояния включает выходы по суффиксной ссылке
+                if self._output[link]:
+                    self._output[next_state] += self._output[link]
+    
+    def search(self, text: str) -> bool:
+        """
+        Проверяет, содержит ли текст хотя бы одно слово автомата.
+        
+        Args:
+            text: Текст для проверки
+        
+        Returns:
+            True при первом найденном совпадении, False иначе
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+    
+    def find_all(self, text: str) -> Set[str]:
+        """
+        Находит все слова автомата, входящие в текст.
+        
+        Args:
+            text: Текст для проверки
+        
+        Returns:
+            Множество найденных слов
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class PatternSet:
+    """
+    Набор регулярных выражений, объединённый в одну альтернативу с именованными группами.
+    
+    Вместо прогона каждого правила по тексту выполняется один search/finditer,
+    а имя сработавшей группы указывает на правило. Правила с собственными
+    группами или другими флагами не объединяются и проверяются отдельно.
+    """
+    
+    def __init__(self, flags: int = re.IGNORECASE):
+        """
+        Создаёт пустой набор правил.
+        
+        Args:
+            flags: Флаги, с которыми компилируется объединённое выражение
+        """
+        self.flags = flags
+        self.size = 0
+        # Флаги в том виде, в котором их хранит re.Pattern (с учётом UNICODE)
+        self._pattern_flags = re.compile("", flags).flags
+        # Имя группы -> исходный текст правила
+        self._rule_names: Dict[str, str] = {}
+        self._alternatives: List[str] = []
+        self._standalone: List[re.Pattern] = []
+        self._combined: Optional[re.Pattern] = None
+        self._dirty = False
+    
+    def add(self, pattern: re.Pattern):
+        """
+        Добавляет правило в набор.
+        
+        Объединённое выражение не перекомпилируется сразу: новая альтернатива
+        дописывается к уже проверенным, компиляция выполняется при следующем поиске.
+        
+        Args:
+            pattern: Скомпилированное регулярное выражение
+        """
+        self.size += 1
+        
+        if pattern.groups or pattern.flags != self._pattern_flags:
+            self._standalone.append(pattern)
+            return
+        
+        group = f"r{len(self._alternatives)}"
+        alternative = f"(?P<{group}>{pattern.pattern})"
+        try:
+            re.compile(alternative, self.flags)
+        except re.error:
+            # Например, глобальные inline-флаги внутри выражения
+            self._standalone.append(pattern)
+            return
+        
+        self._rule_names[group] = pattern.pattern
+        self._alternatives.append(alternative)
+        self._dirty = True
+    
+    def _get_combined(self) -> Optional[re.Pattern]:
+        """Возвращает объединённое выражение, компилируя его при изменениях."""
+        if self._dirty:
+            self._combined = re.compile("|".join(self._alternatives), self.flags)
+            self._dirty = False
+        return self._combined
+    
+    def search(self, text: str) -> bool:
+        """
+        Проверяет, срабатывает ли хотя бы одно правило.
+        
+        Args:
+            text: Текст для проверки
+        
+        Returns:
+            True если найдено совпадение, False иначе
+        """
+        combined = self._get_combined()
+        if combined is not None and combined.search(text):
+            return True
+        for pattern in self._standalone:
+            if pattern.search(text):
+                return True
+        return False
+    
+    def finditer(self, text: str) -> Iterator[Tuple[str, str]]:
+        """
+        Перечисляет срабатывания правил в тексте.
+        
+        Для объединённого выражения совпадения не перекрываются: в каждой позиции
+        сообщается первое сработавшее правило. Отдельные правила возвращают
+        результат findall, как и раньше.
+        
+        Args:
+            text: Текст для проверки
+        
+        Yields:
+            Пары (исходный текст правила, найденный фрагмент)
+        """
+        combined = self._get_combined()
+        if combined is not None:
+            for match in combined.finditer(text):
+                yield self._rule_names[match.lastgroup], match.group()
+        for pattern in self._standalone:
+            for fragment in pattern.findall(text):
+                yield pattern.pattern, fragment
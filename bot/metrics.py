@@ -0,0 +1,393 @@
+"""
+МОДУЛЬ: Метрики
+Счётчики, гистограммы и показатели в текстовом формате Prometheus
+и HTTP-сервер /metrics для их сбора. Замер - это обращение к словарю
+и bisect по границам корзин, поэтому метрики можно держать включёнными.
+Независимый модуль: замеры встраиваются в bot/database.py, bot/handlers.py
+и через middleware в bot/main.py.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from bot.logger import logger
+
+
+# Границы корзин гистограмм длительности в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Границы корзин для быстрых операций (проверка сообщения фильтром)
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Метка последней корзины гистограммы
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    """Формирует {name="value",...} для строки метрики."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Форматирует число: целые без дробной части."""
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Базовый класс метрики с набором меток."""
+    
+    kind = "untyped"
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        """
+        Args:
+            name: Имя метрики
+            description: Описание (строка HELP)
+            labels: Имена меток; значения передаются в том же порядке
+        """
+        self.name = name
+        self.description = description
+        self.labels = labels
+    
+    def collect(self) -> List[str]:
+        """Возвращает строки значений метрики."""
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        """Возвращает описание и значения метрики в текстовом формате."""
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"] + self.collect()
+
+
+class CounterMetric(Metric):
+    """Монотонно растущий счётчик."""
+    
+    kind = "counter"
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+    
+    def inc(self, *labels: Any, amount: float = 1):
+        """
+        Увеличивает счётчик.
+        
+        Args:
+            *labels: Значения меток
+            amount: На сколько увеличить
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def get(self, *labels: Any) -> float:
+        """Возвращает значение счётчика для меток."""
+        return self._values.get(labels, 0)
+    
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}"
+            for values, value in sorted(self._values.items())
+        ]
+
+
+class HistogramMetric(Metric):
+    """Гистограмма с фиксированными корзинами."""
+    
+    kind = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [количество по корзинам (последняя - больше всех границ), сумма, количество]
+        self._series: Dict[Tuple[Any, ...], list] = {}
+    
+    def observe(self, value: float, *labels: Any):
+        """
+        Учитывает одно наблюдение.
+        
+        Args:
+            value: Значение (для длительностей - в секундах)
+            *labels: Значения меток
+        """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+    
+    def count(self, *labels: Any) -> int:
+        """Возвращает количество наблюдений для меток."""
+        series = self._series.get(labels)
+        return series[2] if series else 0
+    
+    def time(self, *labels: Any) -> "_Timer":
+        """
+        Замеряет длительность блока with.
+        
+        Args:
+            *labels: Значения меток
+        """
+        return _Timer(self, labels)
+    
+    def collect(self) -> List[str]:
+        lines = []
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, INF_LABEL)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+class _Timer:
+    """Контекстный менеджер замера длительности для HistogramMetric."""
+    
+    __slots__ = ("histogram", "labels", "started")
+    
+    def __init__(self, histogram: HistogramMetric, labels: Tuple[Any, ...]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+    
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class GaugeMetric(Metric):
+    """
+    Показатель, значение которого читается при сборе метрик.
+    
+    Функция возвращает число или словарь {значения меток: число};
+    None означает, что показатель сейчас недоступен.
+    """
+    
+    kind = "gauge"
+    
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        callback: Callable[[], Any],
+        labels: Tuple[str, ...] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, description, labels)
+        self.callback = callback
+        # Для счётчиков, которые ведут сами модули, указывается kind="counter"
+        self.kind = kind
+    
+    def collect(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.debug("Не удалось получить показатель %s: %s", self.name, e)
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            return [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels(self.labels, key if isinstance(key, tuple) else (key,))} "
+            f"{_format_value(item)}"
+            for key, item in sorted(value.items())
+        ]
+
+
+class MetricsRegistry:
+    """Набор метрик процесса."""
+    
+    def __init__(self, prefix: str):
+        """
+        Args:
+            prefix: Префикс имён метрик
+        """
+        self.prefix = prefix
+        self._metrics: Dict[str, Metric] = {}
+    
+    def _register(self, metric: Metric) -> Metric:
+        """Регистрирует метрику; повторная регистрация возвращает существующую."""
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()) -> CounterMetric:
+        """Создаёт счётчик prefix_name."""
+        return self._register(CounterMetric(f"{self.prefix}_{name}", description, labels))
+    
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> HistogramMetric:
+        """Создаёт гистограмму prefix_name."""
+        return self._register(HistogramMetric(f"{self.prefix}_{name}", description, labels, buckets))
+    
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        callback: Callable[[], Any],
+        labels: Tuple[str, ...] = (),
+        kind: str = "gauge",
+    ) -> GaugeMetric:
+        """Создаёт показатель prefix_name, читаемый функцией callback."""
+        return self._register(GaugeMetric(f"{self.prefix}_{name}", description, callback, labels, kind))
+    
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр метрик и метрики горячего пути
+metrics = MetricsRegistry("moderator")
+
+filter_check_seconds = metrics.histogram(
+    "filter_check_seconds", "Длительность проверки сообщения фильтром", buckets=FAST_BUCKETS,
+)
+filter_rule_hits = metrics.counter(
+    "filter_rule_hits_total", "Срабатывания правил фильтра на удалённых сообщениях", ("rule",),
+)
+db_query_seconds = metrics.histogram(
+    "db_query_seconds", "Длительность операций с БД", ("operation",),
+)
+db_errors = metrics.counter("db_errors_total", "Ошибки операций с БД", ("operation",))
+db_pool_wait_seconds = metrics.histogram(
+    "db_pool_wait_seconds", "Ожидание свободного соединения в пуле", buckets=FAST_BUCKETS,
+)
+handler_seconds = metrics.histogram("handler_seconds", "Длительность обработчиков", ("handler",))
+handler_errors = metrics.counter("handler_errors_total", "Исключения в обработчиках", ("handler",))
+api_request_seconds = metrics.histogram(
+    "telegram_request_seconds", "Длительность запросов к Telegram API", ("method",),
+)
+api_errors = metrics.counter(
+    "telegram_errors_total", "Ошибки запросов к Telegram API", ("method", "error"),
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Middleware роутера: длительность и исключения обработчиков по имени функции."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: длительность и ошибки запросов к Telegram API.
+    
+    Регистрируется после ограничителя частоты, поэтому замеряет каждую
+    попытку запроса без ожидания в очереди ограничителя.
+    """
+    
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            # Ошибки API (TelegramBadRequest, TelegramRetryAfter, ...), сетевые ошибки и таймауты
+            api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            api_request_seconds.observe(time.perf_counter() - started, name)
+
+
+class MetricsServer:
+    """HTTP-сервер, отдающий метрики реестра по GET /metrics."""
+    
+    def __init__(self, registry: MetricsRegistry):
+        """
+        Args:
+            registry: Реестр метрик
+        """
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+    
+    async def start(self, host: str, port: int):
+        """
+        Запускает сервер.
+        
+        Args:
+            host: Адрес
+            port: Порт
+        """
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host=host, port=port).start()
+        except Exception:
+            await runner.cleanup()
+            raise
+        self._runner = runner
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    
+    async def stop(self):
+        """Останавливает сервер."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+# Глобальные экземпляры middleware и сервера метрик
+handler_metrics = HandlerMetricsMiddleware()
+api_metrics = ApiMetricsMiddleware()
+metrics_server = MetricsServer(metrics)
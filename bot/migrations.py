@@ -0,0 +1,158 @@
+"""
+МОДУЛЬ: Миграции схемы БД
+Изменения схемы для уже созданных баз данных (новые установки получают
+актуальную схему из init.sql). Применяются командой:
+python -m bot.maintenance migrate
+"""
+
+from typing import List, Tuple
+
+from bot.database import Database
+from bot.logger import logger
+
+
+# Номер версии, описание, SQL-операторы. Новые миграции добавляются в конец.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (
+        1,
+        "Таблицы счётчиков действий",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS chat_action_counters (
+                chat_id BIGINT NOT NULL COMMENT 'ID чата',
+                action_type VARCHAR(50) NOT NULL COMMENT 'Тип действия',
+                action_count BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Количество действий',
+                PRIMARY KEY (chat_id, action_type)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            COMMENT='Счётчики действий бота по чатам'
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS chat_action_daily (
+                chat_id BIGINT NOT NULL COMMENT 'ID чата',
+                action_type VARCHAR(50) NOT NULL COMMENT 'Тип действия',
+                day DATE NOT NULL COMMENT 'День',
+                action_count BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Количество действий за день',
+                PRIMARY KEY (chat_id, action_type, day)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            COMMENT='Счётчики действий бота по чатам и дням'
+            """,
+        ],
+    ),
+    (
+        2,
+        "Составные индексы для истории действий по чату",
+        [
+            # История чата по времени без filesort (get_stats)
+            "ALTER TABLE bot_actions ADD INDEX idx_chat_created (chat_id, created_at)",
+            # История чата по типу действия и времени
+            "ALTER TABLE bot_actions ADD INDEX idx_chat_action_created (chat_id, action_type, created_at)",
+            # Префикс idx_chat_action_created, больше не нужен
+            "ALTER TABLE bot_actions DROP INDEX idx_chat_action",
+        ],
+    ),
+    (
+        3,
+        "Политики модерации чатов",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS chat_policies (
+                chat_id BIGINT NOT NULL PRIMARY KEY COMMENT 'ID чата',
+                lexicons VARCHAR(255) NULL COMMENT 'Наборы словарей через запятую (NULL - по умолчанию)',
+                action VARCHAR(16) NULL COMMENT 'Действие при нарушении: delete, warn, mute, ban',
+                mute_seconds INT UNSIGNED NULL COMMENT 'Длительность мута в секундах',
+                duplicate_chat_limit INT UNSIGNED NULL COMMENT 'Допустимо повторов в чате (0 - без ограничения)',
+                duplicate_global_limit INT UNSIGNED NULL COMMENT 'Допустимо повторов во всех чатах',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            COMMENT='Политики модерации чатов'
+            """,
+        ],
+    ),
+    (
+        4,
+        "Счётчики нарушений пользователей",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS user_strikes (
+                chat_id BIGINT NOT NULL COMMENT 'ID чата',
+                user_id BIGINT NOT NULL COMMENT 'ID пользователя Telegram',
+                strikes INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Нарушений с учётом забывания',
+                last_strike_at DATETIME NOT NULL COMMENT 'Время последнего нарушения',
+                PRIMARY KEY (chat_id, user_id)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            COMMENT='Счётчики нарушений пользователей для эскалации наказаний'
+            """,
+        ],
+    ),
+]
+
+# Ошибки MySQL, означающие, что изменение уже есть в схеме:
+# 1050 - таблица существует, 1060 - колонка существует,
+# 1061 - индекс существует, 1091 - удаляемого индекса/колонки нет
+ALREADY_APPLIED_ERRORS = {1050, 1060, 1061, 1091}
+
+
+async def get_schema_version(database: Database) -> int:
+    """
+    Возвращает номер последней применённой миграции.
+    
+    Args:
+        database: Подключённая база данных
+    
+    Returns:
+        Номер версии схемы (0, если миграции не применялись)
+    """
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                """
+            )
+            await cur.execute("SELECT MAX(version) FROM schema_migrations")
+            result = await cur.fetchone()
+            return result[0] or 0
+
+
+async def apply_migrations(database: Database) -> int:
+    """
+    Применяет все миграции новее текущей версии схемы.
+    
+    Операторы, изменения которых уже есть в схеме (например, после init.sql),
+    пропускаются, поэтому миграции можно запускать на любой версии БД.
+    
+    Args:
+        database: Подключённая база данных
+    
+    Returns:
+        Количество применённых миграций
+    """
+    current = await get_schema_version(database)
+    applied = 0
+    
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        
+        logger.info(f"Применяется миграция {version}: {description}")
+        async with database.get_connection() as conn:
+            async with conn.cursor() as cur:
+                for statement in statements:
+                    try:
+                        await cur.execute(statement)
+                    except Exception as e:
+                        code = e.args[0] if e.args else None
+                        if code not in ALREADY_APPLIED_ERRORS:
+                            raise
+                        logger.info(f"Пропущено, изменение уже есть в схеме: {e}")
+                await cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+        applied += 1
+    
+    return applied
@@ -5,10 +5,15 @@
 """
 
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
 
+def utc_now() -> datetime:
+    """Текущее время UTC без часового пояса: в таком виде время действий хранится в БД."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 @dataclass
 class BotAction:
     """Модель действия бота-модератора."""
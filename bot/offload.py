@@ -0,0 +1,483 @@
+"""
+МОДУЛЬ: Проверка сообщений вне event loop
+Передаёт проверку длинных сообщений фильтром в пул потоков или процессов
+пачками, чтобы тяжёлые словари и регулярные выражения не останавливали
+обработку обновлений и запросы к БД. Замеряет задержку event loop.
+Использует bot/filters.py и bot/lexicons.py, применяется в bot/handlers.py.
+"""
+
+import asyncio
+import multiprocessing
+import re
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from bot.config import config
+from bot.filters import MessageFilter
+from bot.lexicons import load_compiled, rules_digest
+from bot.logger import logger, setup_logger
+
+
+# Режимы проверки
+EXECUTOR_INLINE = "inline"
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+
+# Сколько фильтров держит процесс-обработчик
+WORKER_MATCHERS = 64
+
+# Правила фильтра для передачи в процесс: слова и (выражение, флаги)
+FilterSpec = Tuple[List[str], List[Tuple[str, int]]]
+
+
+def filter_spec(matcher: MessageFilter) -> FilterSpec:
+    """Итоговые правила фильтра для воссоздания его в другом процессе."""
+    return sorted(matcher.bad_words), [(pattern.pattern, pattern.flags) for pattern in matcher.patterns]
+
+
+# Фильтры процесса-обработчика по хешу правил, создаются в _init_worker и по запросу
+_worker_matchers: "OrderedDict[str, MessageFilter]" = OrderedDict()
+_worker_cache_dir: Optional[str] = None
+
+# Фильтры потока пула по хешу правил: у каждого потока свои копии
+_thread_state = threading.local()
+
+
+def _build_matcher(digest: str, spec: FilterSpec, cache_dir: Optional[str]) -> MessageFilter:
+    """Создаёт фильтр по правилам, загружая движки из дискового кэша словарей."""
+    words, patterns = spec
+    matcher = MessageFilter(cache_size=0)
+    matcher.bad_words = set(words)
+    matcher.patterns = [re.compile(pattern, flags) for pattern, flags in patterns]
+    load_compiled(matcher, cache_dir, digest)
+    return matcher
+
+
+def _install_matcher(digest: str, spec: FilterSpec):
+    """Создаёт фильтр в процессе-обработчике."""
+    _worker_matchers[digest] = _build_matcher(digest, spec, _worker_cache_dir)
+    while len(_worker_matchers) > WORKER_MATCHERS:
+        _worker_matchers.popitem(last=False)
+
+
+def _init_worker(specs: Dict[str, FilterSpec], cache_dir: Optional[str]):
+    """Создаёт известные на момент запуска фильтры в процессе-обработчике."""
+    global _worker_cache_dir
+    _worker_cache_dir = cache_dir
+    # Процессы пула пишут логи только в консоль: файл ротирует основной процесс
+    setup_logger(log_file="")
+    for digest, spec in specs.items():
+        _install_matcher(digest, spec)
+
+
+def _check_batch(
+    items: List[Tuple[str, str]],
+    specs: Optional[Dict[str, FilterSpec]] = None,
+) -> Tuple[List[Optional[bool]], Set[str]]:
+    """
+    Проверяет пачку текстов в процессе-обработчике.
+    
+    Args:
+        items: Пары (хеш правил фильтра, текст)
+        specs: Правила фильтров, которых может не быть в процессе
+    
+    Returns:
+        Результаты (None - фильтра нет в процессе) и хеши отсутствующих фильтров
+    """
+    for digest, spec in (specs or {}).items():
+        if digest not in _worker_matchers:
+            _install_matcher(digest, spec)
+    
+    verdicts: List[Optional[bool]] = []
+    missing: Set[str] = set()
+    for digest, text in items:
+        matcher = _worker_matchers.get(digest)
+        if matcher is None:
+            missing.add(digest)
+            verdicts.append(None)
+            continue
+        _worker_matchers.move_to_end(digest)
+        verdicts.append(matcher.check_many([text])[0])
+    return verdicts, missing
+
+
+def _find_rules_in_process(digest: str, spec: FilterSpec, text: str) -> List[str]:
+    """Находит сработавшие правила в процессе-обработчике."""
+    if digest not in _worker_matchers:
+        _install_matcher(digest, spec)
+    _worker_matchers.move_to_end(digest)
+    return _worker_matchers[digest].find_rules(text)
+
+
+def _thread_matcher(digest: str, spec: FilterSpec, cache_dir: Optional[str]) -> MessageFilter:
+    """
+    Возвращает копию фильтра текущего потока пула.
+    
+    Фильтры event loop не используются: их ленивые движки и кэш результатов
+    не рассчитаны на одновременный доступ, поэтому поток собирает свои копии.
+    """
+    matchers = getattr(_thread_state, "matchers", None)
+    if matchers is None:
+        matchers = _thread_state.matchers = OrderedDict()
+    
+    matcher = matchers.get(digest)
+    if matcher is None:
+        matcher = matchers[digest] = _build_matcher(digest, spec, cache_dir)
+        while len(matchers) > WORKER_MATCHERS:
+            matchers.popitem(last=False)
+    matchers.move_to_end(digest)
+    return matcher
+
+
+def _check_in_thread(
+    items: List[Tuple[str, str]],
+    specs: Dict[str, FilterSpec],
+    cache_dir: Optional[str],
+) -> List[bool]:
+    """
+    Проверяет пачку текстов в потоке пула.
+    
+    Args:
+        items: Пары (хеш правил фильтра, текст)
+        specs: Правила фильтров пачки по хешу
+        cache_dir: Каталог кэша скомпилированных фильтров
+    
+    Returns:
+        Результаты проверки
+    """
+    return [
+        _thread_matcher(digest, specs[digest], cache_dir).check_many([text])[0]
+        for digest, text in items
+    ]
+
+
+def _find_rules_in_thread(digest: str, spec: FilterSpec, text: str, cache_dir: Optional[str]) -> List[str]:
+    """Находит сработавшие правила копией фильтра потока пула."""
+    return _thread_matcher(digest, spec, cache_dir).find_rules(text)
+
+
+class FilterOffloader:
+    """
+    Проверка сообщений фильтром в пуле потоков или процессов.
+    
+    Короткие сообщения и тексты из кэша результатов фильтра проверяются сразу
+    в event loop. Остальные собираются в пачки (до batch_size текстов или
+    batch_delay секунд) и проверяются в пуле; результат сохраняется в кэш фильтра.
+    
+    Процессы держат готовые фильтры по хешу правил: фильтры, известные при запуске,
+    создаются в инициализаторе, новые (после перезагрузки словарей, политики чатов)
+    передаются процессу при первом обращении и собираются из дискового кэша словарей.
+    Потоки так же держат свои копии фильтров по хешу правил (объекты фильтров
+    event loop не потокобезопасны); из-за GIL потоки не ускоряют проверку,
+    но не дают ей занять event loop надолго.
+    """
+    
+    def __init__(
+        self,
+        mode: str,
+        workers: int,
+        inline_max_length: int,
+        batch_size: int,
+        batch_delay: float,
+        cache_dir: Optional[str],
+    ):
+        """
+        Args:
+            mode: inline (проверка в event loop), thread или process
+            workers: Количество потоков или процессов
+            inline_max_length: Тексты не длиннее проверяются сразу в event loop
+            batch_size: Максимум текстов в пачке
+            batch_delay: Сколько секунд собирать пачку
+            cache_dir: Каталог кэша скомпилированных фильтров для процессов
+        """
+        if mode not in (EXECUTOR_INLINE, EXECUTOR_THREAD, EXECUTOR_PROCESS):
+            logger.warning(f"Неизвестный режим проверки {mode!r}, используется inline")
+            mode = EXECUTOR_INLINE
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.inline_max_length = inline_max_length
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.cache_dir = cache_dir
+        self.inline_checks = 0
+        self.offloaded_checks = 0
+        self.batches = 0
+        self._executor: Optional[Executor] = None
+        self._pending: List[Tuple[MessageFilter, str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # Фильтр -> (версия правил, хеш правил)
+        self._digests: "weakref.WeakKeyDictionary[MessageFilter, Tuple[int, str]]" = weakref.WeakKeyDictionary()
+        # Фильтр -> (версия правил, правила для копий в потоках)
+        self._specs: "weakref.WeakKeyDictionary[MessageFilter, Tuple[int, FilterSpec]]" = weakref.WeakKeyDictionary()
+    
+    @property
+    def running(self) -> bool:
+        """Запущен ли пул."""
+        return self._executor is not None
+    
+    def _digest(self, matcher: MessageFilter) -> str:
+        """Хеш правил фильтра (вычисляется один раз на версию правил)."""
+        cached = self._digests.get(matcher)
+        if cached is None or cached[0] != matcher.rules_version:
+            cached = (matcher.rules_version, rules_digest(matcher))
+            self._digests[matcher] = cached
+        return cached[1]
+    
+    def _spec(self, matcher: MessageFilter) -> FilterSpec:
+        """Снимок правил фильтра для потоков (создаётся в event loop один раз на версию правил)."""
+        cached = self._specs.get(matcher)
+        if cached is None or cached[0] != matcher.rules_version:
+            cached = (matcher.rules_version, filter_spec(matcher))
+            self._specs[matcher] = cached
+        return cached[1]
+    
+    def start(self, matchers: Iterable[MessageFilter] = ()):
+        """
+        Запускает пул.
+        
+        Args:
+            matchers: Фильтры, которые процессы создают заранее
+        """
+        if self.mode == EXECUTOR_INLINE or self._executor is not None:
+            return
+        
+        if self.mode == EXECUTOR_PROCESS and multiprocessing.current_process().daemon:
+            logger.warning("Daemon-процесс не может запускать пул процессов, проверка в пуле потоков")
+            self.mode = EXECUTOR_THREAD
+        
+        if self.mode == EXECUTOR_THREAD:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="filter")
+        else:
+            specs = {self._digest(matcher): filter_spec(matcher) for matcher in matchers}
+            # spawn: процессы не наследуют потоки и состояние event loop
+            self._executor = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(specs, self.cache_dir),
+            )
+        logger.info(f"Проверка сообщений вне event loop: {self.mode}, обработчиков {self.workers}")
+    
+    async def stop(self):
+        """Проверяет накопленные сообщения и останавливает пул."""
+        if self._executor is None:
+            return
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(executor.shutdown)
+    
+    async def contains_bad_words(self, matcher: MessageFilter, text: str) -> bool:
+        """
+        Проверяет текст фильтром, передавая длинные тексты в пул.
+        
+        Args:
+            matcher: Фильтр чата
+            text: Текст сообщения
+        
+        Returns:
+            True если текст содержит запрещённые слова
+        """
+        if self._executor is None or len(text) <= self.inline_max_length:
+            self.inline_checks += 1
+            return matcher.contains_bad_words(text)
+        
+        verdict = matcher.cached_verdict(text)
+        if verdict is not None:
+            return verdict
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((matcher, text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_delay, self._flush)
+        
+        verdict = await future
+        matcher.remember_verdict(text, verdict)
+        return verdict
+    
+    async def find_rules(self, matcher: MessageFilter, text: str) -> List[str]:
+        """
+        Находит сработавшие правила, передавая длинные тексты в пул.
+        
+        В пуле правила ищут копии фильтра потока или процесса, как при проверке.
+        
+        Args:
+            matcher: Фильтр, заблокировавший сообщение
+            text: Текст сообщения
+        
+        Returns:
+            Отсортированный список правил (MessageFilter.find_rules)
+        """
+        if self._executor is None or len(text) <= self.inline_max_length:
+            return matcher.find_rules(text)
+        
+        loop = asyncio.get_running_loop()
+        digest, spec = self._digest(matcher), self._spec(matcher)
+        try:
+            if self.mode == EXECUTOR_THREAD:
+                return await loop.run_in_executor(
+                    self._executor, _find_rules_in_thread, digest, spec, text, self.cache_dir
+                )
+            return await loop.run_in_executor(self._executor, _find_rules_in_process, digest, spec, text)
+        except Exception as e:
+            logger.error(f"Ошибка поиска правил в пуле, поиск в event loop: {e}")
+            return matcher.find_rules(text)
+    
+    def _flush(self):
+        """Отправляет накопленную пачку в пул."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run_batch(self, batch: List[Tuple[MessageFilter, str, asyncio.Future]]):
+        """Проверяет пачку в пуле и передаёт результаты ожидающим обработчикам."""
+        self.batches += 1
+        self.offloaded_checks += len(batch)
+        try:
+            if self.mode == EXECUTOR_THREAD:
+                items = [(self._digest(matcher), text) for matcher, text, _ in batch]
+                specs = {digest: self._spec(matcher) for (digest, _), (matcher, _, _) in zip(items, batch)}
+                verdicts = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _check_in_thread, items, specs, self.cache_dir
+                )
+            else:
+                verdicts = await self._run_in_process(batch)
+        except Exception as e:
+            if isinstance(e, BrokenExecutor) and self._executor is not None:
+                # Процесс пула завершился аварийно: пул больше не принимает задачи,
+                # дальше проверяем в event loop
+                logger.error(f"Пул проверки сообщений остановлен, проверка в event loop: {e}")
+                executor, self._executor = self._executor, None
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                logger.error(f"Ошибка проверки сообщений в пуле, проверка в event loop: {e}")
+            verdicts = [matcher.contains_bad_words(text) for matcher, text, _ in batch]
+        
+        for (_, _, future), verdict in zip(batch, verdicts):
+            if not future.done():
+                future.set_result(verdict)
+    
+    async def _run_in_process(self, batch: List[Tuple[MessageFilter, str, asyncio.Future]]) -> List[bool]:
+        """Проверяет пачку в процессе, передавая ему недостающие фильтры."""
+        loop = asyncio.get_running_loop()
+        items = [(self._digest(matcher), text) for matcher, text, _ in batch]
+        verdicts, missing = await loop.run_in_executor(self._executor, _check_batch, items)
+        if not missing:
+            return verdicts
+        
+        # Процесс ещё не знает этих фильтров: повторяем непроверенные тексты вместе с правилами
+        matchers = {digest: matcher for (digest, _), (matcher, _, _) in zip(items, batch)}
+        specs = {digest: filter_spec(matchers[digest]) for digest in missing}
+        indexes = [index for index, verdict in enumerate(verdicts) if verdict is None]
+        retried, _ = await loop.run_in_executor(
+            self._executor, _check_batch, [items[index] for index in indexes], specs
+        )
+        for index, verdict in zip(indexes, retried):
+            verdicts[index] = verdict
+        return verdicts
+
+
+class LoopLagMonitor:
+    """
+    Замер задержки event loop.
+    
+    Раз в interval секунд засыпает на interval и сравнивает фактическое время
+    пробуждения с ожидаемым: разница - время, в течение которого loop был занят
+    синхронным кодом и не мог обработать другие задачи.
+    """
+    
+    def __init__(self, interval: float, warn_threshold: float, history: int = 600):
+        """
+        Args:
+            interval: Период замера в секундах (0 - замер отключён)
+            warn_threshold: Задержка в секундах, начиная с которой пишется предупреждение
+            history: Сколько последних замеров хранить для процентилей
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.samples = 0
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self._recent: deque = deque(maxlen=max(1, history))
+        self._task: Optional[asyncio.Task] = None
+    
+    def record(self, lag: float):
+        """
+        Учитывает замер задержки.
+        
+        Args:
+            lag: Задержка в секундах
+        """
+        self.samples += 1
+        self.last = lag
+        self.max = max(self.max, lag)
+        self.total += lag
+        self._recent.append(lag)
+        if lag >= self.warn_threshold:
+            logger.warning(f"Event loop был занят {lag * 1000:.0f} мс")
+    
+    def percentile(self, q: float) -> float:
+        """
+        Процентиль задержки по последним замерам.
+        
+        Args:
+            q: Процентиль от 0 до 100
+        
+        Returns:
+            Задержка в секундах
+        """
+        if not self._recent:
+            return 0.0
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+    
+    def start(self):
+        """Запускает замер в текущем event loop."""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает замер."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        """Цикл замера."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - started - self.interval))
+
+
+# Глобальные экземпляры проверки вне event loop и замера задержки
+filter_offloader = FilterOffloader(
+    mode=config.FILTER_EXECUTOR,
+    workers=config.FILTER_WORKERS,
+    inline_max_length=config.FILTER_INLINE_MAX_LENGTH,
+    batch_size=config.FILTER_BATCH_SIZE,
+    batch_delay=config.FILTER_BATCH_MS / 1000,
+    cache_dir=config.LEXICON_CACHE_DIR or None,
+)
+loop_lag_monitor = LoopLagMonitor(config.LOOP_LAG_INTERVAL, config.LOOP_LAG_WARN_MS / 1000)
@@ -0,0 +1,363 @@
+"""
+МОДУЛЬ: Исходящие запросы к Telegram API
+Ограничение частоты запросов (token bucket по чатам и глобально) с повтором
+после flood control, пакетное удаление сообщений и объединение предупреждений.
+Ограничитель подключается к сессии бота в bot/main.py, очередь удаления
+используется в bot/handlers.py.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import Message
+
+from bot.config import config
+from bot.database import db
+from bot.logger import logger
+from bot.models import BotAction
+
+
+# Максимум сообщений в одном вызове deleteMessages
+DELETE_MESSAGES_LIMIT = 100
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты: rate запросов в секунду с запасом capacity.
+    
+    Токены выдаются в долг, поэтому ожидающие запросы обслуживаются
+    в порядке обращения без повторных проверок.
+    """
+    
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+    
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Скорость пополнения, токенов в секунду
+            capacity: Максимальный запас токенов
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def reserve(self) -> float:
+        """
+        Забирает токен.
+        
+        Returns:
+            Сколько секунд нужно подождать перед запросом
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+    
+    def pause(self, seconds: float):
+        """Запрещает запросы на указанное время (ответ Telegram с retry_after)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+    
+    @property
+    def idle(self) -> bool:
+        """Запас полностью восстановлен: состояние можно не хранить."""
+        elapsed = time.monotonic() - self.updated
+        return self.tokens + elapsed * self.rate >= self.capacity and self.blocked_until <= time.monotonic()
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: ограничивает частоту запросов, относящихся к чатам.
+    
+    Каждый такой запрос забирает токен из общего ограничителя и из ограничителя
+    своего чата. При ответе 429 чат (или весь бот) приостанавливается на
+    retry_after секунд, и запрос повторяется. Запросы без chat_id
+    (getUpdates, setWebhook и т.п.) не ограничиваются.
+    """
+    
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int,
+        max_chats: int = 10000,
+    ):
+        """
+        Args:
+            global_rate: Запросов в секунду для всего бота
+            chat_rate: Запросов в секунду в одном чате
+            chat_burst: Запас запросов в одном чате
+            max_retries: Сколько раз повторять запрос после 429
+            max_chats: Сколько ограничителей чатов хранить
+        """
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate))
+        self.chat_rate = chat_rate
+        self.chat_burst = max(1.0, chat_burst)
+        self.max_retries = max_retries
+        self.max_chats = max(1, max_chats)
+        self._chats: "OrderedDict[object, TokenBucket]" = OrderedDict()
+        # Статистика
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.retries = 0
+    
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        """Возвращает ограничитель чата, вытесняя давно неиспользуемые."""
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+        
+        bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chats[chat_id] = bucket
+        while len(self._chats) > self.max_chats:
+            oldest_id, oldest = next(iter(self._chats.items()))
+            if not oldest.idle:
+                break
+            del self._chats[oldest_id]
+        return bucket
+    
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        """Выполняет запрос с учётом ограничений и повторяет его после 429."""
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        
+        attempt = 0
+        while True:
+            chat_bucket = self._get_chat_bucket(chat_id)
+            wait = max(self.global_bucket.reserve(), chat_bucket.reserve())
+            if wait > 0:
+                self.throttled += 1
+                self.throttled_seconds += wait
+                await asyncio.sleep(wait)
+            
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                chat_bucket.pause(e.retry_after)
+                logger.warning(
+                    f"Flood control: {type(method).__name__} в чате {chat_id}, "
+                    f"повтор через {e.retry_after} с (попытка {attempt})"
+                )
+
+
+@dataclass
+class _PendingChat:
+    """Ожидающие действия одного чата."""
+    
+    bot: Bot
+    message_ids: List[int] = field(default_factory=list)
+    actions: List[BotAction] = field(default_factory=list)
+    delete_task: Optional[asyncio.Task] = None
+    # Запросы deleteMessages в процессе
+    deleting: int = 0
+    # Удалённые за текущее окно сообщения и их авторы
+    removed: int = 0
+    users: Dict[int, str] = field(default_factory=dict)
+    notice_task: Optional[asyncio.Task] = None
+    
+    @property
+    def idle(self) -> bool:
+        """Нет ни ожидающих удаления сообщений, ни неотправленных уведомлений."""
+        return (
+            not self.message_ids
+            and self.delete_task is None
+            and not self.deleting
+            and self.notice_task is None
+        )
+
+
+class ModerationQueue:
+    """
+    Очередь удаления сообщений с нарушениями.
+    
+    Сообщения чата собираются в течение delete_delay и удаляются одним
+    вызовом deleteMessages; действия сохраняются в БД после удаления.
+    Вместо предупреждения на каждое сообщение в чат отправляется одно
+    уведомление за окно notice_window.
+    """
+    
+    def __init__(self, delete_delay: float, notice_window: float):
+        """
+        Args:
+            delete_delay: Сколько секунд собирать сообщения чата перед удалением
+            notice_window: Окно объединения предупреждений в секундах
+        """
+        self.delete_delay = delete_delay
+        self.notice_window = notice_window
+        self._chats: Dict[int, _PendingChat] = {}
+        self._tasks: Set[asyncio.Task] = set()
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """Запускает фоновую задачу, сохраняя ссылку на неё до завершения."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    def remove(self, message: Message, action: BotAction):
+        """
+        Ставит сообщение в очередь на удаление.
+        
+        Args:
+            message: Сообщение с нарушением
+            action: Действие, сохраняемое в БД после удаления
+        """
+        chat_id = message.chat.id
+        pending = self._chats.get(chat_id)
+        if pending is None:
+            pending = _PendingChat(bot=message.bot)
+            self._chats[chat_id] = pending
+        
+        pending.message_ids.append(message.message_id)
+        pending.actions.append(action)
+        pending.users[message.from_user.id] = message.from_user.first_name
+        
+        if len(pending.message_ids) >= DELETE_MESSAGES_LIMIT:
+            # Пачка заполнена: отделяем её сразу, новые сообщения попадут в следующую
+            if pending.delete_task is not None:
+                pending.delete_task.cancel()
+            pending.deleting += 1
+            self._spawn(self._delete_batch(chat_id, pending, pending.message_ids, pending.actions))
+            pending.message_ids, pending.actions = [], []
+            pending.delete_task = None
+        elif pending.delete_task is None:
+            pending.delete_task = self._spawn(self._delete_later(chat_id, pending))
+    
+    async def _delete_later(self, chat_id: int, pending: _PendingChat):
+        """Удаляет накопленные сообщения чата через delete_delay."""
+        await asyncio.sleep(self.delete_delay)
+        await self._delete(chat_id, pending)
+    
+    async def _delete(self, chat_id: int, pending: _PendingChat):
+        """Удаляет накопленные сообщения чата одним запросом."""
+        message_ids, actions = pending.message_ids, pending.actions
+        pending.message_ids, pending.actions = [], []
+        pending.delete_task = None
+        if not message_ids:
+            self._release(chat_id, pending)
+            return
+        
+        pending.deleting += 1
+        await self._delete_batch(chat_id, pending, message_ids, actions)
+    
+    async def _delete_batch(
+        self,
+        chat_id: int,
+        pending: _PendingChat,
+        message_ids: List[int],
+        actions: List[BotAction],
+    ):
+        """Удаляет пачку сообщений и сохраняет действия (deleting увеличивает вызывающий)."""
+        try:
+            # deleteMessages пропускает уже удалённые сообщения
+            await pending.bot.delete_messages(chat_id, message_ids)
+            deleted = True
+        except TelegramBadRequest as e:
+            # Бот не может удалить сообщения (нет прав)
+            logger.warning(f"Не удалось удалить сообщения в чате {chat_id}: {e}")
+            deleted = False
+        except Exception as e:
+            logger.error(f"Ошибка при удалении сообщений в чате {chat_id}: {e}")
+            deleted = False
+        pending.deleting -= 1
+        
+        if not deleted:
+            self._release(chat_id, pending)
+            return
+        
+        for action in actions:
+            await db.save_action(action)
+        
+        logger.warning(
+            f"Удалено сообщений в чате {chat_id}: {len(message_ids)} "
+            f"(пользователи: {', '.join(str(user_id) for user_id in sorted({a.user_id for a in actions}))})"
+        )
+        
+        pending.removed += len(message_ids)
+        if pending.notice_task is None:
+            pending.notice_task = self._spawn(self._notify_later(chat_id, pending))
+    
+    async def _notify_later(self, chat_id: int, pending: _PendingChat):
+        """Отправляет уведомление об удалённых сообщениях по окончании окна."""
+        await asyncio.sleep(self.notice_window)
+        await self._notify(chat_id, pending)
+    
+    async def _notify(self, chat_id: int, pending: _PendingChat):
+        """Отправляет одно уведомление о сообщениях, удалённых за окно."""
+        removed, users = pending.removed, pending.users
+        pending.removed, pending.users = 0, {}
+        pending.notice_task = None
+        self._release(chat_id, pending)
+        if not removed:
+            return
+        
+        if removed == 1 and len(users) == 1:
+            text = (
+                f"⚠️ {next(iter(users.values()))}, ваше сообщение было удалено "
+                f"за нарушение правил чата."
+            )
+        else:
+            text = f"⚠️ Удалено сообщений за нарушение правил чата: {removed}."
+        
+        try:
+            await pending.bot.send_message(chat_id, text)
+        except Exception as e:
+            logger.debug("Не удалось отправить предупреждение: %s", e)
+    
+    def _release(self, chat_id: int, pending: _PendingChat):
+        """Удаляет состояние чата, если для него ничего не ожидается."""
+        if pending.idle and self._chats.get(chat_id) is pending:
+            del self._chats[chat_id]
+    
+    async def flush(self):
+        """Немедленно удаляет накопленные сообщения и отправляет уведомления."""
+        # Отменяем только ожидание таймеров; начатые запросы дожидаемся
+        for pending in self._chats.values():
+            for task in (pending.delete_task, pending.notice_task):
+                if task is not None:
+                    task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        
+        for chat_id, pending in list(self._chats.items()):
+            pending.delete_task = None
+            await self._delete(chat_id, pending)
+        for chat_id, pending in list(self._chats.items()):
+            pending.notice_task = None
+            await self._notify(chat_id, pending)
+
+
+# Глобальные экземпляры
+rate_limiter = RateLimitMiddleware(
+    global_rate=config.API_GLOBAL_RATE,
+    chat_rate=config.API_CHAT_RATE,
+    chat_burst=config.API_CHAT_BURST,
+    max_retries=config.API_MAX_RETRIES,
+)
+moderation_queue = ModerationQueue(
+    delete_delay=config.DELETE_BATCH_MS / 1000,
+    notice_window=config.WARNING_WINDOW_SECONDS,
+)
@@ -0,0 +1,365 @@
+"""
+МОДУЛЬ: Политики модерации чатов
+Хранит для каждого чата наборы словарей, действие при нарушении и пороги
+(таблица chat_policies), загружает их по требованию и держит скомпилированные
+фильтры в общем пуле: чаты с одинаковыми правилами используют один фильтр.
+Использует bot/database.py и bot/lexicons.py, применяется в bot/handlers.py.
+"""
+
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from bot.config import config
+from bot.database import db
+from bot.filters import MessageFilter
+from bot.lexicons import (
+    Lexicon,
+    LexiconStore,
+    build_filter,
+    lexicon_store,
+    load_compiled,
+    merge_lexicons,
+    rules_digest,
+)
+from bot.logger import logger
+
+
+class PolicyAction:
+    """Действия при нарушении правил чата."""
+    
+    DELETE = "delete"      # Удалить сообщение
+    WARN = "warn"          # Удалить и выдать предупреждение
+    MUTE = "mute"          # Удалить и запретить писать на mute_seconds
+    BAN = "ban"            # Удалить и забанить
+    ESCALATE = "escalate"  # Удалить и наказать по лестнице ESCALATION_STEPS
+
+
+POLICY_ACTIONS = (
+    PolicyAction.DELETE, PolicyAction.WARN, PolicyAction.MUTE, PolicyAction.BAN, PolicyAction.ESCALATE,
+)
+
+
+def parse_lexicon_names(value: Optional[str]) -> Tuple[str, ...]:
+    """
+    Разбирает список наборов словарей через запятую.
+    
+    Порядок и повторы не влияют на результат, поэтому одинаковые
+    по составу списки дают один ключ пула фильтров.
+    
+    Args:
+        value: Строка вида "ru,spam" (None или пустая - набор по умолчанию)
+    
+    Returns:
+        Отсортированные имена наборов
+    """
+    if not value:
+        return ()
+    return tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+
+
+@dataclass(frozen=True)
+class ChatPolicy:
+    """Политика модерации чата."""
+    
+    chat_id: int
+    lexicons: Tuple[str, ...] = ()  # Пусто - набор чата или набор по умолчанию
+    action: str = PolicyAction.DELETE
+    mute_seconds: int = 3600
+    duplicate_chat_limit: int = 0  # 0 - без ограничения
+    duplicate_global_limit: int = 0
+    
+    @classmethod
+    def default(cls, chat_id: int) -> "ChatPolicy":
+        """Политика чата без записи в chat_policies."""
+        return cls.from_row(chat_id, None)
+    
+    @classmethod
+    def from_row(cls, chat_id: int, row: Optional[Dict[str, Any]]) -> "ChatPolicy":
+        """
+        Создаёт политику из строки chat_policies.
+        
+        Args:
+            chat_id: ID чата
+            row: Колонки политики (None или NULL в колонке - значение из конфигурации)
+        
+        Returns:
+            Политика чата
+        """
+        row = row or {}
+        
+        action = row.get("action") or config.POLICY_DEFAULT_ACTION
+        if action not in POLICY_ACTIONS:
+            logger.warning(f"Неизвестное действие политики {action!r} в чате {chat_id}, используется delete")
+            action = PolicyAction.DELETE
+        
+        def value(column: str, default: int) -> int:
+            return default if row.get(column) is None else int(row[column])
+        
+        return cls(
+            chat_id=chat_id,
+            lexicons=parse_lexicon_names(row.get("lexicons")),
+            action=action,
+            mute_seconds=value("mute_seconds", config.POLICY_MUTE_SECONDS),
+            duplicate_chat_limit=value("duplicate_chat_limit", config.DUPLICATE_CHAT_LIMIT),
+            duplicate_global_limit=value("duplicate_global_limit", config.DUPLICATE_GLOBAL_LIMIT),
+        )
+
+
+class MatcherPool:
+    """
+    Скомпилированные фильтры для сочетаний наборов словарей.
+    
+    Последние использованные сочетания хранятся в LRU. Фильтры с одинаковыми
+    итоговыми правилами (rules_digest) разделяются: разные сочетания с одними
+    правилами и сочетания, вытесненные из LRU, пока их фильтр используется
+    политиками, не компилируются повторно. После перезагрузки словарей
+    сочетания компилируются заново при следующем обращении.
+    """
+    
+    def __init__(self, store: LexiconStore, max_size: int):
+        """
+        Args:
+            store: Хранилище наборов словарей
+            max_size: Сколько сочетаний держать в LRU
+        """
+        self.store = store
+        self.max_size = max(1, max_size)
+        self.compiled = 0
+        self.shared = 0
+        # Сочетание наборов -> (версия наборов, фильтр)
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[int, MessageFilter]]" = OrderedDict()
+        # Хеш правил -> фильтр; запись исчезает, когда фильтр больше никем не используется
+        self._by_digest: "weakref.WeakValueDictionary[str, MessageFilter]" = weakref.WeakValueDictionary()
+        # Сборки в процессе по (сочетание, версия наборов)
+        self._loading: Dict[Tuple[Tuple[str, ...], int], asyncio.Future] = {}
+    
+    def __len__(self) -> int:
+        """Количество сочетаний в LRU."""
+        return len(self._entries)
+    
+    @property
+    def unique(self) -> int:
+        """Количество различных фильтров в памяти."""
+        return len(self._by_digest)
+    
+    async def get(self, names: Tuple[str, ...]) -> MessageFilter:
+        """
+        Возвращает фильтр для сочетания наборов, собирая его при необходимости.
+        
+        Args:
+            names: Отсортированные имена наборов (parse_lexicon_names)
+        
+        Returns:
+            Скомпилированный фильтр
+        """
+        # Один набор уже скомпилирован хранилищем словарей
+        if len(names) == 1:
+            matcher = self.store.get_set(names[0])
+            if matcher is not None:
+                return matcher
+        
+        generation = self.store.generation
+        entry = self._entries.get(names)
+        if entry is not None and entry[0] == generation:
+            self._entries.move_to_end(names)
+            return entry[1]
+        
+        key = (names, generation)
+        loading = self._loading.get(key)
+        if loading is not None:
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                # Отменён сам вызов, а не сборка - отмену передаём дальше
+                if not loading.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # Сборка отменена вместе с запустившей её задачей: собираем заново
+            return await self.get(names)
+        
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[key] = loading
+        try:
+            matcher = await self._build(names)
+        except Exception as e:
+            loading.set_exception(e)
+            # Исключение получат ожидающие; если их нет, не логируем его повторно
+            loading.exception()
+            raise
+        except BaseException:
+            # Сборка отменена (остановка бота, отмена обработчика): ожидающие не должны зависнуть
+            loading.cancel()
+            raise
+        finally:
+            self._loading.pop(key, None)
+        loading.set_result(matcher)
+        
+        # Словари перезагрузились во время сборки: в LRU не кладём
+        if self.store.generation == generation:
+            self._entries[names] = (generation, matcher)
+            self._entries.move_to_end(names)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return matcher
+    
+    async def _build(self, names: Tuple[str, ...]) -> MessageFilter:
+        """Собирает фильтр сочетания или находит уже собранный с теми же правилами."""
+        lexicons = []
+        for name in names:
+            lexicon = self.store.get_lexicon(name)
+            if lexicon is None:
+                logger.warning(f"Набор словарей {name} не найден, пропускается")
+                continue
+            lexicons.append(lexicon)
+        
+        # Разбор правил и хеш - в потоке: для больших словарей это заметное время
+        matcher, digest = await asyncio.to_thread(self._prepare, lexicons, self.store.base)
+        existing = self._by_digest.get(digest)
+        if existing is not None:
+            self.shared += 1
+            return existing
+        
+        await asyncio.to_thread(load_compiled, matcher, self.store.cache_dir, digest)
+        # Пока компилировали, тот же фильтр мог собрать другой запрос
+        existing = self._by_digest.get(digest)
+        if existing is not None:
+            self.shared += 1
+            return existing
+        
+        self._by_digest[digest] = matcher
+        self.compiled += 1
+        logger.info(
+            f"Собран фильтр для наборов {', '.join(names)}: "
+            f"{len(matcher.bad_words)} слов, {len(matcher.patterns)} выражений"
+        )
+        return matcher
+    
+    @staticmethod
+    def _prepare(lexicons, base: Optional[Lexicon]) -> Tuple[MessageFilter, str]:
+        """Создаёт фильтр объединённых наборов поверх базовых правил и вычисляет хеш его правил."""
+        matcher = build_filter(merge_lexicons(lexicons), base)
+        return matcher, rules_digest(matcher)
+
+
+class PolicyStore:
+    """
+    Кэш политик чатов с временем жизни и вытеснением LRU.
+    
+    Политика загружается из БД при первом сообщении чата; одновременные
+    запросы одного чата ждут одну загрузку. Запись сбрасывается при
+    изменении политики командой /policy.
+    """
+    
+    def __init__(self, pool: MatcherPool, ttl: float, max_size: int):
+        """
+        Args:
+            pool: Пул фильтров для сочетаний наборов словарей
+            ttl: Время жизни записи в секундах
+            max_size: Максимальное количество чатов в кэше
+        """
+        self.pool = pool
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        # chat_id -> (время устаревания, политика)
+        self._entries: "OrderedDict[int, Tuple[float, ChatPolicy]]" = OrderedDict()
+        # Загрузки в процессе и признак сброса записи во время загрузки
+        self._loading: Dict[int, asyncio.Future] = {}
+        self._invalidated: Dict[int, bool] = {}
+    
+    async def get_policy(self, chat_id: int) -> ChatPolicy:
+        """
+        Возвращает политику чата, загружая её при отсутствии в кэше.
+        
+        При ошибке БД возвращается политика по умолчанию; она не кэшируется.
+        
+        Args:
+            chat_id: ID чата
+        
+        Returns:
+            Политика чата
+        """
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry[0] >= time.monotonic():
+            self._entries.move_to_end(chat_id)
+            self.hits += 1
+            return entry[1]
+        
+        self.misses += 1
+        loading = self._loading.get(chat_id)
+        if loading is not None:
+            try:
+                return await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                # Отменён сам вызов, а не загрузка - отмену передаём дальше
+                if not loading.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            # Загрузка отменена вместе с запустившей её задачей: загружаем заново
+            return await self.get_policy(chat_id)
+        
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[chat_id] = loading
+        self._invalidated[chat_id] = False
+        try:
+            row = await db.get_chat_policy(chat_id)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке политики чата {chat_id}: {e}")
+            policy = ChatPolicy.default(chat_id)
+            loading.set_result(policy)
+            return policy
+        except BaseException:
+            # Загрузка отменена (остановка бота, отмена обработчика): ожидающие не должны зависнуть
+            loading.cancel()
+            raise
+        finally:
+            self._loading.pop(chat_id, None)
+            invalidated = self._invalidated.pop(chat_id, False)
+        
+        policy = ChatPolicy.from_row(chat_id, row)
+        loading.set_result(policy)
+        
+        # Политику изменили во время загрузки: результат мог устареть
+        if not invalidated:
+            self._entries[chat_id] = (time.monotonic() + self.ttl, policy)
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return policy
+    
+    async def get_matcher(self, policy: ChatPolicy) -> MessageFilter:
+        """
+        Возвращает фильтр для политики чата.
+        
+        Args:
+            policy: Политика чата
+        
+        Returns:
+            Фильтр сочетания наборов политики; без наборов - фильтр из хранилища словарей
+        """
+        if not policy.lexicons:
+            return self.pool.store.get_filter(policy.chat_id)
+        try:
+            return await self.pool.get(policy.lexicons)
+        except Exception as e:
+            logger.error(f"Ошибка при сборке фильтра для чата {policy.chat_id}: {e}")
+            return self.pool.store.get_filter(policy.chat_id)
+    
+    def invalidate(self, chat_id: int):
+        """
+        Сбрасывает запись чата.
+        
+        Args:
+            chat_id: ID чата
+        """
+        self._entries.pop(chat_id, None)
+        if chat_id in self._invalidated:
+            self._invalidated[chat_id] = True
+
+
+# Глобальные экземпляры пула фильтров и кэша политик
+matcher_pool = MatcherPool(lexicon_store, config.MATCHER_POOL_SIZE)
+policy_store = PolicyStore(matcher_pool, config.POLICY_CACHE_TTL, config.POLICY_CACHE_SIZE)
@@ -0,0 +1,331 @@
+"""
+МОДУЛЬ: Хранение истории действий
+Помесячное секционирование bot_actions, архивирование и удаление старых секций.
+Использует bot/database.py; фоновая задача запускается из bot/main.py.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import aiomysql
+
+from bot.database import Database
+from bot.logger import logger
+from bot.models import utc_now
+
+
+# Секция, в которую попадают строки после последней месячной секции
+MAX_PARTITION = "pmax"
+
+# Сколько строк читать из БД и записывать в архив за один раз
+ARCHIVE_CHUNK_SIZE = 5000
+
+
+def month_start(day: date) -> date:
+    """Возвращает первое число месяца."""
+    return date(day.year, day.month, 1)
+
+
+def add_months(day: date, months: int) -> date:
+    """Сдвигает первое число месяца на указанное количество месяцев."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Имя секции с действиями за месяц: p202610."""
+    return f"p{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    """Месяц секции по её имени или None для служебных секций."""
+    if len(name) != 7 or not name.startswith("p") or not name[1:].isdigit():
+        return None
+    if not 1 <= int(name[5:7]) <= 12:
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def partition_clause(month: date) -> str:
+    """Определение секции для строк месяца."""
+    next_month = add_months(month, 1)
+    return (
+        f"PARTITION {partition_name(month)} "
+        f"VALUES LESS THAN (UNIX_TIMESTAMP('{next_month.isoformat()} 00:00:00'))"
+    )
+
+
+async def get_partitions(database: Database) -> List[str]:
+    """
+    Возвращает имена секций bot_actions по порядку.
+    
+    Args:
+        database: Подключённая база данных
+    
+    Returns:
+        Список имён секций (пустой, если таблица не секционирована)
+    """
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'bot_actions'
+                AND PARTITION_NAME IS NOT NULL
+                ORDER BY PARTITION_ORDINAL_POSITION
+                """
+            )
+            return [row[0] for row in await cur.fetchall()]
+
+
+async def partition_table(database: Database, months_ahead: int = 2):
+    """
+    Переводит bot_actions на помесячное секционирование по created_at.
+    
+    Перестраивает таблицу целиком, поэтому запускается вручную
+    (python -m bot.maintenance partition-table) в период низкой нагрузки.
+    
+    Args:
+        database: Подключённая база данных
+        months_ahead: Сколько будущих месяцев создать заранее
+    """
+    if await get_partitions(database):
+        logger.info("Таблица bot_actions уже секционирована")
+        return
+    
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT MIN(created_at) FROM bot_actions")
+            result = await cur.fetchone()
+            first = month_start(result[0].date() if result and result[0] else utc_now().date())
+            last = add_months(month_start(utc_now().date()), months_ahead)
+            
+            clauses = []
+            month = first
+            while month <= last:
+                clauses.append(partition_clause(month))
+                month = add_months(month, 1)
+            clauses.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+            
+            # Ключ секционирования должен входить в первичный ключ
+            await cur.execute(
+                """
+                ALTER TABLE bot_actions
+                MODIFY created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                DROP PRIMARY KEY,
+                ADD PRIMARY KEY (id, created_at)
+                """
+            )
+            await cur.execute(
+                "ALTER TABLE bot_actions PARTITION BY RANGE (UNIX_TIMESTAMP(created_at)) ("
+                + ", ".join(clauses)
+                + ")"
+            )
+    
+    logger.info(f"Таблица bot_actions секционирована: {len(clauses)} секций")
+
+
+async def ensure_future_partitions(database: Database, partitions: List[str], months_ahead: int) -> int:
+    """
+    Создаёт секции на ближайшие месяцы, отделяя их от pmax.
+    
+    Args:
+        database: Подключённая база данных
+        partitions: Текущие секции таблицы
+        months_ahead: Сколько будущих месяцев должно быть покрыто
+    
+    Returns:
+        Количество созданных секций
+    """
+    months = [m for m in (partition_month(name) for name in partitions) if m is not None]
+    if not months or MAX_PARTITION not in partitions:
+        return 0
+    
+    target = add_months(month_start(utc_now().date()), months_ahead)
+    clauses = []
+    month = add_months(max(months), 1)
+    while month <= target:
+        clauses.append(partition_clause(month))
+        month = add_months(month, 1)
+    
+    if not clauses:
+        return 0
+    
+    clauses.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"ALTER TABLE bot_actions REORGANIZE PARTITION {MAX_PARTITION} INTO ("
+                + ", ".join(clauses)
+                + ")"
+            )
+    return len(clauses) - 1
+
+
+def _json_default(value):
+    """Сериализует даты для JSON."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _write_lines(archive, rows: List[dict]):
+    """Записывает строки в архив (выполняется в отдельном потоке)."""
+    archive.writelines(
+        json.dumps(row, ensure_ascii=False, default=_json_default) + "\n" for row in rows
+    )
+
+
+def _finish_archive(archive, tmp_path: Path, path: Path):
+    """Сбрасывает архив на диск и атомарно переименовывает его."""
+    archive.close()
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+async def archive_partition(database: Database, name: str, archive_dir: str) -> Tuple[Path, int]:
+    """
+    Выгружает строки секции в сжатый JSONL-файл.
+    
+    Файл пишется во временный и переименовывается только после полной
+    выгрузки, поэтому секцию можно удалять, только если функция завершилась.
+    
+    Args:
+        database: Подключённая база данных
+        name: Имя секции
+        archive_dir: Каталог для архивов
+    
+    Returns:
+        Путь к архиву и количество выгруженных строк
+    """
+    directory = Path(archive_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"bot_actions_{name}.jsonl.gz"
+    tmp_path = path.with_name(path.name + ".tmp")
+    
+    archive = await asyncio.to_thread(gzip.open, tmp_path, "wt", encoding="utf-8")
+    rows_count = 0
+    try:
+        async with database.get_connection() as conn:
+            # Потоковый курсор: секция не загружается в память целиком
+            async with conn.cursor(aiomysql.SSDictCursor) as cur:
+                await cur.execute(f"SELECT * FROM bot_actions PARTITION ({name}) ORDER BY id")
+                while True:
+                    rows = await cur.fetchmany(ARCHIVE_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    await asyncio.to_thread(_write_lines, archive, rows)
+                    rows_count += len(rows)
+        await asyncio.to_thread(_finish_archive, archive, tmp_path, path)
+    except Exception:
+        archive.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    
+    return path, rows_count
+
+
+async def drop_partition(database: Database, name: str):
+    """Удаляет секцию вместе со строками."""
+    async with database.get_connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"ALTER TABLE bot_actions DROP PARTITION {name}")
+
+
+class RetentionJob:
+    """
+    Фоновая задача обслуживания секций bot_actions.
+    
+    Периодически создаёт секции на будущие месяцы и архивирует (или просто
+    удаляет) секции старше retention_months. Счётчики действий
+    (chat_action_counters) при этом не уменьшаются.
+    """
+    
+    def __init__(
+        self,
+        database: Database,
+        retention_months: int,
+        archive_dir: Optional[str],
+        interval: float,
+        months_ahead: int = 2,
+    ):
+        """
+        Args:
+            database: База данных
+            retention_months: Сколько полных месяцев хранить (0 - не удалять)
+            archive_dir: Каталог архивов (None - удалять без архивирования)
+            interval: Период запуска в секундах
+            months_ahead: Сколько будущих месяцев держать созданными
+        """
+        self.database = database
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        """Запускает задачу в текущем event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает задачу."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        """Цикл: обслуживание секций раз в interval секунд."""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания секций bot_actions: {e}")
+            await asyncio.sleep(self.interval)
+    
+    async def run_once(self) -> int:
+        """
+        Выполняет один проход обслуживания.
+        
+        Returns:
+            Количество удалённых секций
+        """
+        partitions = await get_partitions(self.database)
+        if not partitions:
+            logger.debug("Таблица bot_actions не секционирована, обслуживание пропущено")
+            return 0
+        
+        created = await ensure_future_partitions(self.database, partitions, self.months_ahead)
+        if created:
+            logger.info(f"Созданы секции bot_actions на будущие месяцы: {created}")
+        
+        if self.retention_months <= 0:
+            return 0
+        
+        cutoff = add_months(month_start(utc_now().date()), -self.retention_months)
+        dropped = 0
+        for name in partitions:
+            month = partition_month(name)
+            if month is None or month >= cutoff:
+                continue
+            
+            if self.archive_dir:
+                path, rows = await archive_partition(self.database, name, self.archive_dir)
+                logger.info(f"Секция {name} выгружена в архив {path}: {rows} строк")
+            
+            await drop_partition(self.database, name)
+            logger.info(f"Секция {name} удалена (хранение {self.retention_months} мес.)")
+            dropped += 1
+        
+        return dropped
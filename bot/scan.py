@@ -0,0 +1,319 @@
+"""
+МОДУЛЬ: Пакетная проверка сообщений
+Прогоняет правила фильтра по выгрузкам сообщений (JSONL или текст, в том числе .gz)
+в нескольких процессах и сравнивает результат с предыдущим набором правил.
+Запуск: python -m bot.scan <файлы> [параметры]
+Использует только bot/filters.py - не требует .env и подключения к БД.
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing
+import sys
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from bot.filters import MessageFilter
+
+
+@dataclass
+class RuleSet:
+    """Набор правил: встроенные правила фильтра и дополнительные файлы."""
+    
+    word_files: List[str] = field(default_factory=list)
+    pattern_files: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ChunkResult:
+    """Результат проверки одной пачки сообщений."""
+    
+    messages: int = 0
+    blocked: int = 0
+    baseline_blocked: int = 0
+    rule_hits: Counter = field(default_factory=Counter)
+    # Сообщения, результат проверки которых изменился относительно базового набора
+    changes: List[dict] = field(default_factory=list)
+
+
+def read_lines(path: str) -> List[str]:
+    """Читает непустые строки файла правил, пропуская комментарии (#)."""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def build_filter(rule_set: RuleSet) -> MessageFilter:
+    """
+    Создаёт фильтр со встроенными правилами и правилами из файлов.
+    
+    Args:
+        rule_set: Набор правил
+    
+    Returns:
+        Готовый фильтр
+    """
+    message_filter = MessageFilter()
+    for path in rule_set.word_files:
+        for word in read_lines(path):
+            message_filter.add_word(word)
+    for path in rule_set.pattern_files:
+        for pattern in read_lines(path):
+            message_filter.add_pattern(pattern)
+    return message_filter
+
+
+def _open(path: str):
+    """Открывает файл выгрузки как текст, распаковывая .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_messages(paths: Sequence[str], fmt: str, text_field: Optional[str]) -> Iterator[Tuple[str, str]]:
+    """
+    Читает сообщения из выгрузок построчно.
+    
+    Args:
+        paths: Файлы выгрузок
+        fmt: jsonl, text или auto (по расширению файла)
+        text_field: Поле с текстом в JSONL (None - text или message_text)
+    
+    Yields:
+        Пары (файл:строка, текст сообщения)
+    """
+    for path in paths:
+        name = path[:-3] if path.endswith(".gz") else path
+        is_jsonl = fmt == "jsonl" or (fmt == "auto" and name.endswith((".jsonl", ".json")))
+        
+        with _open(path) as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                if not is_jsonl:
+                    yield f"{path}:{line_no}", line
+                    continue
+                
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict):
+                    if text_field:
+                        text = record.get(text_field)
+                    else:
+                        # Выгрузки Telegram используют text, архивы bot_actions - message_text
+                        text = record.get("text", record.get("message_text"))
+                else:
+                    text = record
+                if isinstance(text, str) and text:
+                    yield f"{path}:{line_no}", text
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Разбивает поток на списки по size элементов."""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Фильтры процесса-обработчика, создаются один раз в _init_worker
+_candidate: Optional[MessageFilter] = None
+_baseline: Optional[MessageFilter] = None
+
+
+def _init_worker(candidate: RuleSet, baseline: Optional[RuleSet]):
+    """Создаёт фильтры в процессе-обработчике."""
+    global _candidate, _baseline
+    _candidate = build_filter(candidate)
+    _baseline = build_filter(baseline) if baseline is not None else None
+
+
+def _scan_chunk(chunk: List[Tuple[str, str]]) -> ChunkResult:
+    """Проверяет пачку сообщений новым и, если задан, базовым набором правил."""
+    result = ChunkResult(messages=len(chunk))
+    texts = [text for _, text in chunk]
+    
+    before = None
+    if _baseline is not None:
+        before = [verdict.blocked for verdict in _baseline.scan_many(texts, with_rules=False)]
+        result.baseline_blocked = sum(before)
+    
+    for index, verdict in enumerate(_candidate.scan_many(texts)):
+        if verdict.blocked:
+            result.blocked += 1
+            result.rule_hits.update(verdict.rules)
+        if before is not None and before[index] != verdict.blocked:
+            result.changes.append({
+                "source": chunk[index][0],
+                "text": verdict.text,
+                "before": before[index],
+                "after": verdict.blocked,
+                "rules": verdict.rules,
+            })
+    
+    return result
+
+
+def scan(
+    messages: Iterable[Tuple[str, str]],
+    candidate: RuleSet,
+    baseline: Optional[RuleSet],
+    workers: int,
+    chunk_size: int,
+) -> Iterator[ChunkResult]:
+    """
+    Проверяет поток сообщений в пуле процессов.
+    
+    В работе одновременно не больше двух пачек на процесс, поэтому выгрузка
+    не читается в память целиком. Результаты выдаются в порядке входных данных.
+    
+    Args:
+        messages: Пары (источник, текст)
+        candidate: Проверяемый набор правил
+        baseline: Базовый набор правил для сравнения (None - без сравнения)
+        workers: Количество процессов (1 - в текущем процессе)
+        chunk_size: Размер пачки сообщений
+    
+    Yields:
+        Результаты пачек
+    """
+    chunks = chunked(messages, chunk_size)
+    
+    if workers <= 1:
+        _init_worker(candidate, baseline)
+        for chunk in chunks:
+            yield _scan_chunk(chunk)
+        return
+    
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(candidate, baseline)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_scan_chunk, (chunk,)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def main() -> int:
+    """Разбирает аргументы командной строки, проверяет выгрузки и печатает отчёт."""
+    parser = argparse.ArgumentParser(
+        prog="python -m bot.scan",
+        description="Проверка выгрузок сообщений правилами фильтра",
+    )
+    parser.add_argument("inputs", nargs="+", help="Файлы выгрузок (.jsonl, .txt, можно .gz)")
+    parser.add_argument("--format", choices=("auto", "jsonl", "text"), default="auto",
+                        help="Формат выгрузки (по умолчанию - по расширению)")
+    parser.add_argument("--field", help="Поле с текстом в JSONL (по умолчанию text или message_text)")
+    parser.add_argument("--words", action="append", default=[],
+                        help="Файл с дополнительными словами, по одному в строке")
+    parser.add_argument("--patterns", action="append", default=[],
+                        help="Файл с дополнительными регулярными выражениями")
+    parser.add_argument("--compare", action="store_true",
+                        help="Сравнить со встроенными правилами (и --baseline-*)")
+    parser.add_argument("--baseline-words", action="append", default=[],
+                        help="Дополнительные слова базового набора правил")
+    parser.add_argument("--baseline-patterns", action="append", default=[],
+                        help="Дополнительные выражения базового набора правил")
+    parser.add_argument("--diff-output", help="Записать изменившиеся результаты в JSONL-файл")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="Количество процессов")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Сообщений в пачке")
+    parser.add_argument("--top", type=int, default=20, help="Сколько правил показать в отчёте")
+    parser.add_argument("--json", action="store_true", help="Вывести отчёт в формате JSON")
+    args = parser.parse_args()
+    
+    candidate = RuleSet(word_files=args.words, pattern_files=args.patterns)
+    baseline = None
+    if args.compare or args.baseline_words or args.baseline_patterns or args.diff_output:
+        baseline = RuleSet(word_files=args.baseline_words, pattern_files=args.baseline_patterns)
+    
+    try:
+        # Ошибки в файлах правил показываем до запуска процессов
+        build_filter(candidate)
+        if baseline is not None:
+            build_filter(baseline)
+    except Exception as e:
+        print(f"Ошибка в файлах правил: {e}", file=sys.stderr)
+        return 1
+    
+    total = ChunkResult()
+    added = removed = 0
+    diff_file = open(args.diff_output, "w", encoding="utf-8") if args.diff_output else None
+    start = time.perf_counter()
+    try:
+        messages = read_messages(args.inputs, args.format, args.field)
+        for result in scan(messages, candidate, baseline, args.workers, max(1, args.chunk_size)):
+            total.messages += result.messages
+            total.blocked += result.blocked
+            total.baseline_blocked += result.baseline_blocked
+            total.rule_hits.update(result.rule_hits)
+            for change in result.changes:
+                if change["after"]:
+                    added += 1
+                else:
+                    removed += 1
+                if diff_file:
+                    diff_file.write(json.dumps(change, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Ошибка чтения выгрузки: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if diff_file:
+            diff_file.close()
+    elapsed = time.perf_counter() - start
+    
+    report = {
+        "messages": total.messages,
+        "blocked": total.blocked,
+        "block_rate": total.blocked / total.messages if total.messages else 0.0,
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(total.messages / elapsed) if elapsed else 0,
+        "rule_hits": [
+            {"rule": rule, "hits": hits, "rate": hits / total.messages}
+            for rule, hits in total.rule_hits.most_common(args.top)
+        ],
+    }
+    if baseline is not None:
+        report["baseline_blocked"] = total.baseline_blocked
+        report["newly_blocked"] = added
+        report["no_longer_blocked"] = removed
+    
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    
+    print("=" * 60)
+    print("ПРОВЕРКА ВЫГРУЗКИ ПРАВИЛАМИ ФИЛЬТРА")
+    print("=" * 60)
+    print(f"Сообщений: {report['messages']:,}")
+    print(f"Заблокировано: {report['blocked']:,} ({report['block_rate']:.2%})")
+    print(f"Время: {elapsed:.1f} с, {report['messages_per_second']:,} сообщений/с ({args.workers} процессов)")
+    
+    if report["rule_hits"]:
+        print("-" * 60)
+        print(f"{'Правило':<40} | {'Срабатываний':>12} | {'Доля':>7}")
+        for item in report["rule_hits"]:
+            print(f"{item['rule'][:40]:<40} | {item['hits']:>12,} | {item['rate']:>7.2%}")
+    
+    if baseline is not None:
+        print("-" * 60)
+        print(f"Базовый набор правил блокировал: {total.baseline_blocked:,}")
+        print(f"Новые блокировки: {added:,}")
+        print(f"Сняты блокировки: {removed:,}")
+        if args.diff_output:
+            print(f"Изменившиеся результаты записаны в {args.diff_output}")
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
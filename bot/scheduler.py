@@ -0,0 +1,171 @@
+"""
+МОДУЛЬ: Планировщик обработки обновлений
+Параллельная обработка обновлений разных чатов с сохранением порядка внутри чата:
+очередь на каждый чат и ограниченный пул воркеров.
+Подключается к Dispatcher как outer-middleware в bot/main.py.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.config import config
+from bot.logger import logger
+
+
+class WorkerStats:
+    """Статистика одного воркера планировщика."""
+    
+    __slots__ = ("processed", "failed", "wait_seconds", "handle_seconds", "max_handle_seconds", "last_handle_seconds")
+    
+    def __init__(self):
+        self.processed = 0             # Обработано обновлений
+        self.failed = 0                # Обработчик завершился исключением
+        self.wait_seconds = 0.0        # Суммарное время ожидания в очереди
+        self.handle_seconds = 0.0      # Суммарное время обработки
+        self.max_handle_seconds = 0.0  # Максимальное время обработки
+        self.last_handle_seconds = 0.0  # Время обработки последнего обновления
+
+
+class UpdateScheduler(BaseMiddleware):
+    """
+    Обрабатывает обновления ограниченным пулом воркеров с очередью на каждый чат.
+    
+    Обновления одного чата обрабатываются по очереди: чат с необработанными
+    обновлениями в каждый момент занимает не больше одного воркера. Разные чаты
+    обрабатываются параллельно, свободный воркер берёт следующий чат из общей
+    очереди готовых чатов, поэтому медленный чат задерживает только свои
+    обновления (пока медленных чатов меньше, чем воркеров). После каждого
+    обновления чат с оставшимися обновлениями встаёт в конец очереди готовых,
+    так что активный чат не захватывает воркер надолго. Количество принятых,
+    но ещё не обработанных обновлений ограничено max_in_flight: при
+    превышении получение новых обновлений ждёт.
+    """
+    
+    def __init__(self, workers: int, max_in_flight: int):
+        """
+        Args:
+            workers: Количество воркеров; 0 - обработка без планировщика
+            max_in_flight: Максимум обновлений в очередях и в обработке
+        """
+        self.workers = max(0, workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.stats: List[WorkerStats] = [WorkerStats() for _ in range(self.workers)]
+        # Чат -> его необработанные обновления; чат есть в словаре, пока он
+        # стоит в очереди готовых или обрабатывается воркером
+        self._chats: Dict[int, Deque[Tuple[Any, ...]]] = {}
+        # Чаты, ожидающие свободного воркера
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+    
+    @property
+    def running(self) -> bool:
+        """Запущены ли воркеры."""
+        return bool(self._tasks)
+    
+    @property
+    def in_flight(self) -> int:
+        """Количество принятых, но ещё не обработанных обновлений."""
+        return self._in_flight
+    
+    @property
+    def active_chats(self) -> int:
+        """Количество чатов с необработанными обновлениями."""
+        return len(self._chats)
+    
+    @property
+    def ready_chats(self) -> int:
+        """Глубина очереди: чаты, ожидающие свободного воркера."""
+        return self._ready.qsize() if self._ready is not None else 0
+    
+    def start(self):
+        """Запускает воркеры в текущем event loop."""
+        if self.running or not self.workers:
+            return
+        
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+        logger.info(f"Планировщик обновлений запущен: {self.workers} воркеров, до {self.max_in_flight} в обработке")
+    
+    async def stop(self):
+        """Дожидается обработки принятых обновлений и останавливает воркеры."""
+        if not self.running:
+            return
+        
+        await self._ready.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Планировщик обновлений остановлен")
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Ставит обновление в очередь его чата."""
+        if not self.running:
+            return await handler(event, data)
+        
+        # event_chat и event_from_user заполняет UserContextMiddleware диспетчера
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else (user.id if user else 0)
+        
+        # Обратное давление: ждём, пока освободится место
+        await self._slots.acquire()
+        self._in_flight += 1
+        item = (handler, event, data, time.perf_counter())
+        pending = self._chats.get(key)
+        if pending is None:
+            self._chats[key] = deque((item,))
+            self._ready.put_nowait(key)
+        else:
+            # Чат уже ждёт воркер или обрабатывается: обновление дождётся своей очереди
+            pending.append(item)
+    
+    async def _worker(self, index: int):
+        """Обрабатывает по одному обновлению готовых чатов."""
+        ready = self._ready
+        stats = self.stats[index]
+        
+        while True:
+            key = await ready.get()
+            pending = self._chats[key]
+            handler, event, data, enqueued = pending.popleft()
+            started = time.perf_counter()
+            try:
+                await handler(event, data)
+            except Exception as e:
+                stats.failed += 1
+                logger.error(f"Ошибка при обработке обновления чата {key}: {e}")
+            finally:
+                elapsed = time.perf_counter() - started
+                stats.processed += 1
+                stats.wait_seconds += started - enqueued
+                stats.handle_seconds += elapsed
+                stats.last_handle_seconds = elapsed
+                stats.max_handle_seconds = max(stats.max_handle_seconds, elapsed)
+                
+                # Оставшиеся обновления чата - в конец очереди готовых чатов
+                if pending:
+                    ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                
+                self._in_flight -= 1
+                self._slots.release()
+                ready.task_done()
+
+
+# Глобальный экземпляр планировщика
+update_scheduler = UpdateScheduler(config.UPDATE_WORKERS, config.MAX_IN_FLIGHT_UPDATES)
@@ -0,0 +1,484 @@
+"""
+МОДУЛЬ: Локальный журнал действий
+Принимает действия бота, когда БД недоступна или записывает пачку дольше
+допустимого, и сохраняет их в файлы на диске, чтобы история модерации не
+терялась во время сбоев. Фоновая задача переносит журнал в БД большими
+пачками, когда БД снова отвечает.
+Журнал - последовательность файлов-сегментов, которые только дополняются;
+запись: длина (4 байта), CRC32 (4 байта) и JSON действия. fsync
+выполняется один раз на пачку действий.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, List, Optional, Tuple
+
+from bot.logger import logger
+from bot.models import BotAction, utc_now
+
+
+# Заголовок записи: длина JSON и его CRC32
+RECORD_HEADER = struct.Struct(">II")
+
+SEGMENT_SUFFIX = ".spool"
+CHECKPOINT_FILE = "replay.json"
+
+# Размер сегмента, после которого новые записи идут в следующий файл
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def encode_action(action: BotAction, default_time: datetime) -> bytes:
+    """
+    Кодирует действие в запись журнала.
+    
+    Args:
+        action: Действие
+        default_time: Время действия, если created_at не задано
+    
+    Returns:
+        Заголовок и JSON действия
+    """
+    data = action.to_dict()
+    data["created_at"] = (action.created_at or default_time).isoformat()
+    payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_action(payload: bytes) -> BotAction:
+    """Восстанавливает действие из JSON записи журнала."""
+    data = json.loads(payload)
+    data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return BotAction(**data)
+
+
+def read_records(path: Path, offset: int, limit: int) -> Tuple[List[BotAction], int, bool]:
+    """
+    Читает записи сегмента начиная со смещения.
+    
+    Args:
+        path: Файл сегмента
+        offset: Смещение первой записи
+        limit: Максимальное количество записей
+    
+    Returns:
+        Действия, смещение после последней прочитанной записи и признак
+        повреждённой записи (неполной или с неверной CRC32)
+    """
+    actions = []
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while len(actions) < limit:
+            header = file.read(RECORD_HEADER.size)
+            if not header:
+                break
+            if len(header) < RECORD_HEADER.size:
+                return actions, offset, True
+            
+            length, checksum = RECORD_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return actions, offset, True
+            
+            actions.append(decode_action(payload))
+            offset += RECORD_HEADER.size + length
+    return actions, offset, False
+
+
+def count_records(path: Path, offset: int) -> int:
+    """Считает записи сегмента после смещения по заголовкам (без проверки CRC32)."""
+    count = 0
+    size = path.stat().st_size
+    with open(path, "rb") as file:
+        while offset + RECORD_HEADER.size <= size:
+            file.seek(offset)
+            length, _ = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+            offset += RECORD_HEADER.size + length
+            if offset > size:
+                break
+            count += 1
+    return count
+
+
+def worker_spool_dir(directory: str, worker_index: int) -> str:
+    """
+    Возвращает каталог журнала процесса-обработчика webhook.
+    
+    Процессы не делят сегменты, поэтому у каждого свой каталог.
+    
+    Args:
+        directory: Каталог журнала основного процесса
+        worker_index: Номер процесса (0 - основной)
+    
+    Returns:
+        Путь вида data/spool/worker-1
+    """
+    if worker_index == 0:
+        return directory
+    return str(Path(directory) / f"worker-{worker_index}")
+
+
+def _fsync_directory(directory: Path):
+    """Сбрасывает на диск запись каталога о новом файле (там, где это поддерживается)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@dataclass
+class SpoolStats:
+    """Счётчики локального журнала."""
+    
+    spooled: int = 0     # Записано в журнал
+    replayed: int = 0    # Перенесено из журнала в БД
+    corrupted: int = 0   # Сегментов с повреждённым хвостом (остаток пропущен)
+    failed: int = 0      # Не удалось записать в журнал (действия потеряны)
+
+
+class ActionSpool:
+    """
+    Локальный журнал действий с переносом в БД.
+    
+    Пока БД считается недоступной (ошибка записи или пачка дольше
+    latency_budget), хранилище пишет действия сюда; через retry_interval
+    секунд запись в БД пробуется снова, а фоновая задача переносит
+    накопленное пачками по replay_batch. Доставка "хотя бы один раз":
+    если процесс остановится между записью пачки в БД и сохранением
+    позиции, пачка будет перенесена повторно.
+    """
+    
+    def __init__(
+        self,
+        database: "Storage",
+        directory: str,
+        latency_budget: float,
+        write_timeout: float,
+        retry_interval: float,
+        replay_batch: int,
+    ):
+        """
+        Args:
+            database: Хранилище, в которое переносится журнал
+            directory: Каталог сегментов журнала
+            latency_budget: Допустимая длительность записи пачки в БД в секундах
+            write_timeout: Время в секундах, после которого следующие пачки идут в журнал
+            retry_interval: Пауза в секундах перед повторной попыткой записи в БД
+            replay_batch: Количество действий в одной пачке переноса
+        """
+        self.database = database
+        self.directory = Path(directory)
+        self.latency_budget = latency_budget
+        self.write_timeout = write_timeout
+        self.retry_interval = retry_interval
+        self.replay_batch = max(1, replay_batch)
+        self.stats = SpoolStats()
+        # Действия в журнале, ещё не перенесённые в БД
+        self.pending = 0
+        # Момент (time.monotonic), до которого запись в БД не пробуется
+        self._unhealthy_until: Optional[float] = None
+        # Запись, чтение и удаление сегментов выполняются по очереди
+        self._lock = asyncio.Lock()
+        self._file: Optional[BinaryIO] = None
+        self._active: Optional[Path] = None
+        self._next_index = 1
+        # Позиция переноса: сегмент и смещение первой неперенесённой записи
+        self._read_segment: Optional[Path] = None
+        self._read_offset = 0
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def running(self) -> bool:
+        """Запущена ли фоновая задача переноса."""
+        return self._task is not None and not self._task.done()
+    
+    @property
+    def healthy(self) -> bool:
+        """Можно ли писать действия в БД напрямую."""
+        return self._unhealthy_until is None or time.monotonic() >= self._unhealthy_until
+    
+    def mark_unhealthy(self, reason: str):
+        """
+        Переключает запись действий в журнал на retry_interval секунд.
+        
+        Args:
+            reason: Причина для лога
+        """
+        if self._unhealthy_until is None:
+            logger.warning(f"Запись в БД приостановлена, действия сохраняются в локальный журнал: {reason}")
+        self._unhealthy_until = time.monotonic() + self.retry_interval
+    
+    def mark_healthy(self):
+        """Возвращает прямую запись действий в БД."""
+        if self._unhealthy_until is not None:
+            logger.info("Запись в БД восстановлена")
+            self._unhealthy_until = None
+    
+    def record_write(self, elapsed: float):
+        """
+        Учитывает успешную запись пачки в БД.
+        
+        Args:
+            elapsed: Длительность записи в секундах
+        """
+        if elapsed > self.latency_budget:
+            self.mark_unhealthy(f"запись пачки заняла {elapsed * 1000:.0f} мс")
+        else:
+            self.mark_healthy()
+    
+    async def start(self):
+        """Находит оставшиеся сегменты журнала и запускает фоновый перенос."""
+        await asyncio.to_thread(self._open)
+        if self.pending:
+            logger.warning(f"В локальном журнале {self.pending} действий, ожидающих переноса в БД")
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает перенос и закрывает активный сегмент."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        async with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+                self._active = None
+        
+        if self.pending:
+            logger.warning(
+                f"В локальном журнале осталось {self.pending} действий, "
+                f"они будут перенесены в БД после запуска"
+            )
+    
+    async def append(self, actions: List[BotAction]) -> bool:
+        """
+        Дописывает действия в журнал и сбрасывает их на диск.
+        
+        Действиям без created_at проставляется текущее время, чтобы
+        после переноса в БД сохранилось время их совершения.
+        
+        Args:
+            actions: Список действий
+        
+        Returns:
+            True если действия на диске, False в случае ошибки
+        """
+        now = utc_now()
+        data = b"".join(encode_action(action, now) for action in actions)
+        try:
+            async with self._lock:
+                await asyncio.to_thread(self._write, data)
+        except OSError as e:
+            self.stats.failed += len(actions)
+            logger.error(f"Ошибка записи в локальный журнал ({len(actions)} шт.): {e}")
+            return False
+        
+        self.pending += len(actions)
+        self.stats.spooled += len(actions)
+        logger.debug("Сохранено действий в локальный журнал: %s", len(actions))
+        return True
+    
+    async def replay(self) -> int:
+        """
+        Переносит журнал в БД, пока он не опустеет или запись не завершится ошибкой.
+        
+        Returns:
+            Количество перенесённых действий
+        """
+        replayed = 0
+        
+        while self.pending > 0:
+            if not self.database.connected:
+                try:
+                    await self.database.connect()
+                except Exception as e:
+                    self.mark_unhealthy(f"нет подключения к БД: {e}")
+                    break
+            
+            async with self._lock:
+                segment, offset = self._read_segment, self._read_offset
+                if segment is None:
+                    break
+                actions, end, corrupted = await asyncio.to_thread(
+                    read_records, segment, offset, self.replay_batch
+                )
+            
+            if actions:
+                try:
+                    await self.database.write_actions(actions, "replay_actions")
+                except Exception as e:
+                    self.mark_unhealthy(f"ошибка переноса журнала: {e}")
+                    break
+                self.mark_healthy()
+                self.pending -= len(actions)
+                self.stats.replayed += len(actions)
+                replayed += len(actions)
+            
+            async with self._lock:
+                await asyncio.to_thread(self._advance, end, corrupted)
+            
+            # Защита от зацикливания, если счётчик разошёлся с файлами
+            if not actions and (self._read_segment, self._read_offset) == (segment, offset):
+                self.pending = await asyncio.to_thread(self._count_pending)
+                break
+        
+        if replayed:
+            logger.info(f"Перенесено из локального журнала в БД: {replayed}, осталось {self.pending}")
+        return replayed
+    
+    async def _run(self):
+        """Фоновая задача: раз в retry_interval переносит журнал, если БД доступна."""
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            if self.pending and self.healthy:
+                try:
+                    await self.replay()
+                except Exception as e:
+                    logger.error(f"Ошибка при переносе локального журнала: {e}")
+    
+    def _segments(self) -> List[Path]:
+        """Сегменты журнала по порядку записи."""
+        return sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+    
+    def _open(self):
+        """Восстанавливает позицию переноса и количество записей после перезапуска."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        
+        checkpoint_name, checkpoint_offset = "", 0
+        checkpoint = self.directory / CHECKPOINT_FILE
+        if checkpoint.exists():
+            data = json.loads(checkpoint.read_text(encoding="utf-8"))
+            checkpoint_name, checkpoint_offset = data["segment"], data["offset"]
+        
+        segments = []
+        for segment in self._segments():
+            # Сегменты до позиции уже перенесены (удаление прервано остановкой процесса)
+            if segment.name < checkpoint_name:
+                segment.unlink()
+            else:
+                segments.append(segment)
+        
+        last = max([checkpoint_name] + [segment.name for segment in segments])
+        self._next_index = int(last[:-len(SEGMENT_SUFFIX)]) + 1 if last else 1
+        
+        if segments:
+            self._read_segment = segments[0]
+            self._read_offset = checkpoint_offset if segments[0].name == checkpoint_name else 0
+        self.pending = self._count_pending()
+    
+    def _count_pending(self) -> int:
+        """Считает неперенесённые записи во всех сегментах."""
+        if self._read_segment is None:
+            return 0
+        return sum(
+            count_records(segment, self._read_offset if segment == self._read_segment else 0)
+            for segment in self._segments()
+            if segment.name >= self._read_segment.name
+        )
+    
+    def _write(self, data: bytes):
+        """Дописывает данные в активный сегмент и сбрасывает их на диск."""
+        if self._file is None or self._file.tell() >= SEGMENT_MAX_BYTES:
+            self._roll()
+        
+        position = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError:
+            # Неполная запись не должна закрыть доступ к следующим
+            try:
+                self._file.truncate(position)
+            except OSError:
+                pass
+            raise
+    
+    def _roll(self):
+        """Закрывает активный сегмент и создаёт следующий."""
+        if self._file:
+            self._file.close()
+        
+        self._active = self.directory / f"{self._next_index:08d}{SEGMENT_SUFFIX}"
+        self._next_index += 1
+        self._file = open(self._active, "ab")
+        _fsync_directory(self.directory)
+        
+        if self._read_segment is None:
+            self._read_segment, self._read_offset = self._active, 0
+    
+    def _advance(self, end: int, corrupted: bool):
+        """Сдвигает позицию переноса; полностью перенесённые сегменты удаляются."""
+        segment = self._read_segment
+        self._read_offset = end
+        
+        if segment == self._active:
+            if corrupted:
+                # Дальше в активный сегмент не пишем, остаток пропускается как у закрытого
+                self._file.close()
+                self._file = None
+                self._active = None
+            elif self._file.tell() == end:
+                # Всё записанное перенесено: сегмент больше не нужен
+                self._file.close()
+                self._file = None
+                self._active = None
+                self._save_checkpoint(segment.name, end)
+                segment.unlink()
+                self._read_segment, self._read_offset = None, 0
+                return
+            else:
+                self._save_checkpoint(segment.name, end)
+                return
+        
+        size = segment.stat().st_size
+        if not corrupted and end < size:
+            self._save_checkpoint(segment.name, end)
+            return
+        
+        if corrupted:
+            self.stats.corrupted += 1
+            logger.error(
+                f"Повреждённая запись в {segment.name} (смещение {end}), "
+                f"остаток сегмента ({size - end} байт) пропущен"
+            )
+        
+        following = [path for path in self._segments() if path.name > segment.name]
+        if following:
+            self._save_checkpoint(following[0].name, 0)
+            self._read_segment, self._read_offset = following[0], 0
+        else:
+            self._save_checkpoint(f"{self._next_index:08d}{SEGMENT_SUFFIX}", 0)
+            self._read_segment, self._read_offset = None, 0
+        segment.unlink()
+        
+        if corrupted:
+            self.pending = self._count_pending()
+    
+    def _save_checkpoint(self, segment_name: str, offset: int):
+        """Атомарно сохраняет позицию переноса."""
+        path = self.directory / CHECKPOINT_FILE
+        temp = path.with_suffix(".tmp")
+        with open(temp, "w", encoding="utf-8") as file:
+            json.dump({"segment": segment_name, "offset": offset}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, path)
@@ -0,0 +1,438 @@
+"""
+МОДУЛЬ: Хранилище SQLite
+Реализация хранилища на встроенной БД SQLite (aiosqlite) для небольших
+установок, тестов и бенчмарков: без сервера MySQL и сетевых запросов.
+Файл БД работает в режиме WAL, действия записываются пачками в одной
+транзакции, чтение идёт через отдельное соединение и не ждёт записи.
+Схема создаётся при подключении. Выбирается переменной DB_BACKEND=sqlite.
+"""
+
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from bot.logger import logger
+from bot.models import BotAction, utc_now
+from bot.storage import HISTORY_COLUMNS, POLICY_COLUMNS, Storage, action_row
+
+
+# Схема БД; соответствует init.sql для MySQL
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bot_actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action_type TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    chat_id INTEGER NOT NULL,
+    message_text TEXT,
+    reason TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_user_id ON bot_actions (user_id);
+CREATE INDEX IF NOT EXISTS idx_chat_id ON bot_actions (chat_id);
+CREATE INDEX IF NOT EXISTS idx_created_at ON bot_actions (created_at);
+CREATE INDEX IF NOT EXISTS idx_chat_created ON bot_actions (chat_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_chat_action_created ON bot_actions (chat_id, action_type, created_at);
+
+CREATE TABLE IF NOT EXISTS chat_action_counters (
+    chat_id INTEGER NOT NULL,
+    action_type TEXT NOT NULL,
+    action_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, action_type)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chat_action_daily (
+    chat_id INTEGER NOT NULL,
+    action_type TEXT NOT NULL,
+    day TEXT NOT NULL,
+    action_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, action_type, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chat_policies (
+    chat_id INTEGER NOT NULL PRIMARY KEY,
+    lexicons TEXT,
+    action TEXT,
+    mute_seconds INTEGER,
+    duplicate_chat_limit INTEGER,
+    duplicate_global_limit INTEGER,
+    updated_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS user_strikes (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    strikes INTEGER NOT NULL DEFAULT 0,
+    last_strike_at TEXT NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+) WITHOUT ROWID;
+"""
+
+# Время действия всегда задаётся явно (UTC), день в счётчиках берётся из него же
+INSERT_ACTION_SQL = """
+    INSERT INTO bot_actions (action_type, user_id, username, chat_id, message_text, reason, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_COUNTER_SQL = """
+    INSERT INTO chat_action_counters (chat_id, action_type, action_count) VALUES (?, ?, ?)
+    ON CONFLICT (chat_id, action_type) DO UPDATE SET action_count = action_count + excluded.action_count
+"""
+
+UPSERT_DAILY_SQL = """
+    INSERT INTO chat_action_daily (chat_id, action_type, day, action_count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (chat_id, action_type, day) DO UPDATE SET action_count = action_count + excluded.action_count
+"""
+
+UPSERT_STRIKES_SQL = """
+    INSERT INTO user_strikes (chat_id, user_id, strikes, last_strike_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (chat_id, user_id) DO UPDATE SET
+        strikes = excluded.strikes, last_strike_at = excluded.last_strike_at
+"""
+
+# Сколько миллисекунд ждать блокировку записи, занятую другим процессом
+BUSY_TIMEOUT_MS = 5000
+
+
+def _format_time(value: datetime) -> str:
+    """Время в формате колонок SQLite (как datetime('now'))."""
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _row_dict(row: aiosqlite.Row) -> Dict[str, Any]:
+    """Строка истории действий со временем в datetime, как у MySQL."""
+    data = dict(row)
+    if data.get("created_at"):
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return data
+
+
+class SQLiteDatabase(Storage):
+    """Хранилище в файле SQLite."""
+    
+    backend = "sqlite"
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу БД (":memory:" - БД в памяти на время работы процесса)
+        """
+        super().__init__()
+        self.path = path
+        # Соединение записи (транзакции по одной под _write_lock) и соединение чтения
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._reader: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+    
+    async def _open(self) -> aiosqlite.Connection:
+        """Открывает соединение в режиме autocommit: транзакции задаются явно."""
+        conn = await aiosqlite.connect(self.path, isolation_level=None)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        return conn
+    
+    async def connect(self):
+        """Открывает файл БД, включает WAL и создаёт схему."""
+        try:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            
+            self._conn = await self._open()
+            # WAL: читатели не блокируют запись; NORMAL - fsync при контрольной точке, а не на каждый COMMIT
+            await self._conn.execute("PRAGMA journal_mode = WAL")
+            await self._conn.execute("PRAGMA synchronous = NORMAL")
+            await self._conn.executescript(SCHEMA)
+            
+            # БД в памяти видна только открывшему её соединению
+            self._reader = self._conn if self.path == ":memory:" else await self._open()
+            
+            self.counters_enabled = True
+            self.policies_enabled = True
+            self.strikes_enabled = True
+            logger.info(f"Подключение к БД SQLite установлено: {self.path}")
+            
+            # Запускаем отложенную запись действий пачками
+            self._start_writer()
+        except Exception as e:
+            logger.error(f"Ошибка подключения к БД SQLite: {e}")
+            await self._close()
+            raise
+    
+    async def _close(self):
+        """Закрывает соединения."""
+        if self._reader is not None and self._reader is not self._conn:
+            await self._reader.close()
+        if self._conn is not None:
+            await self._conn.close()
+            logger.info("Подключение к БД SQLite закрыто")
+        self._reader = None
+        self._conn = None
+    
+    @property
+    def connected(self) -> bool:
+        """Открыт ли файл БД."""
+        return self._conn is not None
+    
+    @asynccontextmanager
+    async def _transaction(self):
+        """Транзакция записи; одновременные транзакции процесса выполняются по очереди."""
+        if self._conn is None:
+            raise RuntimeError("БД SQLite не подключена. Вызовите connect() сначала.")
+        
+        async with self._write_lock:
+            # IMMEDIATE: блокировка записи берётся сразу, без повышения блокировки чтения
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                await self._conn.execute("ROLLBACK")
+                raise
+            await self._conn.execute("COMMIT")
+    
+    async def _fetchall(self, sql: str, params: tuple = ()) -> List[aiosqlite.Row]:
+        """Выполняет запрос чтения."""
+        if self._reader is None:
+            raise RuntimeError("БД SQLite не подключена. Вызовите connect() сначала.")
+        async with self._reader.execute(sql, params) as cur:
+            return await cur.fetchall()
+    
+    async def _insert_actions(self, actions: List[BotAction]):
+        """Записывает действия и счётчики одной транзакцией."""
+        now = utc_now()
+        times = [action.created_at or now for action in actions]
+        totals = Counter((action.chat_id, action.action_type) for action in actions)
+        daily = Counter(
+            (action.chat_id, action.action_type, at.date().isoformat())
+            for action, at in zip(actions, times)
+        )
+        async with self._transaction() as conn:
+            await conn.executemany(
+                INSERT_ACTION_SQL,
+                [(*action_row(action), _format_time(at)) for action, at in zip(actions, times)]
+            )
+            await conn.executemany(
+                UPSERT_COUNTER_SQL,
+                [(chat_id, action_type, count) for (chat_id, action_type), count in totals.items()]
+            )
+            await conn.executemany(
+                UPSERT_DAILY_SQL,
+                [(chat_id, action_type, day, count) for (chat_id, action_type, day), count in daily.items()]
+            )
+    
+    async def rebuild_counters(self) -> int:
+        """
+        Пересчитывает таблицы счётчиков по всем строкам bot_actions.
+        
+        Returns:
+            Количество строк в chat_action_counters после пересчёта
+        """
+        async with self._transaction() as conn:
+            await conn.execute("DELETE FROM chat_action_counters")
+            cur = await conn.execute(
+                """
+                INSERT INTO chat_action_counters (chat_id, action_type, action_count)
+                SELECT chat_id, action_type, COUNT(*) FROM bot_actions
+                GROUP BY chat_id, action_type
+                """
+            )
+            rows = cur.rowcount
+            await conn.execute("DELETE FROM chat_action_daily")
+            await conn.execute(
+                """
+                INSERT INTO chat_action_daily (chat_id, action_type, day, action_count)
+                SELECT chat_id, action_type, date(created_at), COUNT(*) FROM bot_actions
+                GROUP BY chat_id, action_type, date(created_at)
+                """
+            )
+        return rows
+    
+    async def get_stats(self, chat_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получает статистику действий.
+        
+        Args:
+            chat_id: ID чата (если None, возвращает для всех чатов)
+            limit: Максимальное количество записей
+        
+        Returns:
+            Список словарей с данными действий
+        """
+        try:
+            if chat_id:
+                rows = await self._fetchall(
+                    f"SELECT {HISTORY_COLUMNS}, message_text FROM bot_actions "
+                    f"WHERE chat_id = ? ORDER BY created_at DESC LIMIT ?",
+                    (chat_id, limit)
+                )
+            else:
+                rows = await self._fetchall(
+                    f"SELECT {HISTORY_COLUMNS}, message_text FROM bot_actions ORDER BY created_at DESC LIMIT ?",
+                    (limit,)
+                )
+            return [_row_dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики: {e}")
+            return []
+    
+    async def get_stats_page(
+        self,
+        chat_id: int,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        include_text: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Получает страницу истории действий чата от новых к старым.
+        
+        Args:
+            chat_id: ID чата
+            before_id: Вернуть записи с id меньше указанного (None - с самой новой)
+            limit: Максимальное количество записей
+            include_text: Добавить в результат текст сообщения
+        
+        Returns:
+            Список словарей с данными действий; before_id следующей страницы -
+            id последнего элемента
+        """
+        columns = f"{HISTORY_COLUMNS}, message_text" if include_text else HISTORY_COLUMNS
+        # Индекс idx_chat_id неявно содержит id (rowid), поэтому сортировка не нужна
+        try:
+            if before_id is not None:
+                rows = await self._fetchall(
+                    f"SELECT {columns} FROM bot_actions WHERE chat_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                    (chat_id, before_id, limit)
+                )
+            else:
+                rows = await self._fetchall(
+                    f"SELECT {columns} FROM bot_actions WHERE chat_id = ? ORDER BY id DESC LIMIT ?",
+                    (chat_id, limit)
+                )
+            return [_row_dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка при получении истории действий: {e}")
+            return []
+    
+    async def _count_actions(self, action_type: str, chat_id: Optional[int]) -> int:
+        """Считает действия по таблице счётчиков."""
+        if chat_id:
+            rows = await self._fetchall(
+                "SELECT action_count FROM chat_action_counters WHERE action_type = ? AND chat_id = ?",
+                (action_type, chat_id)
+            )
+        else:
+            rows = await self._fetchall(
+                "SELECT SUM(action_count) FROM chat_action_counters WHERE action_type = ?",
+                (action_type,)
+            )
+        return int(rows[0][0]) if rows and rows[0][0] is not None else 0
+    
+    async def _load_action_counts(self, chat_id: int) -> Dict[str, int]:
+        """Считает действия чата по типам."""
+        rows = await self._fetchall(
+            "SELECT action_type, action_count FROM chat_action_counters WHERE chat_id = ?",
+            (chat_id,)
+        )
+        return {action_type: int(count) for action_type, count in rows}
+    
+    async def get_chat_policy(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Получает политику модерации чата.
+        
+        Args:
+            chat_id: ID чата
+        
+        Returns:
+            Словарь с колонками POLICY_COLUMNS или None, если политика не задана
+        
+        Raises:
+            Exception: Ошибка запроса
+        """
+        rows = await self._fetchall(
+            f"SELECT {', '.join(POLICY_COLUMNS)} FROM chat_policies WHERE chat_id = ?",
+            (chat_id,)
+        )
+        return dict(rows[0]) if rows else None
+    
+    async def save_chat_policy(self, chat_id: int, values: Dict[str, Any]) -> bool:
+        """
+        Создаёт или изменяет политику модерации чата.
+        
+        Args:
+            chat_id: ID чата
+            values: Изменяемые колонки из POLICY_COLUMNS (None - значение по умолчанию)
+        
+        Returns:
+            True если успешно, False в случае ошибки
+        """
+        columns = [column for column in POLICY_COLUMNS if column in values]
+        if not columns:
+            return True
+        
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+        try:
+            async with self._transaction() as conn:
+                await conn.execute(
+                    f"""
+                    INSERT INTO chat_policies (chat_id, {', '.join(columns)})
+                    VALUES (?{', ?' * len(columns)})
+                    ON CONFLICT (chat_id) DO UPDATE SET {updates},
+                        updated_at = datetime('now', 'localtime')
+                    """,
+                    (chat_id, *(values[column] for column in columns))
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении политики чата {chat_id}: {e}")
+            return False
+    
+    async def get_user_strikes(self, chat_id: int, user_id: int) -> Optional[Tuple[int, datetime]]:
+        """
+        Получает счётчик нарушений пользователя в чате.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+        
+        Returns:
+            Количество нарушений и время последнего или None, если записи нет
+        
+        Raises:
+            Exception: Ошибка запроса
+        """
+        rows = await self._fetchall(
+            "SELECT strikes, last_strike_at FROM user_strikes WHERE chat_id = ? AND user_id = ?",
+            (chat_id, user_id)
+        )
+        if not rows:
+            return None
+        return int(rows[0][0]), datetime.fromisoformat(rows[0][1])
+    
+    async def save_user_strikes(self, rows: List[Tuple[int, int, int, datetime]]) -> bool:
+        """
+        Записывает счётчики нарушений пачкой в одной транзакции.
+        
+        Args:
+            rows: Кортежи (chat_id, user_id, нарушений, время последнего нарушения)
+        
+        Returns:
+            True если успешно, False в случае ошибки
+        """
+        if not rows:
+            return True
+        
+        try:
+            async with self._transaction() as conn:
+                await conn.executemany(
+                    UPSERT_STRIKES_SQL,
+                    [(chat_id, user_id, strikes, _format_time(last)) for chat_id, user_id, strikes, last in rows]
+                )
+            logger.debug("Сохранено счётчиков нарушений: %s", len(rows))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении счётчиков нарушений ({len(rows)} шт.): {e}")
+            return False
@@ -0,0 +1,624 @@
+"""
+МОДУЛЬ: Хранилище данных
+Общий интерфейс хранения действий бота, политик чатов и счётчиков нарушений
+и независимая от СУБД часть: отложенная запись пачками, кэш счётчиков /stats
+и метрики операций. Реализации: MySQL (bot/database.py) и SQLite
+(bot/sqlite_storage.py); выбирается переменной DB_BACKEND.
+"""
+
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bot.config import config
+from bot.logger import logger
+from bot.metrics import db_errors, db_query_seconds
+from bot.models import BotAction
+from bot.spool import ActionSpool
+
+
+# Колонки политики чата (таблица chat_policies)
+POLICY_COLUMNS = ("lexicons", "action", "mute_seconds", "duplicate_chat_limit", "duplicate_global_limit")
+
+
+# Колонки истории действий; message_text выбирается только по запросу
+HISTORY_COLUMNS = "id, action_type, user_id, username, chat_id, reason, created_at"
+
+
+def action_row(action: BotAction) -> tuple:
+    """Преобразует действие в кортеж (action_type, user_id, username, chat_id, message_text, reason)."""
+    return (
+        action.action_type,
+        action.user_id,
+        action.username,
+        action.chat_id,
+        action.message_text,
+        action.reason,
+    )
+
+
+@dataclass
+class WriterStats:
+    """Счётчики буферизованной записи действий."""
+    
+    enqueued: int = 0          # Принято в очередь
+    written: int = 0           # Записано в БД
+    failed: int = 0            # Потеряно из-за ошибок записи
+    batches: int = 0           # Выполнено пачек INSERT
+    producer_waits: int = 0    # Сколько раз обработчик ждал места в очереди
+    producer_wait_seconds: float = 0.0  # Суммарное время ожидания места в очереди
+    max_queue_depth: int = 0   # Максимальная наблюдавшаяся глубина очереди
+    last_flush_seconds: float = 0.0     # Длительность последнего сброса
+
+
+class ActionWriter:
+    """
+    Отложенная запись действий в БД пачками.
+    
+    Действия складываются в ограниченную очередь и сбрасываются одним
+    многострочным INSERT, когда набирается batch_size строк или проходит
+    flush_interval секунд с момента прихода первого действия пачки.
+    """
+    
+    def __init__(self, database: "Storage", batch_size: int, flush_interval: float, max_queue: int):
+        """
+        Args:
+            database: База данных, в которую сбрасываются пачки
+            batch_size: Максимальное количество строк в одном INSERT
+            flush_interval: Максимальное время ожидания пачки в секундах
+            max_queue: Размер очереди, при заполнении обработчики ждут
+        """
+        self.database = database
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.stats = WriterStats()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def running(self) -> bool:
+        """Запущена ли фоновая задача записи."""
+        return self._task is not None and not self._task.done()
+    
+    @property
+    def queue_depth(self) -> int:
+        """Текущее количество действий, ожидающих записи."""
+        return self._queue.qsize()
+    
+    def start(self):
+        """Запускает фоновую задачу записи в текущем event loop."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+    
+    async def put(self, action: BotAction):
+        """
+        Ставит действие в очередь на запись.
+        
+        Если очередь заполнена, ждёт освобождения места (обратное давление).
+        
+        Args:
+            action: Действие для записи
+        """
+        if self._queue.full():
+            self.stats.producer_waits += 1
+            started = time.perf_counter()
+            await self._queue.put(action)
+            self.stats.producer_wait_seconds += time.perf_counter() - started
+        else:
+            self._queue.put_nowait(action)
+        
+        self.stats.enqueued += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self._queue.qsize())
+    
+    async def stop(self):
+        """Дожидается записи всех действий из очереди и останавливает задачу."""
+        if not self.running:
+            return
+        
+        # None - сигнал завершения, встаёт в очередь после всех действий
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+    
+    async def _run(self):
+        """Основной цикл: собирает пачки из очереди и записывает их."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            action = await self._queue.get()
+            if action is None:
+                break
+            
+            batch = [action]
+            deadline = loop.time() + self.flush_interval
+            
+            while len(batch) < self.batch_size:
+                # Сначала забираем то, что уже лежит в очереди
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        action = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    action = self._queue.get_nowait()
+                
+                if action is None:
+                    stopping = True
+                    break
+                batch.append(action)
+            
+            await self._flush(batch)
+    
+    async def _flush(self, batch: List[BotAction]):
+        """Записывает пачку действий в БД."""
+        started = time.perf_counter()
+        if await self.database.insert_actions(batch):
+            self.stats.written += len(batch)
+        else:
+            self.stats.failed += len(batch)
+        self.stats.batches += 1
+        self.stats.last_flush_seconds = time.perf_counter() - started
+
+
+class ActionCountsCache:
+    """
+    Кэш счётчиков действий по чатам с временем жизни и вытеснением LRU.
+    
+    Записи не сбрасываются при сохранении действий, а увеличиваются,
+    поэтому /stats в активном чате не выполняет повторный запрос к БД.
+    """
+    
+    def __init__(self, ttl: float, max_size: int):
+        """
+        Args:
+            ttl: Время жизни записи в секундах
+            max_size: Максимальное количество чатов в кэше
+        """
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        # chat_id -> (время устаревания, счётчики по типам действий)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Чаты, для которых сейчас выполняется запрос, и признак записи во время запроса
+        self._loading: Dict[int, bool] = {}
+    
+    def get(self, chat_id: int) -> Optional[Dict[str, int]]:
+        """
+        Возвращает копию счётчиков чата или None, если записи нет или она устарела.
+        
+        Args:
+            chat_id: ID чата
+        """
+        entry = self._entries.get(chat_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(chat_id, None)
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(chat_id)
+        self.hits += 1
+        return dict(entry[1])
+    
+    def begin_load(self, chat_id: int):
+        """Отмечает начало запроса счётчиков чата из БД."""
+        self._loading[chat_id] = False
+    
+    def cancel_load(self, chat_id: int):
+        """Отмечает, что запрос счётчиков чата завершился ошибкой."""
+        self._loading.pop(chat_id, None)
+    
+    def put(self, chat_id: int, counts: Dict[str, int]):
+        """
+        Сохраняет счётчики, загруженные из БД.
+        
+        Если во время запроса в чат записывались действия, результат
+        не сохраняется: неизвестно, учёл ли его запрос.
+        
+        Args:
+            chat_id: ID чата
+            counts: Счётчики по типам действий
+        """
+        if self._loading.pop(chat_id, False):
+            return
+        
+        self._entries[chat_id] = (time.monotonic() + self.ttl, dict(counts))
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def increment(self, chat_id: int, action_type: str, count: int = 1):
+        """
+        Учитывает действия, записанные в БД.
+        
+        Args:
+            chat_id: ID чата
+            action_type: Тип действия
+            count: Количество записанных действий
+        """
+        if chat_id in self._loading:
+            self._loading[chat_id] = True
+        
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            counts = entry[1]
+            counts[action_type] = counts.get(action_type, 0) + count
+
+
+class Storage(ABC):
+    """
+    Хранилище действий, политик чатов и счётчиков нарушений.
+    
+    Базовый класс выполняет общую для всех СУБД работу: отложенную запись
+    действий пачками, локальный журнал на время сбоев БД, кэширование
+    счётчиков /stats и замеры операций. Реализации выполняют запросы к своей БД.
+    """
+    
+    # Имя реализации (значение DB_BACKEND)
+    backend = ""
+    
+    def __init__(self):
+        """Инициализация хранилища без подключения к БД."""
+        self.writer: Optional[ActionWriter] = None
+        # Локальный журнал действий на время сбоев БД (start_spool)
+        self.spool: Optional[ActionSpool] = None
+        # Записи в БД, не уложившиеся в SPOOL_WRITE_TIMEOUT_MS и продолжающиеся в фоне
+        self._late_writes: Set[asyncio.Task] = set()
+        self.counts_cache = ActionCountsCache(config.STATS_CACHE_TTL, config.STATS_CACHE_SIZE)
+        # Есть ли в БД таблицы счётчиков (init.sql); без них считаем по bot_actions
+        self.counters_enabled = False
+        # Есть ли в БД таблица политик чатов; без неё все чаты используют настройки по умолчанию
+        self.policies_enabled = False
+        # Есть ли в БД таблица счётчиков нарушений; без неё счётчики живут только в памяти
+        self.strikes_enabled = False
+    
+    @abstractmethod
+    async def connect(self):
+        """Подключается к БД и запускает отложенную запись (_start_writer)."""
+    
+    @abstractmethod
+    async def _close(self):
+        """Закрывает подключение к БД."""
+    
+    @property
+    @abstractmethod
+    def connected(self) -> bool:
+        """Открыто ли подключение к БД."""
+    
+    def _start_writer(self):
+        """Запускает отложенную запись действий пачками."""
+        if self.writer and self.writer.running:
+            return
+        self.writer = ActionWriter(
+            self,
+            batch_size=config.DB_WRITE_BATCH_SIZE,
+            flush_interval=config.DB_WRITE_FLUSH_MS / 1000,
+            max_queue=config.DB_WRITE_QUEUE_SIZE,
+        )
+        self.writer.start()
+    
+    async def flush(self):
+        """Записывает все действия из очереди и останавливает отложенную запись."""
+        if self.writer:
+            await self.writer.stop()
+            stats = self.writer.stats
+            logger.info(
+                f"Отложенная запись остановлена: записано {stats.written}, "
+                f"потеряно {stats.failed}, пачек {stats.batches}, "
+                f"ожиданий очереди {stats.producer_waits}"
+            )
+        # Дожидаемся записей, продолжающихся после таймаута (при ошибке они уйдут в журнал)
+        if self._late_writes:
+            await asyncio.gather(*self._late_writes, return_exceptions=True)
+    
+    async def start_spool(self, directory: str):
+        """
+        Включает локальный журнал действий на время сбоев БД.
+        
+        Отложенная запись запускается, даже если подключиться к БД
+        не удалось: действия принимаются в очередь и уходят в журнал,
+        а журнал переподключается к БД перед переносом.
+        
+        Args:
+            directory: Каталог сегментов журнала
+        """
+        self.spool = ActionSpool(
+            self,
+            directory,
+            latency_budget=config.SPOOL_LATENCY_BUDGET_MS / 1000,
+            write_timeout=config.SPOOL_WRITE_TIMEOUT_MS / 1000,
+            retry_interval=config.SPOOL_RETRY_SECONDS,
+            replay_batch=config.SPOOL_REPLAY_BATCH,
+        )
+        await self.spool.start()
+        if not self.connected:
+            self.spool.mark_unhealthy("нет подключения к БД")
+        self._start_writer()
+    
+    async def disconnect(self):
+        """Записывает накопленные действия и закрывает подключение."""
+        # Сначала дописываем накопленные действия, пока подключение ещё открыто
+        await self.flush()
+        if self.spool:
+            await self.spool.stop()
+        await self._close()
+    
+    def pool_usage(self) -> Optional[Dict[str, int]]:
+        """
+        Возвращает заполненность пула соединений.
+        
+        Returns:
+            Словарь {used, free, size, max} или None, если пула нет
+        """
+        return None
+    
+    async def save_action(self, action: BotAction) -> bool:
+        """
+        Сохраняет действие бота в базу данных.
+        
+        Если запущена отложенная запись, действие ставится в очередь
+        и записывается в БД пачкой.
+        
+        Args:
+            action: Объект BotAction для сохранения
+            
+        Returns:
+            True если успешно (или действие принято в очередь), False в случае ошибки
+        """
+        with db_query_seconds.time("save_action"):
+            if self.writer and self.writer.running:
+                await self.writer.put(action)
+                return True
+            
+            return await self.insert_actions([action])
+    
+    async def insert_actions(self, actions: List[BotAction]) -> bool:
+        """
+        Записывает действия в БД одной транзакцией.
+        
+        Счётчики по чатам и по дням обновляются в той же транзакции.
+        Если включён локальный журнал (start_spool), при ошибке БД действия
+        сохраняются в журнал и переносятся в БД позже. Запись, не завершившаяся
+        за SPOOL_WRITE_TIMEOUT_MS, не прерывается (иначе неизвестно, была ли
+        транзакция зафиксирована): она продолжается в фоне и попадает в журнал
+        только при ошибке, а следующие пачки сразу идут в журнал.
+        
+        Args:
+            actions: Список действий
+            
+        Returns:
+            True если успешно (или действия сохранены в журнал), False в случае ошибки
+        """
+        if self.spool and not self.spool.healthy:
+            return await self.spool.append(actions)
+        
+        started = time.perf_counter()
+        try:
+            if self.spool:
+                write = asyncio.ensure_future(self.write_actions(actions))
+                done, _ = await asyncio.wait({write}, timeout=self.spool.write_timeout)
+                if not done:
+                    self.spool.mark_unhealthy(f"запись не завершилась за {self.spool.write_timeout:g} с")
+                    late = asyncio.create_task(self._finish_late_write(write, actions))
+                    self._late_writes.add(late)
+                    late.add_done_callback(self._late_writes.discard)
+                    return True
+                write.result()
+            else:
+                await self.write_actions(actions)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении действий в БД ({len(actions)} шт.): {e}")
+            if self.spool:
+                self.spool.mark_unhealthy(f"ошибка записи: {e}")
+                return await self.spool.append(actions)
+            return False
+        
+        if self.spool:
+            self.spool.record_write(time.perf_counter() - started)
+        return True
+    
+    async def _finish_late_write(self, write: asyncio.Future, actions: List[BotAction]):
+        """Дожидается записи после таймаута; если она не удалась, сохраняет действия в журнал."""
+        try:
+            await write
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении действий в БД ({len(actions)} шт.): {e}")
+            await self.spool.append(actions)
+    
+    async def write_actions(self, actions: List[BotAction], operation: str = "insert_actions"):
+        """
+        Записывает действия в БД без локального журнала.
+        
+        Args:
+            actions: Список действий
+            operation: Имя операции для метрик
+        
+        Raises:
+            Exception: Ошибка записи (транзакция откатывается)
+        """
+        started = time.perf_counter()
+        try:
+            await self._insert_actions(actions)
+        except Exception:
+            db_errors.inc(operation)
+            raise
+        finally:
+            db_query_seconds.observe(time.perf_counter() - started, operation)
+        
+        logger.debug("Сохранено действий в БД: %s", len(actions))
+        # Кэшированные счётчики увеличиваем только после успешной записи
+        for action in actions:
+            self.counts_cache.increment(action.chat_id, action.action_type)
+    
+    @abstractmethod
+    async def _insert_actions(self, actions: List[BotAction]):
+        """
+        Вставляет действия и увеличивает счётчики; при ошибке транзакция откатывается
+        и исключение пробрасывается. Время записывается явно: created_at действия
+        (действия из локального журнала) или текущее время UTC; день в счётчиках
+        по дням берётся из этого же времени.
+        """
+    
+    @abstractmethod
+    async def rebuild_counters(self) -> int:
+        """
+        Пересчитывает таблицы счётчиков по всем строкам bot_actions.
+        
+        Returns:
+            Количество строк в chat_action_counters после пересчёта
+        """
+    
+    @abstractmethod
+    async def get_stats(self, chat_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Получает статистику действий.
+        
+        Args:
+            chat_id: ID чата (если None, возвращает для всех чатов)
+            limit: Максимальное количество записей
+            
+        Returns:
+            Список словарей с данными действий (пустой при ошибке)
+        """
+    
+    @abstractmethod
+    async def get_stats_page(
+        self,
+        chat_id: int,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        include_text: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Получает страницу истории действий чата от новых к старым.
+        
+        Args:
+            chat_id: ID чата
+            before_id: Вернуть записи с id меньше указанного (None - с самой новой)
+            limit: Максимальное количество записей
+            include_text: Добавить в результат текст сообщения
+            
+        Returns:
+            Список словарей с данными действий (пустой при ошибке)
+        """
+    
+    async def get_action_count(self, action_type: str, chat_id: Optional[int] = None) -> int:
+        """
+        Получает количество действий определённого типа.
+        
+        Args:
+            action_type: Тип действия
+            chat_id: ID чата (если None, считает для всех чатов)
+            
+        Returns:
+            Количество действий
+        """
+        started = time.perf_counter()
+        try:
+            return await self._count_actions(action_type, chat_id)
+        except Exception as e:
+            db_errors.inc("get_action_count")
+            logger.error(f"Ошибка при подсчёте действий: {e}")
+            return 0
+        finally:
+            db_query_seconds.observe(time.perf_counter() - started, "get_action_count")
+    
+    @abstractmethod
+    async def _count_actions(self, action_type: str, chat_id: Optional[int]) -> int:
+        """Считает действия типа в чате или во всех чатах; при ошибке - исключение."""
+    
+    async def get_action_counts(self, chat_id: int) -> Dict[str, int]:
+        """
+        Получает количество действий каждого типа в чате одним запросом.
+        
+        Результат кэшируется на STATS_CACHE_TTL секунд и поддерживается
+        актуальным при записи новых действий.
+        
+        Args:
+            chat_id: ID чата
+            
+        Returns:
+            Словарь {тип действия: количество}
+        """
+        cached = self.counts_cache.get(chat_id)
+        if cached is not None:
+            return cached
+        
+        self.counts_cache.begin_load(chat_id)
+        try:
+            counts = await self._load_action_counts(chat_id)
+        except Exception as e:
+            self.counts_cache.cancel_load(chat_id)
+            logger.error(f"Ошибка при подсчёте действий: {e}")
+            return {}
+        
+        self.counts_cache.put(chat_id, counts)
+        return dict(counts)
+    
+    @abstractmethod
+    async def _load_action_counts(self, chat_id: int) -> Dict[str, int]:
+        """Считает действия чата по типам; при ошибке - исключение."""
+    
+    @abstractmethod
+    async def get_chat_policy(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Получает политику модерации чата.
+        
+        Args:
+            chat_id: ID чата
+            
+        Returns:
+            Словарь с колонками POLICY_COLUMNS или None, если политика не задана
+        
+        Raises:
+            Exception: Ошибка запроса (кэш политик не должен запоминать её как отсутствие политики)
+        """
+    
+    @abstractmethod
+    async def save_chat_policy(self, chat_id: int, values: Dict[str, Any]) -> bool:
+        """
+        Создаёт или изменяет политику модерации чата.
+        
+        Args:
+            chat_id: ID чата
+            values: Изменяемые колонки из POLICY_COLUMNS (None - значение по умолчанию)
+            
+        Returns:
+            True если успешно, False в случае ошибки
+        """
+    
+    @abstractmethod
+    async def get_user_strikes(self, chat_id: int, user_id: int) -> Optional[Tuple[int, datetime]]:
+        """
+        Получает счётчик нарушений пользователя в чате.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            
+        Returns:
+            Количество нарушений и время последнего или None, если записи нет
+        
+        Raises:
+            Exception: Ошибка запроса
+        """
+    
+    @abstractmethod
+    async def save_user_strikes(self, rows: List[Tuple[int, int, int, datetime]]) -> bool:
+        """
+        Записывает счётчики нарушений пачкой.
+        
+        Args:
+            rows: Кортежи (chat_id, user_id, нарушений, время последнего нарушения)
+            
+        Returns:
+            True если успешно (или таблицы нет), False в случае ошибки
+        """
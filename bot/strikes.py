@@ -0,0 +1,280 @@
+"""
+МОДУЛЬ: Эскалация наказаний
+Считает нарушения пользователей в чатах и выбирает наказание по лестнице
+(предупреждение, мут, бан). Счётчики хранятся в памяти и записываются
+в таблицу user_strikes пачками в фоне; со временем нарушения забываются.
+Использует bot/database.py, применяется в bot/handlers.py.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from bot.config import config
+from bot.database import db
+from bot.logger import logger
+from bot.policies import PolicyAction
+
+
+# Действия, допустимые как ступени эскалации
+ESCALATION_ACTIONS = (PolicyAction.DELETE, PolicyAction.WARN, PolicyAction.MUTE, PolicyAction.BAN)
+
+# Сколько счётчиков записывать одним INSERT
+STRIKES_WRITE_BATCH = 500
+
+
+def parse_steps(value: str) -> Tuple[str, ...]:
+    """
+    Разбирает лестницу наказаний.
+    
+    Args:
+        value: Действия через запятую, например "warn,mute,ban"
+    
+    Returns:
+        Действие для 1-го, 2-го и т.д. нарушения; последнее повторяется
+    
+    Raises:
+        ValueError: Если в лестнице неизвестное действие
+    """
+    steps = tuple(step.strip().lower() for step in value.split(",") if step.strip())
+    unknown = [step for step in steps if step not in ESCALATION_ACTIONS]
+    if unknown:
+        raise ValueError(f"Неизвестные действия в ESCALATION_STEPS: {', '.join(unknown)}")
+    return steps or (PolicyAction.WARN,)
+
+
+class _Strikes:
+    """Счётчик нарушений пользователя в чате."""
+    
+    __slots__ = ("count", "last")
+    
+    def __init__(self, count: int, last: float):
+        self.count = count
+        # Время последнего нарушения (time.time())
+        self.last = last
+
+
+class StrikeLedger:
+    """
+    Счётчики нарушений по (chat_id, user_id) с отложенной записью в БД.
+    
+    Счётчик загружается из user_strikes при первом нарушении пользователя
+    и дальше меняется только в памяти (LRU на max_size записей); изменённые
+    счётчики записываются пачкой раз в flush_interval секунд. Вытесненные
+    из LRU, но ещё не записанные счётчики остаются в очереди записи.
+    За каждые decay_seconds без нарушений забывается одно нарушение.
+    """
+    
+    def __init__(self, steps: Tuple[str, ...], decay_seconds: float, max_size: int, flush_interval: float):
+        """
+        Args:
+            steps: Лестница наказаний (parse_steps)
+            decay_seconds: Через сколько секунд без нарушений забывается одно (0 - не забываются)
+            max_size: Сколько счётчиков держать в памяти
+            flush_interval: Период записи изменённых счётчиков в секундах
+        """
+        self.steps = steps
+        self.decay_seconds = decay_seconds
+        self.max_size = max(1, max_size)
+        self.flush_interval = flush_interval
+        self.loads = 0
+        self.writes = 0
+        self._entries: "OrderedDict[Tuple[int, int], _Strikes]" = OrderedDict()
+        # Изменённые счётчики, ожидающие записи
+        self._dirty: Dict[Tuple[int, int], _Strikes] = {}
+        self._loading: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def __len__(self) -> int:
+        """Количество счётчиков в памяти."""
+        return len(self._entries)
+    
+    @property
+    def pending_writes(self) -> int:
+        """Количество счётчиков, ожидающих записи в БД."""
+        return len(self._dirty)
+    
+    def action_for(self, strikes: int) -> str:
+        """
+        Возвращает наказание за нарушение с указанным номером.
+        
+        Args:
+            strikes: Номер нарушения (с 1)
+        
+        Returns:
+            Действие из лестницы; после последней ступени - последнее действие
+        """
+        return self.steps[min(max(strikes, 1), len(self.steps)) - 1]
+    
+    def _decayed(self, entry: _Strikes, now: float) -> int:
+        """Количество нарушений с учётом забывания."""
+        if self.decay_seconds <= 0 or not entry.count:
+            return entry.count
+        forgiven = int((now - entry.last) // self.decay_seconds)
+        return max(0, entry.count - forgiven)
+    
+    async def _get(self, key: Tuple[int, int]) -> _Strikes:
+        """Возвращает счётчик из памяти, загружая его из БД при отсутствии."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        
+        entry = self._dirty.get(key)
+        if entry is None:
+            loading = self._loading.get(key)
+            if loading is not None:
+                try:
+                    return await asyncio.shield(loading)
+                except asyncio.CancelledError:
+                    # Отменён сам вызов, а не загрузка - отмену передаём дальше
+                    if not loading.cancelled() or asyncio.current_task().cancelling():
+                        raise
+                # Загрузка отменена вместе с запустившей её задачей: загружаем заново
+                return await self._get(key)
+            
+            loading = asyncio.get_running_loop().create_future()
+            self._loading[key] = loading
+            try:
+                row = await db.get_user_strikes(*key)
+            except Exception as e:
+                # Считаем с нуля: наказание мягче, но обработка сообщения не прерывается
+                logger.error(f"Ошибка при загрузке счётчика нарушений {key}: {e}")
+                row = None
+            except BaseException:
+                # Загрузка отменена (остановка бота, отмена обработчика): ожидающие не должны зависнуть
+                loading.cancel()
+                raise
+            finally:
+                self._loading.pop(key, None)
+            
+            self.loads += 1
+            # Время в БД - UTC без часового пояса
+            entry = _Strikes(row[0], row[1].replace(tzinfo=timezone.utc).timestamp()) if row else _Strikes(0, 0.0)
+            loading.set_result(entry)
+        
+        self._entries[key] = entry
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+    
+    async def add(self, chat_id: int, user_id: int, now: Optional[float] = None) -> int:
+        """
+        Учитывает нарушение пользователя.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            now: Время нарушения (по умолчанию time.time())
+        
+        Returns:
+            Номер нарушения с учётом забытых
+        """
+        if now is None:
+            now = time.time()
+        key = (chat_id, user_id)
+        entry = await self._get(key)
+        entry.count = self._decayed(entry, now) + 1
+        entry.last = now
+        self._dirty[key] = entry
+        return entry.count
+    
+    async def get(self, chat_id: int, user_id: int, now: Optional[float] = None) -> int:
+        """
+        Возвращает текущее количество нарушений пользователя.
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+            now: Текущее время (по умолчанию time.time())
+        
+        Returns:
+            Количество нарушений с учётом забытых
+        """
+        entry = await self._get((chat_id, user_id))
+        return self._decayed(entry, time.time() if now is None else now)
+    
+    async def reset(self, chat_id: int, user_id: int):
+        """
+        Обнуляет нарушения пользователя (например, после разбана).
+        
+        Args:
+            chat_id: ID чата
+            user_id: ID пользователя
+        """
+        key = (chat_id, user_id)
+        entry = await self._get(key)
+        if entry.count:
+            entry.count = 0
+            self._dirty[key] = entry
+    
+    async def flush(self) -> int:
+        """
+        Записывает изменённые счётчики в БД.
+        
+        Returns:
+            Количество записанных счётчиков
+        """
+        if not self._dirty:
+            return 0
+        
+        # Значения фиксируются до первого await: изменения во время записи
+        # снова отметят счётчик для следующего сброса
+        dirty, self._dirty = self._dirty, {}
+        rows = [
+            (
+                chat_id, user_id, entry.count,
+                datetime.fromtimestamp(entry.last or time.time(), timezone.utc).replace(tzinfo=None),
+            )
+            for (chat_id, user_id), entry in dirty.items()
+        ]
+        
+        written = 0
+        for start in range(0, len(rows), STRIKES_WRITE_BATCH):
+            batch = rows[start:start + STRIKES_WRITE_BATCH]
+            if not await db.save_user_strikes(batch):
+                # Не записанные счётчики возвращаются в очередь до следующего сброса
+                for chat_id, user_id, _, _ in rows[start:]:
+                    key = (chat_id, user_id)
+                    self._dirty.setdefault(key, dirty[key])
+                break
+            written += len(batch)
+        
+        self.writes += written
+        return written
+    
+    def start(self):
+        """Запускает периодическую запись счётчиков в текущем event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Останавливает периодическую запись и записывает оставшиеся счётчики."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+    
+    async def _run(self):
+        """Цикл: запись изменённых счётчиков раз в flush_interval секунд."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при записи счётчиков нарушений: {e}")
+
+
+# Глобальный экземпляр счётчиков нарушений
+strike_ledger = StrikeLedger(
+    steps=parse_steps(config.ESCALATION_STEPS),
+    decay_seconds=config.STRIKE_DECAY_SECONDS,
+    max_size=config.STRIKE_CACHE_SIZE,
+    flush_interval=config.STRIKE_FLUSH_SECONDS,
+)
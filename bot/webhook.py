@@ -0,0 +1,48 @@
+"""
+МОДУЛЬ: Приём обновлений через webhook
+Создаёт aiohttp-приложение, которое передаёт обновления Telegram в Dispatcher.
+Использует aiogram; запускается из bot/main.py в режиме BOT_MODE=webhook.
+"""
+
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+
+def create_webhook_app(
+    bot: Bot,
+    dp: Dispatcher,
+    path: str,
+    secret_token: Optional[str] = None,
+    handle_in_background: bool = True,
+) -> web.Application:
+    """
+    Создаёт aiohttp-приложение для приёма обновлений.
+    
+    Запросы без правильного заголовка X-Telegram-Bot-Api-Secret-Token
+    отклоняются с кодом 401. Запуск и остановка приложения вызывают
+    startup/shutdown-обработчики диспетчера.
+    
+    Args:
+        bot: Экземпляр бота
+        dp: Диспетчер с зарегистрированными роутерами
+        path: Путь, на который Telegram отправляет обновления
+        secret_token: Секретный токен webhook (None - без проверки)
+        handle_in_background: Отвечать Telegram сразу, не дожидаясь обработчиков
+        
+    Returns:
+        Настроенное приложение
+    """
+    app = web.Application()
+    
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=handle_in_background,
+    ).register(app, path=path)
+    
+    setup_application(app, dp, bot=bot)
+    return app
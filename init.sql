@@ -13,7 +13,56 @@ CREATE TABLE IF NOT EXISTS bot_actions (
     INDEX idx_user_id (user_id),
     INDEX idx_chat_id (chat_id),
     INDEX idx_created_at (created_at),
-    INDEX idx_action_type (action_type)
+    INDEX idx_action_type (action_type),
+    INDEX idx_chat_created (chat_id, created_at),
+    INDEX idx_chat_action_created (chat_id, action_type, created_at)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
 COMMENT='Таблица для хранения действий бота-модератора';
 
+-- Счётчики действий по чатам: /stats и get_action_count читают их вместо COUNT(*)
+-- Обновляются ботом в той же транзакции, что и вставка в bot_actions.
+-- После создания таблиц заполните их: python -m bot.maintenance backfill-counters
+CREATE TABLE IF NOT EXISTS chat_action_counters (
+    chat_id BIGINT NOT NULL COMMENT 'ID чата',
+    action_type VARCHAR(50) NOT NULL COMMENT 'Тип действия',
+    action_count BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Количество действий',
+    PRIMARY KEY (chat_id, action_type)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='Счётчики действий бота по чатам';
+
+-- Счётчики действий по дням
+CREATE TABLE IF NOT EXISTS chat_action_daily (
+    chat_id BIGINT NOT NULL COMMENT 'ID чата',
+    action_type VARCHAR(50) NOT NULL COMMENT 'Тип действия',
+    day DATE NOT NULL COMMENT 'День',
+    action_count BIGINT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Количество действий за день',
+    PRIMARY KEY (chat_id, action_type, day)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='Счётчики действий бота по чатам и дням';
+
+-- Политики модерации чатов: наборы словарей, действие при нарушении и пороги.
+-- NULL в колонке - значение по умолчанию из переменных окружения
+CREATE TABLE IF NOT EXISTS chat_policies (
+    chat_id BIGINT NOT NULL PRIMARY KEY COMMENT 'ID чата',
+    lexicons VARCHAR(255) NULL COMMENT 'Наборы словарей через запятую (NULL - по умолчанию)',
+    action VARCHAR(16) NULL COMMENT 'Действие при нарушении: delete, warn, mute, ban',
+    mute_seconds INT UNSIGNED NULL COMMENT 'Длительность мута в секундах',
+    duplicate_chat_limit INT UNSIGNED NULL COMMENT 'Допустимо повторов в чате (0 - без ограничения)',
+    duplicate_global_limit INT UNSIGNED NULL COMMENT 'Допустимо повторов во всех чатах',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='Политики модерации чатов';
+
+-- Счётчики нарушений для эскалации наказаний (предупреждение, мут, бан).
+-- Бот держит их в памяти и записывает изменения пачками
+CREATE TABLE IF NOT EXISTS user_strikes (
+    chat_id BIGINT NOT NULL COMMENT 'ID чата',
+    user_id BIGINT NOT NULL COMMENT 'ID пользователя Telegram',
+    strikes INT UNSIGNED NOT NULL DEFAULT 0 COMMENT 'Нарушений с учётом забывания',
+    last_strike_at DATETIME NOT NULL COMMENT 'Время последнего нарушения',
+    PRIMARY KEY (chat_id, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci 
+COMMENT='Счётчики нарушений пользователей для эскалации наказаний';
+
+-- Для уже созданной базы изменения схемы применяются миграциями:
+-- python -m bot.maintenance migrate
@@ -57,6 +57,11 @@ async def test_filters():
             ("Идиот какой-то", True, "Оскорбление"),
             ("Хорошая погода сегодня", False, "Обычное сообщение"),
             ("Это сволочь", True, "Оскорбление"),
+            ("Ты ДУУУРАК", True, "Повтор букв"),
+            ("и д и о т", True, "Буквы через пробел"),
+            ("cyкa", True, "Латинские буквы"),
+            ("п0дон0к", True, "Leetspeak"),
+            ("Я иду в магазин, а у него нет денег", False, "Обычное сообщение"),
         ]
         
         passed = 0
@@ -184,7 +189,9 @@ async def test_logger():
     print("=" * 60)
     
     try:
-        from bot.logger import logger
+        import json
+        import logging
+        from bot.logger import JsonFormatter, logger
         
         logger.debug("Тестовое сообщение DEBUG")
         logger.info("Тестовое сообщение INFO")
@@ -192,11 +199,2062 @@ async def test_logger():
         logger.error("Тестовое сообщение ERROR")
         
         print("[OK] Логирование работает (проверьте файл logs/bot.log)")
-        return True
+        
+        # Поля контекста из extra попадают в JSON
+        record = logging.LogRecord("bot", logging.WARNING, __file__, 0, "Удалено: %s", ("спам",), None)
+        record.chat_id = -100
+        record.user_id = 42
+        record.action_type = "message_deleted"
+        data = json.loads(JsonFormatter().format(record))
+        if data["message"] == "Удалено: спам" and data["chat_id"] == -100 and data["action_type"] == "message_deleted":
+            print("[OK] JSON-формат с полями chat_id, user_id, action_type")
+            return True
+        print(f"[FAIL] Неверная запись JSON: {data}")
+        return False
     except Exception as e:
         print(f"[ERROR] Ошибка тестирования логирования: {e}")
         return False
 
+async def test_webhook():
+    """Тест приёма обновлений через webhook"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 6: Webhook")
+    print("=" * 60)
+    
+    try:
+        from aiohttp.test_utils import TestClient, TestServer
+        from aiogram import Dispatcher
+        from bot.handlers import router
+        from bot.main import create_bot
+        from bot.webhook import create_webhook_app
+        
+        dp = Dispatcher()
+        dp.include_router(router)
+        secret = "test_secret"
+        app = create_webhook_app(create_bot(), dp, path="/webhook", secret_token=secret, handle_in_background=False)
+        
+        # Синтетическое обновление: обычное сообщение в группе
+        update = {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": -100123, "type": "supergroup", "title": "test"},
+                "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+                "text": "Привет, как дела?",
+            },
+        }
+        
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(
+                "/webhook", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+            )
+            if response.status != 200:
+                print(f"[FAIL] Обновление не принято: HTTP {response.status}")
+                return False
+            print("[OK] Обновление с правильным секретом принято и обработано")
+            
+            response = await client.post(
+                "/webhook", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+            )
+            if response.status != 401:
+                print(f"[FAIL] Обновление с неверным секретом: HTTP {response.status}")
+                return False
+            print("[OK] Обновление с неверным секретом отклонено")
+        
+        return True
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования webhook: {e}")
+        return False
+
+async def test_scheduler():
+    """Тест планировщика обработки обновлений"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 7: Планировщик обновлений")
+    print("=" * 60)
+    
+    try:
+        import time
+        from datetime import datetime
+        from aiogram import Dispatcher, Router
+        from aiogram.types import Chat, Message, Update, User
+        from bot.main import create_bot
+        from bot.scheduler import UpdateScheduler
+        
+        processed = []
+        test_router = Router()
+        
+        @test_router.message()
+        async def slow_handler(message: Message):
+            await asyncio.sleep(0.01)
+            processed.append((message.chat.id, message.message_id))
+        
+        scheduler = UpdateScheduler(workers=4, max_in_flight=5)
+        dp = Dispatcher()
+        dp.update.outer_middleware(scheduler)
+        dp.include_router(test_router)
+        bot = create_bot()
+        
+        scheduler.start()
+        update_id = 0
+        for message_id in range(10):
+            for chat_id in (1, 2, 3):
+                update_id += 1
+                message = Message(
+                    message_id=message_id,
+                    date=datetime.now(),
+                    chat=Chat(id=chat_id, type="group"),
+                    from_user=User(id=chat_id, is_bot=False, first_name="Test"),
+                    text="Привет",
+                )
+                await dp.feed_update(bot, Update(update_id=update_id, message=message))
+        await scheduler.stop()
+        await bot.session.close()
+        
+        if len(processed) != 30:
+            print(f"[FAIL] Обработано {len(processed)} обновлений из 30")
+            return False
+        for chat_id in (1, 2, 3):
+            order = [message_id for chat, message_id in processed if chat == chat_id]
+            if order != list(range(10)):
+                print(f"[FAIL] Нарушен порядок сообщений в чате {chat_id}: {order}")
+                return False
+        print("[OK] Все обновления обработаны, порядок внутри чатов сохранён")
+        
+        # Медленный чат не задерживает другие чаты, даже если воркеров меньше, чем чатов
+        finished = {}
+        scheduler = UpdateScheduler(workers=2, max_in_flight=100)
+        
+        async def timed_handler(event, data):
+            await asyncio.sleep(0.3 if data["event_chat"].id == 10 else 0.01)
+            finished[(data["event_chat"].id, event)] = time.perf_counter()
+        
+        scheduler.start()
+        started = time.perf_counter()
+        for message_id in range(5):
+            for chat_id in (10, 11, 12):
+                await scheduler(timed_handler, message_id, {"event_chat": Chat(id=chat_id, type="group")})
+        await scheduler.stop()
+        fast_done = max(at for (chat_id, _), at in finished.items() if chat_id != 10) - started
+        if len(finished) != 15 or fast_done > 0.3:
+            print(f"[FAIL] Медленный чат задержал остальные: {fast_done:.2f} с")
+            return False
+        print(f"[OK] Медленный чат не задерживает остальные ({fast_done * 1000:.0f} мс)")
+        
+        # Показатели планировщика по воркерам в метриках
+        import bot.main as main
+        from bot.metrics import metrics
+        saved_scheduler = main.update_scheduler
+        main.update_scheduler = scheduler
+        try:
+            main.register_runtime_metrics()
+            lines = metrics.render().splitlines()
+        finally:
+            main.update_scheduler = saved_scheduler
+        processed_total = sum(
+            float(line.rsplit(" ", 1)[1]) for line in lines
+            if line.startswith('moderator_updates_processed_total{worker="')
+        )
+        has_latency = any(line.startswith('moderator_update_wait_seconds_total{worker="1"}') for line in lines)
+        chats = 'moderator_scheduler_chats{state="ready"} 0' in lines
+        if processed_total != 15 or not has_latency or not chats:
+            print(f"[FAIL] Метрики планировщика: обработано {processed_total:g}")
+            return False
+        print(f"[OK] Метрики планировщика по {len(scheduler.stats)} воркерам, обработано {processed_total:g}")
+        return True
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования планировщика: {e}")
+        return False
+
+async def test_antiflood():
+    """Тест защиты от флуда"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 8: Защита от флуда")
+    print("=" * 60)
+    
+    try:
+        from bot.antiflood import FloodDetector
+        
+        detector = FloodDetector(limit=3, window=10, idle_timeout=60)
+        
+        # Время сообщения, ожидаемый результат, описание
+        test_hits = [
+            (0, False, "1-е сообщение"),
+            (1, False, "2-е сообщение"),
+            (2, False, "3-е сообщение"),
+            (3, True, "4-е сообщение за 10 секунд"),
+            (4, False, "После срабатывания счёт начинается заново"),
+            (30, False, "Сообщение после паузы"),
+        ]
+        
+        passed = 0
+        failed = 0
+        
+        for now, should_detect, description in test_hits:
+            result = detector.hit(-100123, 42, now=now)
+            if result == should_detect:
+                print(f"[OK] t={now} - {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] t={now} - {description} (ожидалось: {should_detect}, получено: {result})")
+                failed += 1
+        
+        # Другой пользователь в том же чате считается отдельно
+        if detector.hit(-100123, 43, now=3):
+            print("[FAIL] Сообщение другого пользователя засчитано как флуд")
+            failed += 1
+        
+        # Сообщения, дошедшие после ограничения, не дают повторного срабатывания
+        detector.mute(-100123, 44, 300, now=0)
+        muted_hits = [detector.hit(-100123, 44, now=0.1 * i) for i in range(10)]
+        if any(muted_hits) or not detector.is_muted(-100123, 44, now=299):
+            print(f"[FAIL] Ограниченный пользователь снова засчитан как флуд: {muted_hits}")
+            failed += 1
+        else:
+            print("[OK] Ограниченный пользователь не ограничивается повторно")
+        if detector.is_muted(-100123, 44, now=300):
+            print("[FAIL] Ограничение не истекло")
+            failed += 1
+        
+        evicted = detector.evict_idle(now=1000)
+        if evicted != 2 or len(detector):
+            print(f"[FAIL] Неактивные пользователи не забыты: {evicted}, осталось {len(detector)}")
+            failed += 1
+        else:
+            print("[OK] Неактивные пользователи забыты")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования защиты от флуда: {e}")
+        return False
+
+async def test_duplicates():
+    """Тест обнаружения повторяющихся сообщений"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 9: Повторяющиеся сообщения")
+    print("=" * 60)
+    
+    try:
+        from bot.duplicates import DuplicateDetector
+        
+        detector = DuplicateDetector(
+            chat_window=300, global_window=900,
+            chat_max_entries=100, global_max_entries=1000, min_length=20,
+        )
+        spam = "Заработок от 5000 рублей в день без вложений, пишите в личку"
+        
+        # Чат, текст, время, ожидается повтор, описание
+        test_messages = [
+            (1, spam, 0, False, "Первое сообщение"),
+            (2, spam + "!!!", 1, True, "Тот же текст в другом чате"),
+            (1, spam.replace("5000", "7000"), 2, True, "Похожий текст"),
+            (1, "Совершенно другое сообщение про погоду и котиков", 3, False, "Другой текст"),
+            (1, "Привет", 4, False, "Короткое сообщение не проверяется"),
+            (3, spam, 2000, False, "Повтор после окна"),
+        ]
+        
+        passed = 0
+        failed = 0
+        
+        for chat_id, text, now, should_detect, description in test_messages:
+            verdict = detector.check(chat_id, text, now=now)
+            result = bool(verdict and verdict.global_count)
+            if result == should_detect:
+                print(f"[OK] '{text[:30]}...' - {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] '{text[:30]}...' - {description} (ожидалось: {should_detect}, получено: {result})")
+                failed += 1
+        
+        # В обработчике: по умолчанию проверка выключена, сообщения администраторов не удаляются
+        from types import SimpleNamespace
+        from bot.handlers import check_duplicate
+        from bot.policies import ChatPolicy
+        
+        class FakeBot:
+            """Бот, в чате которого администратор - пользователь 1"""
+            
+            async def get_chat_administrators(self, chat_id):
+                return [SimpleNamespace(user=SimpleNamespace(id=1), status="creator")]
+        
+        def message(user_id):
+            return SimpleNamespace(
+                bot=FakeBot(),
+                chat=SimpleNamespace(id=-900, type="group"),
+                from_user=SimpleNamespace(id=user_id),
+                text="Объявление: завтра встреча в 19:00 в главном зале",
+            )
+        
+        enabled = ChatPolicy(chat_id=-900, duplicate_chat_limit=1)
+        handler_checks = [
+            (
+                [await check_duplicate(message(2), ChatPolicy.default(-900)) for _ in range(3)] == [None] * 3,
+                "Без настройки лимитов повторы не удаляются",
+            ),
+            (
+                [await check_duplicate(message(1), enabled) for _ in range(2)] == [None] * 2,
+                "Повтор администратора не удаляется",
+            ),
+            (await check_duplicate(message(2), enabled) is not None, "Повтор пользователя сверх лимита удаляется"),
+        ]
+        for result, description in handler_checks:
+            if result:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования повторов: {e}")
+        return False
+
+async def test_policies():
+    """Тест словарей из файлов и общего пула фильтров политик чатов"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 10: Словари и политики чатов")
+    print("=" * 60)
+    
+    try:
+        import json
+        import tempfile
+        from pathlib import Path
+        from bot.filters import message_filter
+        from bot.lexicons import CACHE_VERSION, LexiconStore
+        from bot.policies import ChatPolicy, MatcherPool, parse_lexicon_names
+        
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "words.txt").write_text("бананчик\n", encoding="utf-8")
+            Path(directory, "same_words.txt").write_text("# те же правила\nбананчик\n", encoding="utf-8")
+            Path(directory, "spam.txt").write_text("re:казино\\s*онлайн\n", encoding="utf-8")
+            
+            store = LexiconStore(directory, cache_dir=None, default_set="words", reload_interval=0)
+            await store.reload()
+            pool = MatcherPool(store, max_size=10)
+            
+            combined = await pool.get(parse_lexicon_names("spam, words"))
+            same_key = await pool.get(parse_lexicon_names("words,spam,words"))
+            same_rules = await pool.get(parse_lexicon_names("same_words,spam"))
+            policy = ChatPolicy.from_row(-100, {"lexicons": "spam", "action": None, "mute_seconds": 600})
+            
+            checks = [
+                (combined.contains_bad_words("бананчик и казино онлайн"), "Правила обоих наборов"),
+                (same_key is combined, "Порядок и повторы наборов не важны"),
+                (same_rules is combined, "Одинаковые правила - один фильтр"),
+                (pool.compiled == 1, "Фильтр скомпилирован один раз"),
+                (store.get_filter(1).contains_bad_words("бананчик"), "Набор по умолчанию"),
+                (policy.lexicons == ("spam",) and policy.mute_seconds == 600, "Политика из строки БД"),
+            ]
+            
+            # Набор чата дополняет базовые правила (набор по умолчанию), "-слово" убирает слово
+            Path(directory, "chat_5.txt").write_text("-бананчик\nапельсинчик\n", encoding="utf-8")
+            cache_dir = Path(directory, ".cache")
+            store = LexiconStore(directory, cache_dir=str(cache_dir), default_set="words", reload_interval=0)
+            await store.reload()
+            chat_filter = store.get_filter(5)
+            checks.append((
+                chat_filter.contains_bad_words("апельсинчик") and not chat_filter.contains_bad_words("бананчик"),
+                "Набор чата поверх базовых правил",
+            ))
+            
+            # Кэш - JSON с версией и хешем правил; повреждённый файл пересоздаётся
+            cache_files = sorted(cache_dir.glob("*.json"))
+            cached = json.loads(cache_files[0].read_text(encoding="utf-8")) if cache_files else {}
+            checks.append((len(cache_files) == 3 and cached.get("version") == CACHE_VERSION, "Кэш словарей в JSON"))
+            for path in cache_files:
+                path.write_text('{"version": 2, "digest": ', encoding="utf-8")
+            restored = LexiconStore(directory, cache_dir=str(cache_dir), default_set="words", reload_interval=0)
+            await restored.reload()
+            checks.append((
+                restored.get_filter(5).contains_bad_words("апельсинчик")
+                and all(json.loads(path.read_text(encoding="utf-8"))["digest"] for path in cache_files),
+                "Повреждённый кэш пересоздан",
+            ))
+            
+            # Без файла набора по умолчанию базовые правила - встроенные
+            Path(directory, "words.txt").unlink()
+            await store.reload()
+            checks.append((
+                store.base is None and store.get_filter(5).contains_bad_words("дурак")
+                and store.get_filter(1) is message_filter,
+                "Без набора по умолчанию - встроенные правила",
+            ))
+        
+        passed = 0
+        failed = 0
+        
+        for result, description in checks:
+            if result:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования политик чатов: {e}")
+        return False
+
+async def test_escalation():
+    """Тест лестницы наказаний и забывания нарушений"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 11: Эскалация наказаний")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        import time
+        from pathlib import Path
+        import bot.strikes as strikes
+        from bot.sqlite_storage import SQLiteDatabase
+        from bot.strikes import StrikeLedger, parse_steps
+        
+        ledger = StrikeLedger(parse_steps("warn,mute,ban"), decay_seconds=3600, max_size=2, flush_interval=60)
+        hour = 3600
+        
+        # Пользователь, время нарушения, ожидаемое наказание, описание
+        test_violations = [
+            (1, 0, "warn", "Первое нарушение"),
+            (1, 60, "mute", "Второе нарушение"),
+            (2, 70, "warn", "Другой пользователь считается отдельно"),
+            (3, 80, "warn", "Третий пользователь вытесняет первого из памяти"),
+            (1, 120, "ban", "Третье нарушение (счётчик ждал записи)"),
+            (1, 120 + 2 * hour, "mute", "Через 2 часа забыты два нарушения"),
+            (1, 120 + 10 * hour, "warn", "Через 10 часов - с начала лестницы"),
+        ]
+        
+        passed = 0
+        failed = 0
+        
+        for user_id, now, expected, description in test_violations:
+            result = ledger.action_for(await ledger.add(-100, user_id, now=now))
+            if result == expected:
+                print(f"[OK] {description}: {result}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description} (ожидалось: {expected}, получено: {result})")
+                failed += 1
+        
+        # Без таблицы user_strikes запись считается выполненной
+        if await ledger.flush() == 3 and ledger.pending_writes == 0:
+            print("[OK] Изменённые счётчики записаны одной пачкой")
+            passed += 1
+        else:
+            print("[FAIL] Изменённые счётчики не записаны")
+            failed += 1
+        
+        class SlowDatabase:
+            """БД, загрузка счётчика из которой занимает время"""
+            calls = 0
+            
+            async def get_user_strikes(self, chat_id, user_id):
+                self.calls += 1
+                await asyncio.sleep(0.05)
+                return None
+        
+        # Первый загрузчик отменён, пока второй ждёт его результата
+        saved_db = strikes.db
+        strikes.db = SlowDatabase()
+        try:
+            first = asyncio.create_task(ledger.add(-200, 1, now=0))
+            await asyncio.sleep(0.01)
+            second = asyncio.create_task(ledger.add(-200, 1, now=0))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            try:
+                result = await asyncio.wait_for(second, timeout=1)
+            except asyncio.TimeoutError:
+                result = None
+            calls = strikes.db.calls
+        finally:
+            strikes.db = saved_db
+        
+        if first.cancelled() and result == 1 and calls == 2:
+            print("[OK] Отмена загрузки счётчика не оставляет ожидающих без ответа")
+            passed += 1
+        else:
+            print(f"[FAIL] Отмена загрузки счётчика: результат {result}, загрузок {calls}")
+            failed += 1
+        
+        # Время последнего нарушения хранится в UTC независимо от часового пояса сервера
+        saved_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "Europe/Moscow"
+        time.tzset()
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                storage = SQLiteDatabase(str(Path(tmp) / "bot.db"))
+                await storage.connect()
+                strikes.db = storage
+                try:
+                    writer = StrikeLedger(parse_steps("warn,ban"), decay_seconds=0, max_size=10, flush_interval=60)
+                    await writer.add(-300, 1, now=86400)
+                    await writer.flush()
+                    rows = await storage._fetchall("SELECT last_strike_at FROM user_strikes")
+                    reader = StrikeLedger(parse_steps("warn,ban"), decay_seconds=0, max_size=10, flush_interval=60)
+                    await reader.get(-300, 1)
+                    stored = rows[0][0] if rows else None
+                    loaded = reader._entries[(-300, 1)].last
+                finally:
+                    strikes.db = saved_db
+                    await storage.disconnect()
+        finally:
+            if saved_tz is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = saved_tz
+            time.tzset()
+        
+        if stored == "1970-01-02 00:00:00" and loaded == 86400:
+            print("[OK] Время нарушения записывается и читается в UTC")
+            passed += 1
+        else:
+            print(f"[FAIL] Время нарушения: записано {stored}, прочитано {loaded}")
+            failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования эскалации: {e}")
+        return False
+
+async def test_offload():
+    """Тест проверки длинных сообщений в пуле потоков"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 12: Проверка сообщений вне event loop")
+    print("=" * 60)
+    
+    try:
+        import threading
+        from bot.filters import MessageFilter
+        from bot.offload import FilterOffloader
+        
+        class TrackedFilter(MessageFilter):
+            """Фильтр, запоминающий потоки, в которых он проверял текст"""
+            threads = set()
+            
+            def check_many(self, texts):
+                self.threads.add(threading.get_ident())
+                return super().check_many(texts)
+            
+            def find_rules(self, text):
+                self.threads.add(threading.get_ident())
+                return super().find_rules(text)
+        
+        matcher = TrackedFilter()
+        offloader = FilterOffloader(
+            "thread", workers=2, inline_max_length=50, batch_size=4, batch_delay=0.005, cache_dir=None,
+        )
+        offloader.start()
+        
+        test_messages = [
+            ("Ты дурак!", True, "Короткое сообщение - в event loop"),
+            ("Хорошая погода сегодня. " * 10, False, "Длинное обычное сообщение"),
+            ("Длинное сообщение, в конце которого " * 5 + "идиот", True, "Длинное сообщение с оскорблением"),
+            ("п0дон0к " + "и ещё немного текста " * 5, True, "Leetspeak в длинном сообщении"),
+        ]
+        
+        results = await asyncio.gather(
+            *[offloader.contains_bad_words(matcher, text) for text, _, _ in test_messages]
+        )
+        long_text = test_messages[2][0]
+        rules = await offloader.find_rules(matcher, long_text)
+        await offloader.stop()
+        
+        passed = 0
+        failed = 0
+        
+        for (text, should_block, description), result in zip(test_messages, results):
+            if result == should_block:
+                print(f"[OK] '{text[:30]}...' - {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] '{text[:30]}...' - {description} (ожидалось: {should_block}, получено: {result})")
+                failed += 1
+        
+        if offloader.offloaded_checks == 3 and offloader.batches == 1:
+            print("[OK] Длинные сообщения проверены одной пачкой")
+            passed += 1
+        else:
+            print(f"[FAIL] Пачек: {offloader.batches}, сообщений в пуле: {offloader.offloaded_checks}")
+            failed += 1
+        
+        if rules and rules == MessageFilter().find_rules(long_text):
+            print("[OK] Правила длинного сообщения найдены в пуле")
+            passed += 1
+        else:
+            print(f"[FAIL] Правила длинного сообщения: {rules}")
+            failed += 1
+        
+        if TrackedFilter.threads <= {threading.get_ident()}:
+            print("[OK] Потоки пула проверяют своими копиями фильтра")
+            passed += 1
+        else:
+            print("[FAIL] Фильтр event loop использован из потока пула")
+            failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования проверки в пуле: {e}")
+        return False
+
+async def test_metrics():
+    """Тест метрик и сервера /metrics"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 13: Метрики")
+    print("=" * 60)
+    
+    try:
+        from aiohttp import ClientSession
+        from aiogram.methods import SendMessage
+        from bot.metrics import ApiMetricsMiddleware, MetricsRegistry, MetricsServer, api_errors, api_request_seconds
+        
+        registry = MetricsRegistry("test")
+        checks = registry.histogram("check_seconds", "Проверки", buckets=(0.01, 0.1))
+        hits = registry.counter("hits_total", "Срабатывания", ("rule",))
+        registry.gauge("pool", "Пул", lambda: {"used": 2, "free": 8}, labels=("state",))
+        
+        checks.observe(0.005)
+        checks.observe(0.05)
+        with checks.time():
+            pass
+        hits.inc("дурак")
+        hits.inc("дурак")
+        
+        # Ошибка запроса к Telegram API учитывается по методу и типу исключения
+        async def failing_request(bot, method):
+            raise RuntimeError("сеть недоступна")
+        
+        method = SendMessage(chat_id=1, text="test")
+        try:
+            await ApiMetricsMiddleware()(failing_request, None, method)
+        except RuntimeError:
+            pass
+        
+        server = MetricsServer(registry)
+        await server.start("127.0.0.1", 18091)
+        try:
+            async with ClientSession() as session:
+                async with session.get("http://127.0.0.1:18091/metrics") as response:
+                    body = await response.text()
+        finally:
+            await server.stop()
+        
+        expected = [
+            ('test_check_seconds_bucket{le="0.01"} 2', "Гистограмма: накопленные корзины"),
+            ('test_check_seconds_count 3', "Гистограмма: количество наблюдений"),
+            ('test_hits_total{rule="дурак"} 2', "Счётчик с меткой"),
+            ('test_pool{state="used"} 2', "Показатель из функции"),
+        ]
+        
+        passed = 0
+        failed = 0
+        
+        for line, description in expected:
+            if line in body.splitlines():
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}: нет строки {line}")
+                failed += 1
+        
+        if api_errors.get("sendMessage", "RuntimeError") == 1 and api_request_seconds.count("sendMessage") == 1:
+            print("[OK] Ошибка запроса к Telegram API учтена")
+            passed += 1
+        else:
+            print("[FAIL] Ошибка запроса к Telegram API не учтена")
+            failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования метрик: {e}")
+        return False
+
+async def test_sqlite_storage():
+    """Тест хранилища SQLite"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 14: Хранилище SQLite")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from datetime import datetime
+        from pathlib import Path
+        from bot.sqlite_storage import SQLiteDatabase
+        from bot.models import BotAction, ActionType
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "data" / "bot.db")
+            storage = SQLiteDatabase(path)
+            await storage.connect()
+            try:
+                actions = [
+                    BotAction(
+                        action_type=ActionType.MESSAGE_DELETED if i % 3 else ActionType.USER_MUTED,
+                        user_id=1000 + i,
+                        chat_id=-100,
+                        username=f"user{i}",
+                        message_text=f"сообщение {i}",
+                        reason="Тест",
+                    )
+                    for i in range(30)
+                ]
+                check(await storage.insert_actions(actions), "Пачка действий записана")
+                check(await storage.save_action(actions[0]), "Действие поставлено в очередь записи")
+                await storage.flush()
+                
+                counts = await storage.get_action_counts(-100)
+                check(
+                    counts == {ActionType.MESSAGE_DELETED: 20, ActionType.USER_MUTED: 11},
+                    f"Счётчики действий чата: {counts}"
+                )
+                
+                page = await storage.get_stats_page(-100, limit=10)
+                next_page = await storage.get_stats_page(-100, before_id=page[-1]["id"], limit=10)
+                check(
+                    len(page) == 10 and next_page[0]["id"] < page[-1]["id"]
+                    and isinstance(page[0]["created_at"], datetime),
+                    "Постраничная история действий"
+                )
+                
+                await storage.save_chat_policy(-100, {"action": "mute", "mute_seconds": 600})
+                await storage.save_chat_policy(-100, {"lexicons": "base"})
+                policy = await storage.get_chat_policy(-100)
+                check(
+                    policy["action"] == "mute" and policy["mute_seconds"] == 600 and policy["lexicons"] == "base",
+                    "Политика чата сохраняется и дополняется"
+                )
+                
+                now = datetime.now().replace(microsecond=0)
+                await storage.save_user_strikes([(-100, 1, 2, now)])
+                check(await storage.get_user_strikes(-100, 1) == (2, now), "Счётчик нарушений")
+                
+                # Действие из журнала с временем перед полуночью: день в счётчике
+                # при вставке совпадает с днём при пересчёте по истории
+                await storage.insert_actions([BotAction(
+                    action_type=ActionType.USER_WARNED, user_id=1, chat_id=-100,
+                    created_at=datetime(2026, 1, 1, 23, 59, 59),
+                )])
+                daily_sql = "SELECT chat_id, action_type, day, action_count FROM chat_action_daily ORDER BY 1, 2, 3"
+                daily = [tuple(row) for row in await storage._fetchall(daily_sql)]
+                check(await storage.rebuild_counters() == 3, "Пересчёт счётчиков по истории")
+                rebuilt = [tuple(row) for row in await storage._fetchall(daily_sql)]
+                check(
+                    daily == rebuilt and (-100, ActionType.USER_WARNED, "2026-01-01", 1) in daily,
+                    "Счётчики по дням совпадают с пересчитанными"
+                )
+            finally:
+                await storage.disconnect()
+            
+            check(Path(path).exists(), "Файл БД создан в новом каталоге")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования хранилища SQLite: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+async def test_spool():
+    """Тест локального журнала действий"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 15: Локальный журнал действий")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from pathlib import Path
+        from bot.sqlite_storage import SQLiteDatabase
+        from bot.models import BotAction, ActionType
+        
+        class FlakyDatabase(SQLiteDatabase):
+            """SQLite, запись в который можно сломать или замедлить"""
+            down = False
+            delay = 0.0
+            # Задержка ответа после фиксации транзакции
+            commit_delay = 0.0
+            
+            async def _insert_actions(self, actions):
+                await asyncio.sleep(self.delay)
+                if self.down:
+                    raise ConnectionError("БД недоступна")
+                await super()._insert_actions(actions)
+                await asyncio.sleep(self.commit_delay)
+        
+        def make_actions(count):
+            return [
+                BotAction(action_type=ActionType.MESSAGE_DELETED, user_id=i, chat_id=-100, reason="Тест")
+                for i in range(count)
+            ]
+        
+        passed = 0
+        failed = 0
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            spool_dir = str(Path(tmp) / "spool")
+            storage = FlakyDatabase(str(Path(tmp) / "bot.db"))
+            await storage.connect()
+            await storage.start_spool(spool_dir)
+            storage.spool.retry_interval = 60
+            
+            # БД недоступна: действия уходят в журнал, следующие пачки не ждут БД
+            storage.down = True
+            first = await storage.insert_actions(make_actions(10))
+            second = await storage.insert_actions(make_actions(5))
+            if first and second and storage.spool.pending == 15 and not storage.spool.healthy:
+                print("[OK] При сбое БД действия сохранены в журнал")
+                passed += 1
+            else:
+                print(f"[FAIL] Журнал при сбое БД: {first}, {second}, в журнале {storage.spool.pending}")
+                failed += 1
+            
+            # Перезапуск: журнал читается заново, неполная запись в конце пропускается
+            await storage.disconnect()
+            segment = sorted(Path(spool_dir).glob("*.spool"))[-1]
+            with open(segment, "ab") as file:
+                file.write(b"\x00\x00\x01")
+            
+            storage = FlakyDatabase(str(Path(tmp) / "bot.db"))
+            await storage.connect()
+            await storage.start_spool(spool_dir)
+            if storage.spool.pending == 15:
+                print("[OK] Журнал восстановлен после перезапуска")
+                passed += 1
+            else:
+                print(f"[FAIL] После перезапуска в журнале {storage.spool.pending} действий")
+                failed += 1
+            
+            replayed = await storage.spool.replay()
+            counts = await storage.get_action_counts(-100)
+            stats = await storage.get_stats(chat_id=-100, limit=1)
+            if (replayed == 15 and storage.spool.pending == 0
+                    and counts.get(ActionType.MESSAGE_DELETED) == 15
+                    and storage.spool.stats.corrupted == 1
+                    and not list(Path(spool_dir).glob("*.spool"))):
+                print(f"[OK] Журнал перенесён в БД ({stats[0]['created_at']:%H:%M:%S} - время действия)")
+                passed += 1
+            else:
+                print(f"[FAIL] Перенос журнала: {replayed}, счётчики {counts}")
+                failed += 1
+            
+            # Запись дольше допустимого переключает следующие пачки на журнал
+            storage.spool.latency_budget = 0.01
+            storage.delay = 0.05
+            await storage.insert_actions(make_actions(1))
+            await storage.insert_actions(make_actions(1))
+            if storage.spool.pending == 1 and storage.spool.stats.spooled == 1:
+                print("[OK] Медленная запись в БД переключает на журнал")
+                passed += 1
+            else:
+                print(f"[FAIL] Медленная запись: в журнале {storage.spool.pending}")
+                failed += 1
+            await storage.spool.replay()
+            
+            # Транзакция зафиксирована, но ответ пришёл после таймаута: пачка не дублируется
+            storage.delay = 0
+            storage.spool.write_timeout = 0.05
+            storage.commit_delay = 0.2
+            accepted = await storage.insert_actions(make_actions(7))
+            await storage.flush()
+            counts = await storage.get_action_counts(-100)
+            if (accepted and storage.spool.pending == 0 and not storage.spool.healthy
+                    and counts.get(ActionType.MESSAGE_DELETED) == 24):
+                print("[OK] Запись после таймаута не попадает в журнал повторно")
+                passed += 1
+            else:
+                print(f"[FAIL] Запись после таймаута: в журнале {storage.spool.pending}, счётчики {counts}")
+                failed += 1
+            
+            # Зависшая запись, завершившаяся ошибкой, сохраняется в журнал
+            storage.spool.mark_healthy()
+            storage.commit_delay = 0
+            storage.delay = 0.2
+            storage.down = True
+            accepted = await storage.insert_actions(make_actions(3))
+            await storage.flush()
+            if accepted and storage.spool.pending == 3:
+                print("[OK] Зависшая запись с ошибкой сохранена в журнал")
+                passed += 1
+            else:
+                print(f"[FAIL] Зависшая запись: в журнале {storage.spool.pending}")
+                failed += 1
+            storage.down = False
+            storage.delay = 0
+            
+            await storage.disconnect()
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования локального журнала: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+async def test_admin_cache():
+    """Тест кэша администраторов"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 16: Кэш администраторов")
+    print("=" * 60)
+    
+    try:
+        from types import SimpleNamespace
+        from bot.admins import AdminCache
+        
+        class FakeBot:
+            """Бот, загрузка администраторов которого занимает время"""
+            calls = 0
+            
+            async def get_chat_administrators(self, chat_id):
+                self.calls += 1
+                await asyncio.sleep(0.05)
+                return [SimpleNamespace(user=SimpleNamespace(id=1), status="creator")]
+        
+        passed = 0
+        failed = 0
+        bot = FakeBot()
+        cache = AdminCache(ttl=60, max_size=10)
+        
+        # Первый загрузчик отменён, пока второй ждёт его результата
+        first = asyncio.create_task(cache.is_admin(bot, -100, 1))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(cache.is_admin(bot, -100, 1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        try:
+            result = await asyncio.wait_for(second, timeout=1)
+        except asyncio.TimeoutError:
+            result = None
+        
+        if first.cancelled() and result is True and bot.calls == 2:
+            print("[OK] Отмена загрузки не оставляет ожидающих без ответа")
+            passed += 1
+        else:
+            print(f"[FAIL] Отмена загрузки: результат {result}, загрузок {bot.calls}")
+            failed += 1
+        
+        if await cache.is_admin(bot, -100, 2) is False and bot.calls == 2:
+            print("[OK] Повторный запрос берётся из кэша")
+            passed += 1
+        else:
+            print(f"[FAIL] Повторный запрос: загрузок {bot.calls}")
+            failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования кэша администраторов: {e}")
+        return False
+
+async def test_aho_corasick():
+    """Тест автомата Ахо–Корасик: результаты совпадают с перебором слов"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 17: Автомат Ахо–Корасик")
+    print("=" * 60)
+    
+    try:
+        import random
+        from bot.filters import MessageFilter, _word_variants, normalize_text
+        from bot.matching import AhoCorasick
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        # Маленький алфавит даёт много перекрывающихся слов и общих суффиксов
+        rng = random.Random(2024)
+        mismatches = 0
+        for _ in range(300):
+            words = {"".join(rng.choice("абв") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))}
+            automaton = AhoCorasick(words)
+            for _ in range(10):
+                text = "".join(rng.choice("абвг ") for _ in range(rng.randint(0, 30)))
+                expected = {word for word in words if word in text}
+                if automaton.find_all(text) != expected or automaton.search(text) != bool(expected):
+                    mismatches += 1
+        check(mismatches == 0, f"Совпадение с перебором на случайных словарях (расхождений: {mismatches})")
+        
+        labeled = AhoCorasick({"дур*к": "дурак", "дурак": "дурак", "": "пусто"})
+        check(
+            labeled.find_all("ну ты дур*к") == {"дурак"} and labeled.size == 3 and not labeled.search(""),
+            "Метки вариантов и пустые слова"
+        )
+        
+        # Фильтр: автомат по вариантам слов даёт тот же результат, что и цикл по словам
+        message_filter = MessageFilter(cache_size=0)
+        texts = [
+            "Ты дурак!", "и д и о т", "Привет, как дела?", "ничего не стоишь", "подонки",
+            "д*б*л", "сукин сын", "гадина", "на собрании", "Хорошая погода", "твою мать",
+        ]
+        loop_mismatches = []
+        for text in texts:
+            normalized = normalize_text(text)
+            expected = {
+                word for word in message_filter.bad_words
+                if any(variant in normalized for variant in _word_variants(word))
+            }
+            if message_filter._get_automaton().find_all(normalized) != expected:
+                loop_mismatches.append(text)
+        check(not loop_mismatches, f"Слова фильтра совпадают с проверкой в цикле (расхождения: {loop_mismatches})")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования автомата Ахо–Корасик: {e}")
+        return False
+
+async def test_pattern_set():
+    """Тест объединённого регулярного выражения: те же результаты, что у отдельных правил"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 18: Объединённые регулярные выражения")
+    print("=" * 60)
+    
+    try:
+        import re
+        from bot.filters import DEFAULT_PATTERNS
+        from bot.matching import PatternSet
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        patterns = [re.compile(pattern, re.IGNORECASE) for pattern in DEFAULT_PATTERNS] + [
+            re.compile(r"(ка)зино", re.IGNORECASE),     # своя группа - проверяется отдельно
+            re.compile(r"Промокод"),                     # другие флаги - проверяется отдельно
+            re.compile(r"(?i)ставки\s+на", re.IGNORECASE),  # глобальный inline-флаг
+        ]
+        pattern_set = PatternSet()
+        for pattern in patterns:
+            pattern_set.add(pattern)
+        
+        texts = [
+            "Привет, как дела?", "бл@дь", "Д*бил", "ИдИоТ", "т*пой", "с*ка", "х@",
+            "КАЗИНО онлайн", "промокод", "Промокод на скидку", "Ставки   на спорт",
+            "обычное сообщение про работу", "", "гoвно",
+        ]
+        verdict_mismatches = [
+            text for text in texts
+            if pattern_set.search(text) != any(pattern.search(text) for pattern in patterns)
+        ]
+        check(
+            not verdict_mismatches,
+            f"Результат search совпадает с отдельными правилами (расхождения: {verdict_mismatches})"
+        )
+        
+        rule_mismatches = []
+        for text in texts:
+            expected = {pattern.pattern for pattern in patterns if pattern.search(text)}
+            if {rule for rule, _ in pattern_set.finditer(text)} - expected:
+                rule_mismatches.append(text)
+        check(not rule_mismatches, f"finditer называет только сработавшие правила (расхождения: {rule_mismatches})")
+        
+        check(
+            pattern_set.size == len(patterns) and len(pattern_set._standalone) == 3,
+            "Правила с группами и другими флагами проверяются отдельно"
+        )
+        
+        # Новое правило дописывается к уже собранному выражению
+        pattern_set.search("прогрев")
+        pattern_set.add(re.compile(r"крипт[ао]", re.IGNORECASE))
+        check(pattern_set.search("Купи КРИПТА") and pattern_set.size == len(patterns) + 1, "Добавление правила после поиска")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования регулярных выражений: {e}")
+        return False
+
+async def test_normalization():
+    """Тест нормализации текста: обход фильтра и ложные срабатывания"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 19: Нормализация текста")
+    print("=" * 60)
+    
+    try:
+        from bot.filters import MessageFilter, normalize_text
+        
+        message_filter = MessageFilter(cache_size=0)
+        
+        # Текст, ожидаемый результат нормализации
+        test_normalized = [
+            ("ДУУУУРАК", "дурак"),
+            ("д.у.р.а.к", "дурак"),
+            ("cyкa", "сука"),
+            ("т\u200bварь", "тварь"),
+            ("козёл", "козел"),
+            ("с#ка", "с*ка"),
+            ("в с е г д а рад", "всегда рад"),
+        ]
+        
+        # Текст, ожидается срабатывание, описание
+        test_messages = [
+            ("Ty $вoлочь", True, "Латинские двойники и $"),
+            ("п0дон0к", True, "Leetspeak"),
+            ("м р а з ь", True, "Буквы через пробел"),
+            ("т\u200bварь", True, "Символ нулевой ширины"),
+            ("с#ка", True, "Буква закрыта маской"),
+            ("Встреча в 10:00, зал 300", False, "Цифры не склеиваются в слова"),
+            ("в с е г д а рад", False, "Склеенные буквы без запрещённых слов"),
+            ("И я тоже пойду", False, "Однобуквенные слова"),
+            ("Hello, how are you?", False, "Латинский текст"),
+            ("Сокол летит", False, "Обычное сообщение"),
+        ]
+        
+        passed = 0
+        failed = 0
+        
+        for text, expected in test_normalized:
+            result = normalize_text(text)
+            if result == expected:
+                print(f"[OK] {text!r} -> {result!r}")
+                passed += 1
+            else:
+                print(f"[FAIL] {text!r} -> {result!r} (ожидалось: {expected!r})")
+                failed += 1
+        
+        for text, should_detect, description in test_messages:
+            result = message_filter.contains_bad_words(text)
+            if result == should_detect:
+                print(f"[OK] {text!r} - {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {text!r} - {description} (ожидалось: {should_detect}, получено: {result})")
+                failed += 1
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования нормализации: {e}")
+        return False
+
+async def test_action_writer():
+    """Тест отложенной записи действий пачками"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 20: Отложенная запись действий")
+    print("=" * 60)
+    
+    try:
+        import time
+        from bot.models import BotAction, ActionType
+        from bot.storage import ActionWriter
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        class RecordingDatabase:
+            """БД, запоминающая размеры пачек."""
+            
+            def __init__(self, result=True, delay=0.0):
+                self.batches = []
+                self.result = result
+                self.delay = delay
+            
+            async def insert_actions(self, actions):
+                await asyncio.sleep(self.delay)
+                self.batches.append(len(actions))
+                return self.result
+        
+        def action(i):
+            return BotAction(action_type=ActionType.MESSAGE_DELETED, user_id=i, chat_id=-100)
+        
+        # Сброс по размеру пачки: срок ещё не наступил
+        database = RecordingDatabase()
+        writer = ActionWriter(database, batch_size=10, flush_interval=60, max_queue=100)
+        writer.start()
+        for i in range(25):
+            await writer.put(action(i))
+        await asyncio.sleep(0.05)
+        check(database.batches == [10, 10], f"Сброс по размеру пачки: {database.batches}")
+        
+        # Остаток сбрасывается при остановке, не дожидаясь срока
+        started = time.perf_counter()
+        await writer.stop()
+        check(
+            database.batches == [10, 10, 5] and writer.stats.written == 25
+            and time.perf_counter() - started < 1 and not writer.running,
+            "Остаток записан при остановке"
+        )
+        
+        # Сброс по сроку: неполная пачка ждёт не дольше flush_interval
+        database = RecordingDatabase()
+        writer = ActionWriter(database, batch_size=10, flush_interval=0.1, max_queue=100)
+        writer.start()
+        for i in range(3):
+            await writer.put(action(i))
+        await asyncio.sleep(0.05)
+        early = list(database.batches)
+        await asyncio.sleep(0.15)
+        check(early == [] and database.batches == [3], f"Сброс по сроку: {early} -> {database.batches}")
+        await writer.stop()
+        
+        # Ошибки записи и обратное давление при заполненной очереди
+        database = RecordingDatabase(result=False, delay=0.02)
+        writer = ActionWriter(database, batch_size=2, flush_interval=0.01, max_queue=2)
+        writer.start()
+        for i in range(8):
+            await writer.put(action(i))
+        await writer.stop()
+        check(
+            writer.stats.failed == 8 and writer.stats.written == 0 and writer.stats.producer_waits > 0,
+            f"Ошибки записи учтены, обработчики ждали места в очереди ({writer.stats.producer_waits} раз)"
+        )
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования отложенной записи: {e}")
+        return False
+
+async def test_counts_cache():
+    """Тест кэша статистики /stats: время жизни и обновление при записи"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 21: Кэш статистики")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from pathlib import Path
+        from bot.models import BotAction, ActionType
+        from bot.sqlite_storage import SQLiteDatabase
+        from bot.storage import ActionCountsCache
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        cache = ActionCountsCache(ttl=0.1, max_size=2)
+        cache.put(1, {"message_deleted": 3})
+        counts = cache.get(1)
+        counts["message_deleted"] = 100
+        check(cache.get(1) == {"message_deleted": 3}, "Кэш возвращает копию счётчиков")
+        
+        cache.increment(1, "message_deleted")
+        cache.increment(1, "user_muted", 2)
+        check(cache.get(1) == {"message_deleted": 4, "user_muted": 2}, "Запись действий увеличивает счётчики в кэше")
+        
+        await asyncio.sleep(0.15)
+        check(cache.get(1) is None, "Запись устаревает через ttl")
+        
+        # Действие, записанное во время запроса к БД, делает результат запроса ненадёжным
+        cache.begin_load(2)
+        cache.increment(2, "message_deleted")
+        cache.put(2, {"message_deleted": 1})
+        check(cache.get(2) is None, "Результат запроса с записью во время него не кэшируется")
+        
+        for chat_id in (3, 4, 5):
+            cache.put(chat_id, {})
+        check(cache.get(3) is None and cache.get(5) == {}, "Вытеснение LRU по max_size")
+        
+        # Хранилище: повторный /stats берётся из кэша и учитывает новые действия без запроса
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SQLiteDatabase(str(Path(tmp) / "bot.db"))
+            await storage.connect()
+            try:
+                action = BotAction(action_type=ActionType.USER_WARNED, user_id=1, chat_id=-100)
+                await storage.insert_actions([action, action])
+                first = await storage.get_action_counts(-100)
+                hits = storage.counts_cache.hits
+                await storage.insert_actions([action])
+                second = await storage.get_action_counts(-100)
+                check(
+                    first == {ActionType.USER_WARNED: 2} and second == {ActionType.USER_WARNED: 3}
+                    and storage.counts_cache.hits == hits + 1,
+                    f"Статистика чата из кэша после записи: {first} -> {second}"
+                )
+            finally:
+                await storage.disconnect()
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования кэша статистики: {e}")
+        return False
+
+async def test_action_counters():
+    """Тест счётчиков действий по чатам и по дням"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 22: Счётчики действий")
+    print("=" * 60)
+    
+    try:
+        import random
+        import tempfile
+        from datetime import datetime, timedelta
+        from pathlib import Path
+        from bot.models import BotAction, ActionType
+        from bot.sqlite_storage import SQLiteDatabase
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        async def snapshot(storage):
+            """Счётчики и их пересчёт по bot_actions."""
+            counters = await storage._fetchall(
+                "SELECT chat_id, action_type, action_count FROM chat_action_counters ORDER BY 1, 2"
+            )
+            grouped = await storage._fetchall(
+                "SELECT chat_id, action_type, COUNT(*) FROM bot_actions GROUP BY 1, 2 ORDER BY 1, 2"
+            )
+            daily = await storage._fetchall(
+                "SELECT chat_id, action_type, day, action_count FROM chat_action_daily ORDER BY 1, 2, 3"
+            )
+            grouped_daily = await storage._fetchall(
+                "SELECT chat_id, action_type, date(created_at), COUNT(*) FROM bot_actions "
+                "GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+            )
+            return (
+                [tuple(row) for row in counters], [tuple(row) for row in grouped],
+                [tuple(row) for row in daily], [tuple(row) for row in grouped_daily],
+            )
+        
+        rng = random.Random(6)
+        types = [ActionType.MESSAGE_DELETED, ActionType.USER_WARNED, ActionType.USER_MUTED]
+        base = datetime(2026, 3, 1, 23, 30)
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SQLiteDatabase(str(Path(tmp) / "bot.db"))
+            await storage.connect()
+            try:
+                for batch in range(5):
+                    actions = [
+                        BotAction(
+                            action_type=rng.choice(types),
+                            user_id=rng.randint(1, 5),
+                            chat_id=rng.choice([-100, -200, -300]),
+                            created_at=base + timedelta(minutes=rng.randint(0, 120)),
+                        )
+                        for _ in range(rng.randint(1, 40))
+                    ]
+                    await storage.insert_actions(actions)
+                
+                counters, grouped, daily, grouped_daily = await snapshot(storage)
+                check(counters == grouped, f"Счётчики по чатам совпадают с GROUP BY ({len(counters)} строк)")
+                check(daily == grouped_daily, f"Счётчики по дням совпадают с GROUP BY ({len(daily)} строк)")
+                check(len({row[2] for row in daily}) == 2, "Действия около полуночи разнесены по двум дням")
+                
+                total = sum(count for _, action_type, count in grouped if action_type == ActionType.USER_WARNED)
+                in_chat = sum(
+                    count for chat_id, action_type, count in grouped
+                    if chat_id == -200 and action_type == ActionType.USER_WARNED
+                )
+                check(
+                    await storage.get_action_count(ActionType.USER_WARNED) == total
+                    and await storage.get_action_count(ActionType.USER_WARNED, -200) == in_chat,
+                    f"get_action_count по счётчикам: всего {total}, в чате {in_chat}"
+                )
+                
+                # Ошибка в пачке откатывает и строки, и счётчики
+                broken = [
+                    BotAction(action_type=ActionType.USER_WARNED, user_id=1, chat_id=-100),
+                    BotAction(action_type=ActionType.USER_WARNED, user_id=None, chat_id=-100),
+                ]
+                check(not await storage.insert_actions(broken), "Пачка с ошибкой не записана")
+                check(await snapshot(storage) == (counters, grouped, daily, grouped_daily),
+                      "Счётчики не изменились после отката пачки")
+                
+                await storage.rebuild_counters()
+                check(await snapshot(storage) == (counters, grouped, daily, grouped_daily),
+                      "Пересчёт по истории даёт те же счётчики")
+            finally:
+                await storage.disconnect()
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования счётчиков действий: {e}")
+        return False
+
+async def test_stats_pages():
+    """Тест постраничной истории действий по ключу id"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 23: Постраничная история")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from pathlib import Path
+        from bot.models import BotAction, ActionType
+        from bot.sqlite_storage import SQLiteDatabase
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        async def walk(storage, chat_id, limit):
+            """Проходит всю историю чата страницами по before_id."""
+            pages = []
+            before_id = None
+            while True:
+                page = await storage.get_stats_page(chat_id, before_id=before_id, limit=limit)
+                pages.append(page)
+                if len(page) < limit:
+                    return pages
+                before_id = page[-1]["id"]
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SQLiteDatabase(str(Path(tmp) / "bot.db"))
+            await storage.connect()
+            try:
+                # Чаты чередуются, чтобы id одного чата шли с пропусками
+                actions = [
+                    BotAction(action_type=ActionType.MESSAGE_DELETED, user_id=i, chat_id=-100 if i % 3 else -200)
+                    for i in range(30)
+                ]
+                await storage.insert_actions(actions)
+                rows = await storage._fetchall("SELECT id FROM bot_actions WHERE chat_id = -100 ORDER BY id DESC")
+                expected = [row[0] for row in rows]
+                
+                for limit in (1, 5, 7, len(expected), len(expected) + 1):
+                    pages = await walk(storage, -100, limit)
+                    ids = [item["id"] for page in pages for item in page]
+                    check(ids == expected, f"limit={limit}: {len(pages)} стр., все id без пропусков и повторов")
+                
+                pages = await walk(storage, -100, 5)
+                check(len(expected) % 5 == 0 and pages[-1] == [],
+                      "При длине, кратной limit, последняя страница пустая")
+                check(all(item["chat_id"] == -100 for page in pages for item in page),
+                      "В страницах только записи своего чата")
+                check(await storage.get_stats_page(-100, before_id=expected[-1]) == [],
+                      "before_id, равный наименьшему id, даёт пустую страницу")
+                check([item["id"] for item in await storage.get_stats_page(-100, before_id=expected[0] + 1, limit=2)]
+                      == expected[:2], "before_id больше наибольшего id начинает с самой новой записи")
+                check(await storage.get_stats_page(-999) == [], "История пустого чата")
+            finally:
+                await storage.disconnect()
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования постраничной истории: {e}")
+        return False
+
+async def test_retention_dates():
+    """Тест имён секций и арифметики месяцев для хранения истории"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 24: Секции и месяцы хранения")
+    print("=" * 60)
+    
+    try:
+        from datetime import date
+        from bot.retention import (
+            MAX_PARTITION, add_months, month_start, partition_clause, partition_month, partition_name
+        )
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        check(month_start(date(2026, 10, 31)) == date(2026, 10, 1), "Первое число месяца")
+        
+        cases = [
+            (date(2026, 10, 1), 0, date(2026, 10, 1)),
+            (date(2026, 10, 1), 3, date(2027, 1, 1)),
+            (date(2026, 12, 1), 1, date(2027, 1, 1)),
+            (date(2026, 1, 1), -1, date(2025, 12, 1)),
+            (date(2026, 10, 1), -22, date(2024, 12, 1)),
+            (date(2026, 10, 1), 24, date(2028, 10, 1)),
+        ]
+        for day, months, expected in cases:
+            check(add_months(day, months) == expected, f"add_months({day}, {months}) = {expected}")
+        
+        # Сдвиг туда и обратно возвращает тот же месяц
+        check(all(add_months(add_months(date(2026, 1, 1), n), -n) == date(2026, 1, 1) for n in range(-30, 31)),
+              "add_months обратим для сдвигов от -30 до 30")
+        
+        months = [add_months(date(2025, 11, 1), n) for n in range(4)]
+        names = [partition_name(month) for month in months]
+        check(names == ["p202511", "p202512", "p202601", "p202602"], f"Имена секций: {names}")
+        check([partition_month(name) for name in names] == months, "Месяц секции восстанавливается по имени")
+        
+        invalid = [MAX_PARTITION, "p2026", "p2026100", "x202610", "p20261a", "p202600", "p202613"]
+        check(all(partition_month(name) is None for name in invalid), f"Служебные и неверные имена: {invalid}")
+        
+        check(
+            partition_clause(date(2026, 12, 1))
+            == "PARTITION p202612 VALUES LESS THAN (UNIX_TIMESTAMP('2027-01-01 00:00:00'))",
+            "Граница декабрьской секции - 1 января следующего года"
+        )
+        
+        # Граница хранения: секции раньше cutoff удаляются, месяц cutoff остаётся
+        cutoff = add_months(month_start(date(2026, 3, 15)), -3)
+        kept = [name for name in ["p202511", "p202512", "p202601", MAX_PARTITION]
+                if partition_month(name) is None or partition_month(name) >= cutoff]
+        check(cutoff == date(2025, 12, 1) and kept == ["p202512", "p202601", MAX_PARTITION],
+              f"Хранение 3 мес. в марте: остаются {kept}")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования секций хранения: {e}")
+        return False
+
+async def test_outbound():
+    """Тест ограничения частоты запросов и пакетного удаления сообщений"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 25: Исходящие запросы")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        import time
+        from pathlib import Path
+        from types import SimpleNamespace
+        from aiogram.exceptions import TelegramRetryAfter
+        from aiogram.methods import DeleteMessages, GetMe
+        import bot.outbound as outbound
+        from bot.models import BotAction, ActionType
+        from bot.outbound import DELETE_MESSAGES_LIMIT, ModerationQueue, RateLimitMiddleware, TokenBucket
+        from bot.sqlite_storage import SQLiteDatabase
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        # Запас capacity выдаётся сразу, дальше - по 1/rate секунды на запрос
+        bucket = TokenBucket(rate=10, capacity=3)
+        waits = [bucket.reserve() for _ in range(5)]
+        check(waits[:3] == [0.0, 0.0, 0.0] and abs(waits[3] - 0.1) < 0.01 and abs(waits[4] - 0.2) < 0.01,
+              f"Ожидание по очереди: {[round(w, 2) for w in waits]}")
+        
+        # Через секунду запас восстанавливается, но не выше capacity
+        bucket.updated -= 1.0
+        check(bucket.reserve() == 0.0 and abs(bucket.tokens - 2) < 0.01, "Пополнение ограничено capacity")
+        
+        bucket.pause(0.5)
+        check(bucket.reserve() >= 0.49 and not bucket.idle, "Пауза после 429 задерживает запросы")
+        check(TokenBucket(rate=1, capacity=1).idle, "Новый ограничитель свободен")
+        
+        # Middleware: запросы в чат идут не чаще chat_rate, запросы без чата не ограничиваются
+        calls = []
+        
+        async def make_request(bot, method):
+            calls.append(time.monotonic())
+            return True
+        
+        limiter = RateLimitMiddleware(global_rate=1000, chat_rate=20, chat_burst=1, max_retries=1)
+        started = time.monotonic()
+        for _ in range(5):
+            await limiter(make_request, None, DeleteMessages(chat_id=-100, message_ids=[1]))
+        elapsed = time.monotonic() - started
+        check(limiter.throttled == 4 and 0.18 <= elapsed < 0.5,
+              f"5 запросов в чат при 20/с: {elapsed:.2f} с, задержано {limiter.throttled}")
+        
+        for _ in range(5):
+            await limiter(make_request, None, GetMe())
+        check(limiter.throttled == 4, "Запросы без chat_id не ограничиваются")
+        
+        attempts = 0
+        
+        async def flood_request(bot, method):
+            nonlocal attempts
+            attempts += 1
+            raise TelegramRetryAfter(method, "Too Many Requests", 0)
+        
+        try:
+            await limiter(flood_request, None, DeleteMessages(chat_id=-200, message_ids=[1]))
+            raised = False
+        except TelegramRetryAfter:
+            raised = True
+        check(raised and attempts == 2 and limiter.retries == 1, "После max_retries повторов ошибка 429 пробрасывается")
+        
+        # Очередь удаления: пачки не больше DELETE_MESSAGES_LIMIT, одно уведомление на окно
+        class FakeBot:
+            """Бот, запоминающий вызовы deleteMessages и sendMessage"""
+            
+            def __init__(self):
+                self.batches = []
+                self.notices = []
+            
+            async def delete_messages(self, chat_id, message_ids):
+                self.batches.append((chat_id, list(message_ids)))
+                return True
+            
+            async def send_message(self, chat_id, text):
+                self.notices.append((chat_id, text))
+        
+        fake_bot = FakeBot()
+        
+        def message(chat_id, message_id):
+            return SimpleNamespace(
+                bot=fake_bot,
+                chat=SimpleNamespace(id=chat_id),
+                message_id=message_id,
+                from_user=SimpleNamespace(id=message_id % 7, first_name="Test"),
+            )
+        
+        saved_db = outbound.db
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = SQLiteDatabase(str(Path(tmp) / "bot.db"))
+            await storage.connect()
+            outbound.db = storage
+            try:
+                queue = ModerationQueue(delete_delay=0.05, notice_window=0.1)
+                total = 2 * DELETE_MESSAGES_LIMIT + 50
+                for message_id in range(total):
+                    queue.remove(
+                        message(-100, message_id),
+                        BotAction(action_type=ActionType.MESSAGE_DELETED, user_id=message_id % 7, chat_id=-100)
+                    )
+                queue.remove(
+                    message(-300, 1),
+                    BotAction(action_type=ActionType.MESSAGE_DELETED, user_id=1, chat_id=-300)
+                )
+                await asyncio.sleep(0.3)
+                
+                sizes = sorted(len(ids) for chat_id, ids in fake_bot.batches if chat_id == -100)
+                deleted = sorted(i for chat_id, ids in fake_bot.batches if chat_id == -100 for i in ids)
+                check(sizes == [50, DELETE_MESSAGES_LIMIT, DELETE_MESSAGES_LIMIT], f"Пачки deleteMessages: {sizes}")
+                check(deleted == list(range(total)), "Каждое сообщение удалено ровно один раз")
+                check(
+                    fake_bot.notices.count((-100, f"⚠️ Удалено сообщений за нарушение правил чата: {total}.")) == 1,
+                    "Одно общее уведомление за окно"
+                )
+                check(any(chat_id == -300 and "ваше сообщение" in text for chat_id, text in fake_bot.notices),
+                      "Одно удаление - личное предупреждение")
+                await storage.flush()
+                counts = await storage.get_action_counts(-100)
+                check(counts == {ActionType.MESSAGE_DELETED: total} and not queue._chats,
+                      "Действия сохранены, состояние чатов освобождено")
+            finally:
+                outbound.db = saved_db
+                await storage.disconnect()
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования исходящих запросов: {e}")
+        return False
+
+async def test_verdict_cache():
+    """Тест кэша результатов проверки при изменении правил"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 26: Кэш результатов проверки")
+    print("=" * 60)
+    
+    try:
+        from bot.filters import MessageFilter
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        message_filter = MessageFilter(cache_size=3, words=["спам"], patterns=[])
+        first = message_filter.contains_bad_words("купи спам")
+        second = message_filter.contains_bad_words("купи спам")
+        check(first and second and (message_filter.cache_hits, message_filter.cache_misses) == (1, 1),
+              "Повторный текст берётся из кэша")
+        
+        message_filter.contains_bad_words("КУПИ СПАМ")
+        check(message_filter.cache_misses == 2, "Тексты, различающиеся регистром, кэшируются отдельно")
+        
+        message_filter.remove_word("спам")
+        check(not message_filter.contains_bad_words("купи спам"), "remove_word сбрасывает кэш")
+        
+        check(not message_filter.contains_bad_words("привет всем"), "Текст без нарушений")
+        message_filter.add_word("привет")
+        check(message_filter.contains_bad_words("привет всем"), "add_word сбрасывает кэш")
+        
+        message_filter.add_pattern(r"всем\s+привет")
+        check(message_filter.contains_bad_words("всем  привет"), "add_pattern сбрасывает кэш")
+        
+        # Изменение списков в обход add_* тоже сбрасывает кэш
+        check(not message_filter.contains_bad_words("пока"), "Текст без нарушений до прямого изменения")
+        message_filter.bad_words.add("пока")
+        check(message_filter.contains_bad_words("пока"), "Прямое изменение bad_words сбрасывает кэш")
+        
+        for text in ("один", "два", "три", "четыре"):
+            message_filter.contains_bad_words(text)
+        misses = message_filter.cache_misses
+        message_filter.contains_bad_words("два")
+        message_filter.contains_bad_words("один")
+        check(message_filter.cache_misses == misses + 1 and len(message_filter._verdicts) == 3,
+              "Вытеснение LRU по cache_size")
+        
+        uncached = MessageFilter(cache_size=0, words=["спам"], patterns=[])
+        results = [uncached.contains_bad_words("спам") for _ in range(3)]
+        check(all(results) and uncached.cache_hits == 0 and not uncached._verdicts, "cache_size=0 отключает кэш")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования кэша результатов: {e}")
+        return False
+
+async def test_batch_scan():
+    """Тест пакетной проверки выгрузок сообщений"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 27: Пакетная проверка выгрузок")
+    print("=" * 60)
+    
+    try:
+        import gzip
+        import json
+        import subprocess
+        import tempfile
+        from pathlib import Path
+        from bot.filters import MessageFilter
+        from bot.scan import RuleSet, read_messages, scan
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        texts = ["Привет всем", "ты дурак", "купи криптовалюту", "новинка сезона", "обычный день"] * 40
+        with tempfile.TemporaryDirectory() as tmp:
+            dump = Path(tmp) / "dump.jsonl.gz"
+            with gzip.open(dump, "wt", encoding="utf-8") as f:
+                for index, text in enumerate(texts):
+                    record = {"text": text} if index % 2 else {"message_text": text}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.write("не json\n\n")
+                f.write(json.dumps({"text": None}) + "\n")
+            words = Path(tmp) / "words.txt"
+            words.write_text("# новые слова\nновинка\n", encoding="utf-8")
+            
+            messages = list(read_messages([str(dump)], "auto", None))
+            check([text for _, text in messages] == texts, "Чтение .jsonl.gz: поля text и message_text, мусор пропущен")
+            
+            candidate = RuleSet(word_files=[str(words)])
+            single = list(scan(messages, candidate, RuleSet(), workers=1, chunk_size=7))
+            pooled = list(scan(messages, candidate, RuleSet(), workers=2, chunk_size=7))
+            check(single == pooled, f"Результаты в пуле процессов совпадают ({len(pooled)} пачек)")
+            
+            reference = MessageFilter()
+            reference.add_word("новинка")
+            expected = sum(reference.contains_bad_words(text) for text in texts)
+            blocked = sum(result.blocked for result in single)
+            check(blocked == expected, f"Заблокировано {blocked} сообщений, как при проверке по одному")
+            
+            changes = [change for result in single for change in result.changes]
+            check(len(changes) == 40 and all(c["text"] == "новинка сезона" and c["after"] for c in changes),
+                  "Изменения относительно базового набора - только новое слово")
+            check(changes[0]["source"] == f"{dump}:4", f"Источник изменения: {changes[0]['source']}")
+            
+            # Запуск из командной строки без .env
+            run = subprocess.run(
+                [sys.executable, "-m", "bot.scan", str(dump), "--words", str(words),
+                 "--compare", "--workers", "1", "--json"],
+                capture_output=True, text=True, env={"PATH": os.environ.get("PATH", "")},
+                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=120,
+            )
+            report = json.loads(run.stdout) if run.returncode == 0 else {}
+            check(
+                report.get("messages") == len(texts) and report.get("blocked") == expected
+                and report.get("newly_blocked") == 40,
+                f"python -m bot.scan: код {run.returncode}, отчёт {report.get('blocked')} из {report.get('messages')}"
+            )
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования пакетной проверки: {e}")
+        return False
+
+async def test_lexicon_reload():
+    """Тест перезагрузки словарей с подменой фильтров"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 28: Перезагрузка словарей")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from pathlib import Path
+        from bot.lexicons import LexiconStore
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "words.txt").write_text("бананчик\n", encoding="utf-8")
+            Path(directory, "chat_7.txt").write_text("апельсинчик\n", encoding="utf-8")
+            store = LexiconStore(directory, cache_dir=None, default_set="words", reload_interval=0)
+            
+            check(await store.reload() == 2 and store.generation == 1, "Первая загрузка: два набора")
+            check(await store.reload() == 0 and store.generation == 1, "Без изменений файлов наборы не пересобираются")
+            
+            old_chat = store.get_filter(7)
+            old_default = store.get_filter(1)
+            Path(directory, "chat_7.txt").write_text("мандаринчик\nлимончик\n", encoding="utf-8")
+            
+            # До завершения компиляции в потоке проверки используют старые фильтры
+            reload = asyncio.create_task(store.reload())
+            await asyncio.sleep(0)
+            check(store.get_filter(7) is old_chat, "Во время перезагрузки действует старый фильтр")
+            changed = await reload
+            
+            new_chat = store.get_filter(7)
+            check(changed == 1 and store.generation == 2, "Изменённый набор перезагружен")
+            check(new_chat is not old_chat and store.get_filter(1) is old_default,
+                  "Заменён только фильтр изменённого набора")
+            check(new_chat.contains_bad_words("мандаринчик") and not new_chat.contains_bad_words("апельсинчик"),
+                  "Новый фильтр - новые правила")
+            check(old_chat.contains_bad_words("апельсинчик") and not old_chat.contains_bad_words("мандаринчик"),
+                  "Ссылка на старый фильтр продолжает работать со старыми правилами")
+            
+            # Изменение набора по умолчанию пересобирает все наборы
+            Path(directory, "words.txt").write_text("бананчик\nкиви\n", encoding="utf-8")
+            check(await store.reload() == 2 and store.get_filter(7).contains_bad_words("киви"),
+                  "Новые базовые правила попадают в наборы чатов")
+            
+            Path(directory, "chat_7.txt").unlink()
+            check(await store.reload() == 1 and store.get_filter(7) is store.get_filter(1)
+                  and store.sets == ["words"], "Удалённый набор чата заменяется набором по умолчанию")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования перезагрузки словарей: {e}")
+        return False
+
+async def test_benchmark_messages():
+    """Тест генератора сообщений и сводок бенчмарка конвейера"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 29: Данные бенчмарков")
+    print("=" * 60)
+    
+    try:
+        from collections import Counter
+        from benchmarks.bench_pipeline import percentile, summarize
+        from benchmarks.messages import CATEGORY_WEIGHTS, generate
+        from bot.filters import MessageFilter
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        messages = generate(5000, seed=7)
+        check(messages == generate(5000, seed=7), "Одинаковый seed - одинаковая выборка")
+        check(messages != generate(5000, seed=8), "Другой seed - другая выборка")
+        
+        shares = Counter(category for category, _ in messages)
+        check(
+            all(abs(shares[category] / len(messages) - weight) < 0.03 for category, weight in CATEGORY_WEIGHTS.items()),
+            f"Доли категорий соответствуют CATEGORY_WEIGHTS: {dict(shares)}"
+        )
+        
+        message_filter = MessageFilter(cache_size=0)
+        blocked = Counter(category for category, text in messages if message_filter.contains_bad_words(text))
+        check(blocked["clean"] == 0, "Обычные сообщения не блокируются")
+        check(blocked["profanity"] > 0 and blocked["obfuscated"] > 0 and blocked["long"] > 0,
+              f"Сообщения с оскорблениями блокируются: {dict(blocked)}")
+        
+        values = [float(value) for value in range(1, 101)]
+        check(percentile(values, 0.5) == 50 and percentile(values, 0.99) == 99 and percentile([], 0.5) == 0.0,
+              "Процентили по ближайшему рангу")
+        summary = summarize([0.002, 0.001, 0.003, 0.004], scale=1e3)
+        check(summary == {"count": 4, "throughput": 400.0, "p50": 2.0, "p99": 4.0, "max": 4.0},
+              f"Сводка длительностей в миллисекундах: {summary}")
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования данных бенчмарков: {e}")
+        return False
+
+async def test_policy_loading_cancel():
+    """Тест отмены загрузки политики и сборки фильтра при ожидающих вызовах"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ 30: Отмена загрузки политик")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from pathlib import Path
+        import bot.policies as policies
+        from bot.lexicons import LexiconStore
+        from bot.policies import MatcherPool, PolicyStore
+        
+        passed = 0
+        failed = 0
+        
+        def check(condition, description):
+            nonlocal passed, failed
+            if condition:
+                print(f"[OK] {description}")
+                passed += 1
+            else:
+                print(f"[FAIL] {description}")
+                failed += 1
+        
+        async def cancel_first(make_call):
+            """Отменяет первый вызов, пока второй ждёт его загрузки; возвращает результат второго."""
+            first = asyncio.create_task(make_call())
+            await asyncio.sleep(0.01)
+            second = asyncio.create_task(make_call())
+            await asyncio.sleep(0.01)
+            first.cancel()
+            try:
+                return first, await asyncio.wait_for(second, timeout=1)
+            except asyncio.TimeoutError:
+                return first, None
+        
+        class SlowPool(MatcherPool):
+            """Пул, сборка фильтра в котором занимает время"""
+            builds = 0
+            
+            async def _build(self, names):
+                self.builds += 1
+                await asyncio.sleep(0.05)
+                return await super()._build(names)
+        
+        class SlowDatabase:
+            """БД, загрузка политики из которой занимает время"""
+            calls = 0
+            
+            async def get_chat_policy(self, chat_id):
+                self.calls += 1
+                await asyncio.sleep(0.05)
+                return {"lexicons": "spam", "action": None, "mute_seconds": 600}
+        
+        with tempfile.TemporaryDirectory() as directory:
+            Path(directory, "words.txt").write_text("бананчик\n", encoding="utf-8")
+            Path(directory, "spam.txt").write_text("re:казино\\s*онлайн\n", encoding="utf-8")
+            store = LexiconStore(directory, cache_dir=None, default_set="words", reload_interval=0)
+            await store.reload()
+            
+            pool = SlowPool(store, max_size=10)
+            first, matcher = await cancel_first(lambda: pool.get(("spam", "words")))
+            check(first.cancelled() and matcher is not None and pool.builds == 2,
+                  f"Отмена сборки фильтра не оставляет ожидающих без ответа (сборок {pool.builds})")
+            check(matcher is not None and matcher.contains_bad_words("казино онлайн"), "Фильтр собран повторно")
+            check(await pool.get(("spam", "words")) is matcher and pool.builds == 2, "Повторный запрос берётся из LRU")
+        
+        saved_db = policies.db
+        slow_db = SlowDatabase()
+        policies.db = slow_db
+        try:
+            policy_store = PolicyStore(pool, ttl=60, max_size=10)
+            first, policy = await cancel_first(lambda: policy_store.get_policy(-100))
+            check(first.cancelled() and policy is not None and policy.mute_seconds == 600 and slow_db.calls == 2,
+                  f"Отмена загрузки политики не оставляет ожидающих без ответа (загрузок {slow_db.calls})")
+            check(await policy_store.get_policy(-100) is policy and slow_db.calls == 2, "Повторный запрос берётся из кэша")
+        finally:
+            policies.db = saved_db
+        
+        print(f"\nРезультат: {passed} прошло, {failed} провалено")
+        return failed == 0
+    except Exception as e:
+        print(f"[ERROR] Ошибка тестирования отмены загрузки политик: {e}")
+        return False
+
 async def main():
     """Главная функция тестирования"""
     print("\n" + "=" * 60)
@@ -210,6 +2268,31 @@ async def main():
         ("Подключение к БД", test_database),
         ("Операции с БД", test_database_operations),
         ("Логирование", test_logger),
+        ("Webhook", test_webhook),
+        ("Планировщик обновлений", test_scheduler),
+        ("Защита от флуда", test_antiflood),
+        ("Повторяющиеся сообщения", test_duplicates),
+        ("Словари и политики чатов", test_policies),
+        ("Эскалация наказаний", test_escalation),
+        ("Проверка вне event loop", test_offload),
+        ("Метрики", test_metrics),
+        ("Хранилище SQLite", test_sqlite_storage),
+        ("Локальный журнал действий", test_spool),
+        ("Кэш администраторов", test_admin_cache),
+        ("Автомат Ахо–Корасик", test_aho_corasick),
+        ("Объединённые регулярные выражения", test_pattern_set),
+        ("Нормализация текста", test_normalization),
+        ("Отложенная запись действий", test_action_writer),
+        ("Кэш статистики", test_counts_cache),
+        ("Счётчики действий", test_action_counters),
+        ("Постраничная история", test_stats_pages),
+        ("Секции и месяцы хранения", test_retention_dates),
+        ("Исходящие запросы", test_outbound),
+        ("Кэш результатов проверки", test_verdict_cache),
+        ("Пакетная проверка выгрузок", test_batch_scan),
+        ("Перезагрузка словарей", test_lexicon_reload),
+        ("Данные бенчмарков", test_benchmark_messages),
+        ("Отмена загрузки политик", test_policy_loading_cancel),
     ]
     
     results = []